@@ -0,0 +1,95 @@
+"""Benchmark locking a large synthetic assignment file.
+
+Run with `python benchmarks/bench_lock.py [--functions N] [--repeat R] [--compare-with REF]`.
+With --compare-with, the lock_tests module of a git revision (e.g. a commit
+before an optimization) is timed on the same file, alongside the current one.
+"""
+
+import argparse
+import importlib.util
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from pytest_grader import lock_tests
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def synthetic_source(functions: int, locked_every: int = 10) -> str:
+    """A module with many functions, every locked_every-th of them locked,
+    each with a decorator and a docstring with doctests."""
+    parts = ['import functools\n']
+    for i in range(functions):
+        marker = '# LOCK\n' if i % locked_every == 0 else ''
+        parts.append(f'''
+{marker}@functools.lru_cache
+def f{i}(x):
+    """Return x plus {i}.
+
+    >>> f{i}(1)
+    {i + 1}
+    >>> [f{i}(y) for y in range(3)]
+    [{i}, {i + 1}, {i + 2}]
+    """
+    total = x
+    for _ in range(3):
+        total = total + 0
+    return total + {i}
+''')
+    return ''.join(parts)
+
+
+def load_revision(ref: str, tmp: Path):
+    """The lock_tests module as of a git revision, which is copied to tmp."""
+    source = subprocess.run(['git', 'show', f'{ref}:pytest_grader/lock_tests.py'], cwd=REPO,
+                            check=True, capture_output=True, text=True).stdout
+    path = tmp / 'lock_tests_revision.py'
+    path.write_text(source)
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module  # Needed by its dataclasses
+    spec.loader.exec_module(module)
+    return module
+
+
+def best_time(module, src: Path, dst: Path, repeat: int) -> tuple[float, int]:
+    """The shortest time, in seconds, of repeat runs of a module's
+    lock_doctests_for_file, and the number of outputs it locked."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = module.lock_doctests_for_file(src, dst)
+        times.append(time.perf_counter() - start)
+    return min(times), outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--functions', type=int, default=5000, help='Number of functions in the file')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs (the best is reported)')
+    parser.add_argument('--compare-with', metavar='REF',
+                        help='Also time lock_tests.py as of this git revision, e.g. HEAD~3')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        src = tmp / 'src.py'
+        src.write_text(synthetic_source(args.functions))
+        modules = {'current': lock_tests}
+        if args.compare_with:
+            modules[args.compare_with] = load_revision(args.compare_with, tmp)
+        results = {name: best_time(module, src, tmp / 'dst.py', args.repeat)
+                   for name, module in modules.items()}
+    for name, (seconds, outputs) in results.items():
+        print(f'lock_doctests_for_file ({name}): {args.functions} functions, {outputs} outputs locked, '
+              f'best of {args.repeat}: {seconds * 1000:.1f} ms')
+    if args.compare_with:
+        speedup = results[args.compare_with][0] / results['current'][0]
+        print(f'current is {speedup:.1f}x as fast as {args.compare_with}')
+
+
+if __name__ == '__main__':
+    main()
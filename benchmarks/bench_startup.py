@@ -0,0 +1,56 @@
+"""Benchmark the time pytest takes to start with the pytest-grader plugin.
+
+Run with `python benchmarks/bench_startup.py [--repeat R]`.
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+TEST_FILE = '''
+def test_one():
+    assert 1 + 1 == 2
+'''
+
+
+def best_time(command: list[str], cwd: str, repeat: int) -> float:
+    """The shortest wall time, in seconds, of repeat runs of a command."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(command, cwd=cwd, stdout=subprocess.DEVNULL)
+        if result.returncode not in (0, 5):  # 5: no tests were selected
+            raise subprocess.CalledProcessError(result.returncode, command)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10, help='Number of timed runs (the best is reported)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        Path(tmp, 'test_one.py').write_text(TEST_FILE)
+        Path(tmp, 'grader.yaml').write_text('included_files:\n  - test_one.py\n')
+        pytest = [sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider']
+        commands = {
+            'import pytest': [sys.executable, '-c', 'import pytest'],
+            'import pytest_grader': [sys.executable, '-c', 'import pytest_grader'],
+            'pytest --help': pytest + ['-p', 'pytest_grader', '--help'],
+            'pytest (no plugin)': pytest + ['test_one.py'],
+            'pytest (plugin)': pytest + ['-p', 'pytest_grader', 'test_one.py'],
+            # No test runs, so the grader database is not written.
+            'pytest -k (plugin, no tests)': pytest + ['-p', 'pytest_grader', '-k', 'nothing', 'test_one.py'],
+        }
+        # The first run with the plugin creates the grader database.
+        subprocess.run(commands['pytest (plugin)'], cwd=tmp, check=True, stdout=subprocess.DEVNULL)
+        for name, command in commands.items():
+            print(f'{name}: best of {args.repeat}: {best_time(command, tmp, args.repeat) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
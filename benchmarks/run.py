@@ -0,0 +1,261 @@
+"""Run the benchmark suite, and compare the results with a saved baseline.
+
+Run with `python benchmarks/run.py [NAME ...] [--save FILE] [--compare FILE]`.
+Each benchmark reports the best of --repeat runs, in seconds. With --compare,
+the command exits with status 1 if any benchmark is slower than the baseline
+by more than --tolerance (a fraction of the baseline time).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from bench_lock import synthetic_source
+from pytest_grader.lock_tests import lock_doctests_for_file, locked_hash
+from pytest_grader.logger import SQLLogger
+from pytest_grader.plugins import UnlockPlugin
+
+BASELINE = Path(__file__).parent / 'baseline.json'
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    """Add a benchmark, which is called with a temporary directory, the number
+    of runs, and a scale for its sizes, and returns its best time in seconds."""
+    BENCHMARKS[func.__name__.removeprefix('bench_')] = func
+    return func
+
+
+def best_of(repeat: int, run, setup=None) -> float:
+    """The shortest time, in seconds, of repeat calls to run, each after setup."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def sized(n: int, scale: float) -> int:
+    return max(1, round(n * scale))
+
+
+@benchmark
+def bench_import_plugin(tmp: Path, repeat: int, scale: float) -> float:
+    """Import pytest_grader in a fresh interpreter that has already imported pytest."""
+    code = ('import time, pytest; start = time.perf_counter(); import pytest_grader; '
+            'print(time.perf_counter() - start)')
+    return min(float(subprocess.run([sys.executable, '-c', code], check=True, capture_output=True,
+                                    text=True).stdout) for _ in range(repeat))
+
+
+@benchmark
+def bench_run_one_test(tmp: Path, repeat: int, scale: float) -> float:
+    """Run pytest with the plugin in-process on one trivial test, which configures
+    the plugin, snapshots the included files, and logs the test."""
+    test_file = tmp / 'test_one.py'
+    test_file.write_text('def test_one():\n    assert True\n')
+    assignment = tmp / 'grader.yaml'
+    assignment.write_text(f'included_files:\n  - {test_file}\n')
+    args = ['-q', '-p', 'pytest_grader', '-p', 'no:cacheprovider', '--rootdir', str(tmp),
+            '--assignment', str(assignment), '--grader-db', str(tmp / 'grader.sqlite'), str(test_file)]
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert pytest.main(list(args)) == pytest.ExitCode.OK
+    return best_of(repeat, run)
+
+
+def write_files(tmp: Path, files: int, kilobytes: int) -> list[str]:
+    """Write Python files of about the given size, and return their paths."""
+    paths = []
+    for i in range(files):
+        path = tmp / f'module{i}.py'
+        lines = [f'def f{i}_{j}(x):\n    return x + {j}\n' for j in range(kilobytes * 1024 // 28)]
+        path.write_text(''.join(lines))
+        paths.append(str(path))
+    return paths
+
+
+@benchmark
+def bench_snapshot_new(tmp: Path, repeat: int, scale: float) -> float:
+    """Snapshot 100 files of 20 KB into a new database."""
+    conf = {'included_files': write_files(tmp, sized(100, scale), 20)}
+    dbs = iter(range(repeat))
+
+    def run():
+        logger = SQLLogger(str(tmp / f'new{next(dbs)}.sqlite'), conf)
+        logger.snapshot()
+        logger.close()
+    return best_of(repeat, run)
+
+
+@benchmark
+def bench_snapshot_unchanged(tmp: Path, repeat: int, scale: float) -> float:
+    """Snapshot 100 files of 20 KB that have not changed since the last snapshot."""
+    conf = {'included_files': write_files(tmp, sized(100, scale), 20)}
+    logger = SQLLogger(str(tmp / 'grader.sqlite'), conf)
+    logger.snapshot()
+    # Files just written are too recent to skip hashing, as their mtime could be stale.
+    past = time.time() - 60
+    for filename in conf['included_files']:
+        os.utime(filename, (past, past))
+    logger.snapshot()
+    result = best_of(repeat, logger.snapshot)
+    logger.close()
+    return result
+
+
+@benchmark
+def bench_log_test_cases(tmp: Path, repeat: int, scale: float) -> float:
+    """Log 1000 test cases, committing each one."""
+    logger = SQLLogger(str(tmp / 'grader.sqlite'), {})
+    logger.snapshot()
+
+    def run():
+        for i in range(sized(1000, scale)):
+            logger.test_case(f'test_{i}', i % 2 == 0, None, 0.01)
+    result = best_of(repeat, run)
+    logger.close()
+    return result
+
+
+@benchmark
+def bench_log_test_cases_batched(tmp: Path, repeat: int, scale: float) -> float:
+    """Log 10000 test cases in batches of 500."""
+    logger = SQLLogger(str(tmp / 'grader.sqlite'), {'log_batch_size': 500})
+    logger.snapshot()
+
+    def run():
+        for i in range(sized(10000, scale)):
+            logger.test_case(f'test_{i}', i % 2 == 0, None, 0.01)
+        logger.flush()
+    result = best_of(repeat, run)
+    logger.close()
+    return result
+
+
+@benchmark
+def bench_lock_file(tmp: Path, repeat: int, scale: float) -> float:
+    """Lock a file of 5000 functions, every tenth of them locked."""
+    src = tmp / 'src.py'
+    src.write_text(synthetic_source(sized(5000, scale)))
+    return best_of(repeat, lambda: lock_doctests_for_file(src, tmp / 'dst.py'))
+
+
+class ItemCollector:
+    """Keep the test items that pytest collects."""
+
+    def pytest_collection_modifyitems(self, items):
+        self.items = list(items)
+
+
+@benchmark
+def bench_unlock_setup(tmp: Path, repeat: int, scale: float) -> float:
+    """Set up the doctests of 2000 locked functions (4000 locked outputs), all unlocked."""
+    src = tmp / 'src.py'
+    src.write_text(synthetic_source(sized(2000, scale), locked_every=1))
+    lock_doctests_for_file(src, tmp / 'locked.py')
+    collector = ItemCollector()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pytest.main(['--collect-only', '-q', '--doctest-modules', '-p', 'no:cacheprovider',
+                     '--rootdir', str(tmp), str(tmp / 'locked.py')], plugins=[collector])
+    items = [item for item in collector.items if isinstance(item, pytest.DoctestItem)]
+
+    # The unlocked output of every locked line
+    keys = {}
+    for item in items:
+        name = item.dtest.name.split('.')[-1]
+        i = int(name.removeprefix('f'))
+        outputs = [f'{i + 1}', f'[{i}, {i + 1}, {i + 2}]']
+        for n, example in enumerate(item.dtest.examples):
+            keys[locked_hash(example.want.strip())] = outputs[n]
+    wants = [[example.want for example in item.dtest.examples] for item in items]
+
+    def lock_again():
+        for item, item_wants in zip(items, wants):
+            for example, want in zip(item.dtest.examples, item_wants):
+                example.want = want
+
+    def run():
+        plugin = UnlockPlugin(keys)
+        for item in items:
+            plugin.pytest_runtest_setup(item)
+    return best_of(repeat, run, setup=lock_again)
+
+
+def run_benchmarks(names: list[str], repeat: int, scale: float) -> dict[str, float]:
+    results = {}
+    for name in names:
+        with tempfile.TemporaryDirectory() as tmp:
+            results[name] = BENCHMARKS[name](Path(tmp), repeat, scale)
+        print(f'{name}: {results[name] * 1000:.1f} ms', flush=True)
+    return results
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], tolerance: float) -> list[str]:
+    """Print how each result compares with the baseline, and return the names
+    of those slower by more than tolerance."""
+    regressions = []
+    print(f"\n{'benchmark':<28} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, seconds in results.items():
+        if name not in baseline:
+            print(f'{name:<28} {"-":>10} {seconds * 1000:>8.1f}ms')
+            continue
+        change = seconds / baseline[name] - 1
+        slower = change > tolerance
+        if slower:
+            regressions.append(name)
+        print(f'{name:<28} {baseline[name] * 1000:>8.1f}ms {seconds * 1000:>8.1f}ms '
+              f'{change:>+7.0%}' + ('  REGRESSION' if slower else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*', metavar='NAME',
+                        help=f'Benchmarks to run (default: all of {", ".join(BENCHMARKS)})')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs (the best is reported)')
+    parser.add_argument('--scale', type=float, default=1.0, help='Factor for the size of each benchmark')
+    parser.add_argument('--save', metavar='FILE', help='Save the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', nargs='?', const=str(BASELINE),
+                        help=f'Compare the results with a baseline (default: {BASELINE.name})')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Fraction by which a benchmark may be slower than its baseline (default: 0.25)')
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    results = run_benchmarks(args.names or list(BENCHMARKS), args.repeat, args.scale)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'scale': args.scale,
+                       'results': results}, f, indent=2)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('scale', 1.0) != args.scale:
+            sys.exit(f"{args.compare} was recorded with --scale {baseline.get('scale', 1.0)}")
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmarks regressed by more than {args.tolerance:.0%}: "
+                  + ', '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
 """A pytest plugin for testing and scoring programming assignments."""
 
-from .decorators import points
+from .decorators import memory_limit, points, timeout
 from .plugins import pytest_addoption, pytest_configure
@@ -0,0 +1,274 @@
+"""
+Module for analyzing the grader databases of many submissions together.
+"""
+
+from pathlib import Path
+
+import os
+import sqlite3
+
+DATABASE_NAME = 'grader.sqlite'
+REPORTS = ('first-pass', 'unlocks', 'snapshots')
+
+# The tables copied from each grader database, with the columns copied from
+# each. Columns missing from databases written by earlier versions are NULL.
+COPIED_TABLES = {
+    'snapshots': ['id', 'timestamp'],
+    'snapshot_files': ['snapshot_id', 'filename', 'sha1_hash'],
+    'test_cases': ['snapshot_id', 'name', 'passed', 'duration', 'cpu_time', 'rss_delta',
+                   'memory_peak', 'response_sha1'],
+    'unlock_attempts': ['snapshot_id', 'name', 'guess', 'success'],
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    submission_id INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    timestamp DATETIME,
+    PRIMARY KEY (submission_id, id)
+);
+CREATE TABLE IF NOT EXISTS snapshot_files (
+    submission_id INTEGER NOT NULL,
+    snapshot_id INTEGER,
+    filename TEXT NOT NULL,
+    sha1_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS test_cases (
+    submission_id INTEGER NOT NULL,
+    snapshot_id INTEGER,
+    name TEXT NOT NULL,
+    passed BOOLEAN NOT NULL,
+    duration REAL,
+    cpu_time REAL,
+    rss_delta INTEGER,
+    memory_peak INTEGER,
+    response_sha1 TEXT
+);
+CREATE TABLE IF NOT EXISTS unlock_attempts (
+    submission_id INTEGER NOT NULL,
+    snapshot_id INTEGER,
+    name TEXT NOT NULL,
+    guess TEXT NOT NULL,
+    success BOOLEAN NOT NULL
+);
+-- Responses (e.g. failure messages) referred to by test_cases.response_sha1,
+-- stored once across all submissions, as in each grader database
+CREATE TABLE IF NOT EXISTS responses (
+    sha1_hash TEXT PRIMARY KEY,
+    content BLOB NOT NULL,
+    codec TEXT
+);
+CREATE INDEX IF NOT EXISTS snapshot_files_submission ON snapshot_files (submission_id, snapshot_id);
+CREATE INDEX IF NOT EXISTS test_cases_submission ON test_cases (submission_id, name, snapshot_id);
+CREATE INDEX IF NOT EXISTS unlock_attempts_submission ON unlock_attempts (submission_id, name);
+
+-- Aggregates, recomputed by build_warehouse. Runs of a test are ordered by
+-- rowid, which follows the order they were logged in (see _copy_tables),
+-- since a compacted database may have several runs in one snapshot.
+
+-- For each test run by a submission, how many times it ran until it first
+-- passed, and the seconds from when it first ran until then (NULL if never)
+CREATE TABLE IF NOT EXISTS first_pass (
+    submission_id INTEGER NOT NULL,
+    test TEXT NOT NULL,
+    runs_to_pass INTEGER,
+    seconds_to_pass REAL,
+    PRIMARY KEY (submission_id, test)
+);
+-- For each locked output that a submission tried to unlock, its number of
+-- attempts, and whether it was unlocked
+CREATE TABLE IF NOT EXISTS unlock_positions (
+    submission_id INTEGER NOT NULL,
+    position TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    unlocked BOOLEAN NOT NULL,
+    PRIMARY KEY (submission_id, position)
+);
+-- The number of snapshots (pytest runs) of each submission, and when the
+-- first and last were taken
+CREATE TABLE IF NOT EXISTS snapshot_counts (
+    submission_id INTEGER PRIMARY KEY,
+    snapshots INTEGER NOT NULL,
+    first_snapshot DATETIME,
+    last_snapshot DATETIME
+);
+'''
+
+AGGREGATES = [
+    'DELETE FROM first_pass',
+    '''
+    INSERT INTO first_pass (submission_id, test, runs_to_pass, seconds_to_pass)
+    WITH first AS (
+        SELECT submission_id, name, MIN(snapshot_id) AS first_run,
+               MIN(CASE WHEN passed THEN rowid END) AS first_passed
+        FROM test_cases WHERE snapshot_id IS NOT NULL
+        GROUP BY submission_id, name
+    ), runs AS (
+        SELECT t.submission_id, t.name, COUNT(*) AS runs
+        FROM test_cases t JOIN first f ON f.submission_id = t.submission_id AND f.name = t.name
+        WHERE t.snapshot_id IS NOT NULL AND t.rowid <= f.first_passed
+        GROUP BY t.submission_id, t.name
+    )
+    SELECT f.submission_id, f.name, r.runs,
+           (julianday(passed.timestamp) - julianday(ran.timestamp)) * 86400
+    FROM first f
+    LEFT JOIN runs r ON r.submission_id = f.submission_id AND r.name = f.name
+    LEFT JOIN test_cases p ON p.rowid = f.first_passed
+    LEFT JOIN snapshots ran ON ran.submission_id = f.submission_id AND ran.id = f.first_run
+    LEFT JOIN snapshots passed ON passed.submission_id = f.submission_id AND passed.id = p.snapshot_id
+    ''',
+    'DELETE FROM unlock_positions',
+    '''
+    INSERT INTO unlock_positions (submission_id, position, attempts, unlocked)
+    SELECT submission_id, name, COUNT(*), MAX(success) FROM unlock_attempts
+    GROUP BY submission_id, name
+    ''',
+    'DELETE FROM snapshot_counts',
+    '''
+    INSERT INTO snapshot_counts (submission_id, snapshots, first_snapshot, last_snapshot)
+    SELECT submission_id, COUNT(*), MIN(timestamp), MAX(timestamp) FROM snapshots
+    GROUP BY submission_id
+    ''',
+]
+
+REPORT_QUERIES = {
+    # How long each test took submissions to pass, across submissions
+    'first-pass': '''
+        SELECT test, COUNT(*) AS submissions, COUNT(runs_to_pass) AS passed,
+               ROUND(AVG(runs_to_pass), 2) AS mean_runs_to_pass,
+               ROUND(AVG(seconds_to_pass) / 60, 1) AS mean_minutes_to_pass
+        FROM first_pass GROUP BY test ORDER BY test
+    ''',
+    # How many attempts each locked output took to unlock, across submissions
+    'unlocks': '''
+        SELECT position, COUNT(*) AS submissions, SUM(unlocked) AS unlocked,
+               SUM(attempts) AS attempts, ROUND(AVG(attempts), 2) AS mean_attempts
+        FROM unlock_positions GROUP BY position ORDER BY position
+    ''',
+    # How many times each submission ran pytest, and over what period
+    'snapshots': '''
+        SELECT s.name AS submission, c.snapshots, c.first_snapshot, c.last_snapshot
+        FROM snapshot_counts c JOIN submissions s ON s.id = c.submission_id ORDER BY s.name
+    ''',
+}
+
+
+def find_databases(paths: list[Path]) -> dict[str, Path]:
+    """The grader databases among paths, searching directories recursively,
+    keyed by their submission names."""
+    databases, seen = {}, set()
+    for path in paths:
+        found = sorted(path.rglob(DATABASE_NAME)) if path.is_dir() else [path]
+        for database in found:
+            if database.resolve() in seen:
+                continue
+            seen.add(database.resolve())
+            name = submission_name(database, path if path.is_dir() else None)
+            if name in databases:
+                name = submission_name(database.resolve())  # Same name under another directory
+            databases[name] = database
+    return databases
+
+
+def submission_name(database: Path, root: Path | None = None) -> str:
+    """The name of the submission of a grader database: the path of the
+    directory containing a grader.sqlite, or else the path of the file without
+    its suffix, relative to the root directory it was found in."""
+    path = database.parent if database.name == DATABASE_NAME else database.with_suffix('')
+    if root is None:
+        return path.as_posix()
+    return path.relative_to(root).as_posix() if path != root else root.resolve().name
+
+
+def build_warehouse(warehouse: Path, databases: dict[str, Path]) -> dict[str, int]:
+    """Copy the rows of each grader database, keyed by submission name, into the
+    warehouse database, labeled with a submission id, and recompute the aggregates.
+
+    A database that is unchanged since it was last copied is skipped, and one
+    that has changed replaces the rows copied before. Return the number of
+    databases added, updated, and unchanged."""
+    counts = {'added': 0, 'updated': 0, 'unchanged': 0}
+    conn = sqlite3.connect(warehouse, isolation_level=None)  # Transactions are explicit
+    try:
+        # The warehouse can be rebuilt from the databases, so it need not survive
+        # a crash, but a failed copy is still rolled back.
+        conn.execute('PRAGMA journal_mode = memory')
+        conn.execute('PRAGMA synchronous = off')
+        conn.executescript(SCHEMA)
+        for name, database in databases.items():
+            stat = os.stat(database)
+            row = conn.execute('SELECT id, size, mtime_ns FROM submissions WHERE name = ?',
+                               (name,)).fetchone()
+            if row is not None and tuple(row[1:]) == (stat.st_size, stat.st_mtime_ns):
+                counts['unchanged'] += 1
+                continue
+            counts['added' if row is None else 'updated'] += 1
+            # A database can't be attached within a transaction.
+            conn.execute('ATTACH DATABASE ? AS source', (str(database),))
+            try:
+                conn.execute('BEGIN')
+                if row is None:
+                    submission_id = conn.execute(
+                        'INSERT INTO submissions (name, path, size, mtime_ns) VALUES (?, ?, ?, ?)',
+                        (name, str(database), stat.st_size, stat.st_mtime_ns)).lastrowid
+                else:
+                    submission_id = row[0]
+                    conn.execute('UPDATE submissions SET path = ?, size = ?, mtime_ns = ? WHERE id = ?',
+                                 (str(database), stat.st_size, stat.st_mtime_ns, submission_id))
+                    for table in COPIED_TABLES:
+                        conn.execute(f'DELETE FROM {table} WHERE submission_id = ?', (submission_id,))
+                _copy_tables(conn, submission_id)
+                conn.execute('COMMIT')
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+            finally:
+                conn.execute('DETACH DATABASE source')
+
+        conn.execute('BEGIN')
+        for query in AGGREGATES:
+            conn.execute(query)
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    return counts
+
+
+def _copy_tables(conn: sqlite3.Connection, submission_id: int):
+    """Copy the rows of the attached source database, labeled with submission_id."""
+    source_tables = {row[0] for row in conn.execute(
+        "SELECT name FROM source.sqlite_master WHERE type = 'table'")}
+    for table, columns in COPIED_TABLES.items():
+        if table not in source_tables:
+            continue
+        existing = {row[1] for row in conn.execute(f'PRAGMA source.table_info({table})')}
+        selected = ', '.join(column if column in existing else 'NULL' for column in columns)
+        # Rows are copied in the order they were logged, which rowids then follow.
+        conn.execute(f'''
+            INSERT INTO {table} (submission_id, {', '.join(columns)})
+            SELECT ?, {selected} FROM source.{table} ORDER BY rowid
+        ''', (submission_id,))
+    if 'responses' in source_tables:
+        # A response is identified by its hash, so one shared by submissions is copied once.
+        conn.execute('''
+            INSERT OR IGNORE INTO responses (sha1_hash, content, codec)
+            SELECT sha1_hash, content, codec FROM source.responses
+        ''')
+
+
+def report(warehouse: Path, name: str) -> tuple[list[str], list[tuple]]:
+    """The column names and rows of a report on the aggregates in the warehouse."""
+    conn = sqlite3.connect(f'file:{warehouse}?mode=ro', uri=True)
+    try:
+        cursor = conn.execute(REPORT_QUERIES[name])
+        return [column[0] for column in cursor.description], cursor.fetchall()
+    finally:
+        conn.close()
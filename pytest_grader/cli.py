@@ -1,13 +1,125 @@
 """Command line interface for pytest-grader."""
 
 import argparse
+import csv
+import json
+import os
+import sys
+import time
 from pathlib import Path
-from .lock_tests import lock_doctests_for_file
+
+import pytest
+
+import pytest_grader
+
+from .analyze import REPORTS, build_warehouse, find_databases, report
+from .grade_all import find_submissions, grade_all
+from .logger import SQLLogger
+from .lock_tests import (DEFAULT_ITERATIONS, KDFS, KeyDerivation, lock_directory,
+                         lock_doctests_for_file)
 
 def lock_command(args):
     """Copy [src] to [dst], replacing the output of locked doctests with secure hashes."""
-    count = lock_doctests_for_file(Path(args.src), Path(args.dst))
-    print(f'Wrote locked version of {args.src} to {args.dst} ({count} outputs locked)')
+    iterations = 1 if args.kdf == 'sha256' else args.iterations
+    kdf = KeyDerivation(args.kdf, iterations, args.salt)
+    if not Path(args.src).is_dir():
+        count = lock_doctests_for_file(Path(args.src), Path(args.dst), kdf)
+        print(f'Wrote locked version of {args.src} to {args.dst} ({count} outputs locked)')
+        return
+
+    start = time.time()
+    results = lock_directory(Path(args.src), Path(args.dst), args.jobs, args.force, kdf)
+    for result in results:
+        if result.action == 'failed':
+            print(f'Failed to lock {result.path}: {result.error}', file=sys.stderr)
+        elif result.action == 'locked':
+            print(f'Locked {result.path} ({result.outputs} outputs locked, {result.seconds:.2f}s)')
+        elif result.action == 'copied':
+            print(f'Copied {result.path} ({result.seconds:.2f}s)')
+    counts = {action: sum(result.action == action for result in results)
+              for action in ('locked', 'copied', 'unchanged', 'failed')}
+    outputs = sum(result.outputs for result in results if result.action == 'locked')
+    print(f"Locked {counts['locked']} files ({outputs} outputs) and copied {counts['copied']} "
+          f"in {time.time() - start:.1f}s; {counts['unchanged']} unchanged"
+          + (f", {counts['failed']} failed" if counts['failed'] else ''))
+    if counts['failed']:
+        sys.exit(1)
+
+class _UnlockResult:
+    """Read the outputs still locked after a run with --unlock-from."""
+    remaining = None
+
+    def pytest_unconfigure(self, config):
+        unlock_plugin = config.pluginmanager.get_plugin('pytest-grader-unlock')
+        if unlock_plugin is not None:
+            self.remaining = unlock_plugin.remaining
+
+def unlock_command(args):
+    """Unlock locked doctests with the outputs in [answers], without running any tests."""
+    result = _UnlockResult()
+    status = pytest.main(['--collect-only', '-q', '--unlock-from', args.answers, *args.pytest_args],
+                         plugins=[pytest_grader, result])
+    if status == pytest.ExitCode.OK and result.remaining:
+        status = 1
+    sys.exit(int(status))
+
+def grade_all_command(args):
+    """Grade each submission directory in [submissions_dir] with the instructor tests."""
+    submissions = find_submissions(Path(args.submissions_dir))
+    assignment = Path(args.assignment).resolve() if args.assignment else None
+    start = time.time()
+    if args.output:
+        with open(args.output, 'w') as output:
+            totals = grade_all(submissions, Path(args.tests), output, args.jobs, args.timeout, assignment)
+    else:
+        totals = grade_all(submissions, Path(args.tests), sys.stdout, args.jobs, args.timeout, assignment)
+    problems = sum(total['result'] != 'graded' for total in totals)
+    print(f'Graded {len(totals)} submissions in {time.time() - start:.1f}s'
+          + (f' ({problems} timed out or failed to run)' if problems else ''), file=sys.stderr)
+
+def analyze_command(args):
+    """Copy grader databases into a [warehouse] database and report aggregates across them."""
+    warehouse = Path(args.warehouse)
+    if args.databases:
+        start = time.time()
+        counts = build_warehouse(warehouse, find_databases([Path(path) for path in args.databases]))
+        print(f"Added {counts['added']} databases, updated {counts['updated']}, and skipped "
+              f"{counts['unchanged']} unchanged in {time.time() - start:.1f}s", file=sys.stderr)
+    elif not warehouse.exists():
+        sys.exit(f'{warehouse} does not exist; pass grader databases to copy into it')
+
+    for name in args.report or []:
+        columns, rows = report(warehouse, name)
+        if args.format == 'csv':
+            writer = csv.writer(sys.stdout)
+            writer.writerow(columns)
+            writer.writerows(rows)
+        elif args.format == 'jsonl':
+            for row in rows:
+                print(json.dumps({'report': name, **dict(zip(columns, row))}))
+        else:
+            widths = [max([len(column)] + [len(str(row[i])) for row in rows])
+                      for i, column in enumerate(columns)]
+            print(f'== {name} ==')
+            print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+            for row in rows:
+                print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)))
+
+def compact_command(args):
+    """Shrink grader databases by merging identical consecutive snapshots and vacuuming."""
+    if args.keep_versions is not None and args.keep_versions < 1:
+        sys.exit('--keep-versions must be at least 1')
+    for database in args.databases:
+        if not os.path.exists(database):
+            sys.exit(f'{database} does not exist')
+        size = os.path.getsize(database)
+        logger = SQLLogger(database, {})
+        try:
+            counts = logger.compact(args.keep_versions)
+        finally:
+            logger.close()
+        print(f"Compacted {database} from {size / 1024:.0f} KB to {os.path.getsize(database) / 1024:.0f} KB "
+              f"({counts['merged_snapshots']} snapshots merged, {counts['pruned_versions']} file versions pruned)")
 
 def cli_main():
     """Main CLI entry point."""
@@ -15,10 +127,54 @@ def cli_main():
     subparsers = parser.add_subparsers(dest='command')
 
     lock_parser = subparsers.add_parser('lock', help=lock_command.__doc__)
-    lock_parser.add_argument('src', help='Source file')
-    lock_parser.add_argument('dst', help='Destination file')
+    lock_parser.add_argument('src', help='Source file or directory')
+    lock_parser.add_argument('dst', help='Destination file or directory')
+    lock_parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                             help='Number of files to lock at once (default: number of CPUs)')
+    lock_parser.add_argument('--force', action='store_true',
+                             help='Lock every file, even if it is unchanged since the last run')
+    lock_parser.add_argument('--kdf', choices=KDFS, default='sha256',
+                             help='How hash codes are derived: sha256 (default), or pbkdf2_sha256, '
+                                  'which is salted and iterated to resist guessing by brute force')
+    lock_parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS,
+                             help=f'Iterations of pbkdf2_sha256 (default: {DEFAULT_ITERATIONS})')
+    lock_parser.add_argument('--salt', help='Salt for pbkdf2_sha256 (default: random)')
     lock_parser.set_defaults(func=lock_command)
 
+    unlock_parser = subparsers.add_parser('unlock', help=unlock_command.__doc__)
+    unlock_parser.add_argument('answers', help='YAML file mapping each test name to its outputs')
+    unlock_parser.add_argument('pytest_args', nargs=argparse.REMAINDER,
+                               help='Arguments for pytest, such as the files to unlock')
+    unlock_parser.set_defaults(func=unlock_command)
+
+    grade_parser = subparsers.add_parser('grade-all', help=grade_all_command.__doc__)
+    grade_parser.add_argument('submissions_dir', help='Directory containing one directory per submission')
+    grade_parser.add_argument('--tests', required=True, help='Test file or directory to run on each submission')
+    grade_parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                              help='Number of submissions to grade at once (default: number of CPUs)')
+    grade_parser.add_argument('--timeout', type=float, help='Time limit in seconds for each submission')
+    grade_parser.add_argument('--assignment',
+                              help='Assignment configuration file (default: grader.yaml in the submission)')
+    grade_parser.add_argument('--output', '-o', help='JSON Lines results file (default: standard output)')
+    grade_parser.set_defaults(func=grade_all_command)
+
+    analyze_parser = subparsers.add_parser('analyze', help=analyze_command.__doc__)
+    analyze_parser.add_argument('warehouse', help='Database to copy grader databases into and report on')
+    analyze_parser.add_argument('databases', nargs='*',
+                                help='Grader databases, or directories to search for grader.sqlite files')
+    analyze_parser.add_argument('--report', '-r', action='append', choices=REPORTS,
+                                help='Report to print: first-pass, unlocks, or snapshots (repeatable)')
+    analyze_parser.add_argument('--format', choices=('table', 'csv', 'jsonl'), default='table',
+                                help='Format of reports (default: table)')
+    analyze_parser.set_defaults(func=analyze_command)
+
+    compact_parser = subparsers.add_parser('compact', help=compact_command.__doc__)
+    compact_parser.add_argument('databases', nargs='+', help='Grader databases to compact in place')
+    compact_parser.add_argument('--keep-versions', type=int, metavar='N',
+                                help='Remove the content of all but the newest N versions of each file, '
+                                     'keeping their hashes (default: keep all)')
+    compact_parser.set_defaults(func=compact_command)
+
     args = parser.parse_args()
 
     if hasattr(args, 'func'):
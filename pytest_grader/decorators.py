@@ -3,4 +3,23 @@ def points(n):
     def wrapper(f):
         f.points = n
         return f
+    return wrapper
+
+
+def timeout(seconds):
+    """Decorator to limit the running time of a test function (with isolation: fork)."""
+    def wrapper(f):
+        f.timeout = seconds
+        return f
+    return wrapper
+
+
+def memory_limit(megabytes):
+    """Decorator to limit the memory of a test function (with isolation: fork).
+
+    The limit is on how much the test's address space grows beyond what its
+    process inherits from pytest, so it doesn't count modules already imported."""
+    def wrapper(f):
+        f.memory_limit = megabytes
+        return f
     return wrapper
\ No newline at end of file
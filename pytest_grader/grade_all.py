@@ -0,0 +1,185 @@
+"""
+Module for grading a directory of submissions, each in a forked child process.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TextIO
+
+import json
+import os
+import selectors
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+import pytest
+
+import pytest_grader
+from .plugins import score_record
+
+
+@dataclass
+class Submission:
+    """A submission being graded by a child process."""
+    name: str
+    pid: int
+    fd: int
+    tmpdir: str
+    deadline: float | None
+    buffer: bytes = b''
+    earned: int = 0
+    points: int = 0
+    tests: int = 0
+
+
+class ResultStreamer:
+    """Send a JSON line for each test that runs to a file descriptor."""
+
+    def __init__(self, fd: int):
+        self.out = os.fdopen(fd, 'w')
+
+    def pytest_runtest_logreport(self, report):
+        # The same reports that ScorerPlugin counts towards the score
+        if report.when == "call" or (report.when == "setup" and report.outcome == "skipped"):
+            record = score_record(report, getattr(report, 'grader_points', 0))
+            self.out.write(json.dumps(record) + '\n')
+            self.out.flush()
+
+
+def find_submissions(submissions_dir: Path) -> list[Path]:
+    """The submission directories within submissions_dir, in order."""
+    return sorted(path for path in submissions_dir.iterdir()
+                  if path.is_dir() and not path.name.startswith('.'))
+
+
+def grade_all(submissions: list[Path], tests: Path, output: TextIO, jobs: int = 1,
+              timeout: float | None = None, assignment: Path | None = None) -> list[dict]:
+    """Grade each submission with the tests and write a JSON line to output for
+    each test, followed by the total for the submission.
+
+    Each submission is graded by a child process forked from this one, which
+    has already imported pytest and pytest-grader, with at most jobs running at
+    once. A child still running after timeout seconds is killed, along with
+    any processes it started. Return the total records."""
+    if not hasattr(os, 'fork'):
+        raise RuntimeError("grade-all is not supported on this platform")
+    waiting = list(submissions)
+    running = {}
+    totals = []
+
+    def emit(record):
+        output.write(json.dumps(record) + '\n')
+        output.flush()
+
+    with selectors.DefaultSelector() as selector:
+        while waiting or running:
+            while waiting and len(running) < jobs:
+                path = waiting.pop(0)
+                submission = _start(path.resolve(), tests.resolve(), timeout, assignment)
+                running[submission.fd] = submission
+                selector.register(submission.fd, selectors.EVENT_READ, submission)
+
+            deadlines = [s.deadline for s in running.values() if s.deadline is not None]
+            wait = None if not deadlines else max(0, min(deadlines) - time.time())
+            for key, _ in selector.select(wait):
+                submission = key.data
+                chunk = os.read(submission.fd, 1 << 16)
+                if chunk:
+                    submission.buffer += chunk
+                    *lines, submission.buffer = submission.buffer.split(b'\n')
+                    for line in lines:
+                        record = {'submission': submission.name, **json.loads(line)}
+                        submission.tests += 1
+                        submission.points += record['points']
+                        submission.earned += record['earned']
+                        emit(record)
+                else:
+                    totals.append(_finish(submission, selector, running, emit, timed_out=False))
+
+            for submission in list(running.values()):
+                if submission.deadline is not None and time.time() >= submission.deadline:
+                    # Kill the child's process group, which includes any processes
+                    # that its tests started (e.g. with isolation: fork).
+                    try:
+                        os.killpg(submission.pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                    totals.append(_finish(submission, selector, running, emit, timed_out=True))
+    return totals
+
+
+def _start(path: Path, tests: Path, timeout: float | None, assignment: Path | None) -> Submission:
+    """Fork a child process that grades the submission at path."""
+    # The parent removes the temporary directory, even if the child is killed.
+    tmpdir = tempfile.mkdtemp(prefix='pytest-grader-')
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        _grade_in_child(path, tests, write_fd, Path(tmpdir), assignment)
+    # The child leads a process group of its own, so that it can be killed with
+    # its descendants. Both processes set it, so it is set before either continues.
+    try:
+        os.setpgid(pid, pid)
+    except (PermissionError, ProcessLookupError):
+        pass  # The child already set it, or has already exited
+    os.close(write_fd)
+    deadline = None if timeout is None else time.time() + timeout
+    return Submission(path.name, pid, read_fd, tmpdir, deadline)
+
+
+def _grade_in_child(path: Path, tests: Path, write_fd: int, tmpdir: Path, assignment: Path | None):
+    """Run pytest on a submission, streaming results to write_fd, then exit."""
+    status = 3  # pytest's exit code for an internal error
+    try:
+        os.setpgid(0, 0)
+        # Discard pytest's terminal output; results are sent through write_fd.
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        os.chdir(path)
+        sys.path.insert(0, str(path))
+        sys.dont_write_bytecode = True  # Leave no __pycache__ in the submission
+
+        # Grade against a copy of the submitted database, which holds the
+        # student's unlock keys, so that the submission itself is unchanged.
+        grader_db = tmpdir / 'grader.sqlite'
+        if (path / 'grader.sqlite').exists():
+            shutil.copy(path / 'grader.sqlite', grader_db)
+        if assignment is None:
+            assignment = path / 'grader.yaml'
+            if not assignment.exists():
+                assignment = (tests if tests.is_dir() else tests.parent) / 'grader.yaml'
+
+        # The plugin is passed as a module that is already imported, rather
+        # than with -p, and is not imported again for each submission.
+        status = int(pytest.main(
+            [str(tests), '-p', 'no:cacheprovider',
+             '--grader-db', str(grader_db), '--assignment', str(assignment)],
+            plugins=[pytest_grader, ResultStreamer(write_fd)]))
+    finally:
+        os._exit(status)
+
+
+def _finish(submission: Submission, selector, running: dict, emit, timed_out: bool) -> dict:
+    """Collect a finished (or killed) child and emit the total for its submission."""
+    selector.unregister(submission.fd)
+    os.close(submission.fd)
+    del running[submission.fd]
+    _, status = os.waitpid(submission.pid, 0)
+    shutil.rmtree(submission.tmpdir, ignore_errors=True)
+    exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else None
+    if timed_out:
+        result = 'timeout'
+    elif exit_code in (pytest.ExitCode.OK, pytest.ExitCode.TESTS_FAILED):
+        result = 'graded'
+    else:
+        result = 'error'
+    total = {'type': 'total', 'submission': submission.name, 'result': result,
+             'exit_code': exit_code, 'tests': submission.tests,
+             'earned': submission.earned, 'points': submission.points}
+    emit(total)
+    return total
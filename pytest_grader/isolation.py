@@ -0,0 +1,179 @@
+"""
+Module for isolating tests by restoring a module's globals instead of reloading it.
+"""
+
+import copy
+import sys
+import types
+
+
+IMMUTABLE_TYPES = (type(None), type(Ellipsis), type(NotImplemented), bool, int, float, complex,
+                   str, bytes, range, types.ModuleType, types.BuiltinFunctionType)
+
+
+def is_immutable(value) -> bool:
+    """Whether a value cannot be changed in place, so rebinding a name to it restores it."""
+    if isinstance(value, (tuple, frozenset)):
+        return all(is_immutable(v) for v in value)
+    return isinstance(value, IMMUTABLE_TYPES)
+
+
+class ModuleSnapshot:
+    """The globals of a module, which can be restored before each test.
+
+    Restoring the module's namespace undoes rebinding (e.g. monkeypatching a
+    function), but not changes made in place to the objects it refers to, such
+    as appending to a global list. So the snapshot also keeps a copy of the
+    state of every mutable global, and restore() refuses to restore a module
+    whose objects changed, in which case the module should be reloaded.
+
+    The state of a function includes the contents of its closure cells, and
+    that of a cached function (from functools.lru_cache or functools.cache)
+    its cache, which restore() clears if it was empty in the snapshot."""
+
+    def __init__(self, module: types.ModuleType):
+        self.module = module
+        self.namespace = dict(module.__dict__)
+        try:
+            # Module attributes such as __builtins__ and __loader__ are not
+            # the module's own state.
+            self.states = {name: self._capture(value) for name, value in self.namespace.items()
+                           if not is_immutable(value) and not _is_dunder(name)}
+            self.restorable = True
+        except Exception:
+            # Some objects (e.g. open files or locks) cannot be copied.
+            self.states = {}
+            self.restorable = False
+
+    def _capture(self, value):
+        """Capture the parts of a global's state that rebinding it would not restore."""
+        if isinstance(value, types.FunctionType):
+            defaults = (value.__defaults__, value.__kwdefaults__)
+            cells = _cell_contents(value)
+            return (value.__code__, defaults, copy.deepcopy(defaults), dict(value.__dict__),
+                    cells, copy.deepcopy(cells))
+        if _is_cached(value):
+            return value.cache_info()
+        if isinstance(value, type):
+            if value.__module__ != self.module.__name__:
+                return None  # Classes defined elsewhere belong to other modules
+            attributes = _class_attributes(value)
+            # Methods, properties, and other descriptors are compared by identity
+            data = {k: v for k, v in attributes.items() if not is_immutable(v)
+                    and not callable(v) and not hasattr(type(v), '__get__')}
+            return (attributes, copy.deepcopy(data))
+        return copy.deepcopy(value)
+
+    def _unchanged(self, value, state) -> bool:
+        """Whether a global's state still matches what _capture returned."""
+        if isinstance(value, types.FunctionType):
+            code, defaults, copied_defaults, attributes, cells, copied_cells = state
+            current = _cell_contents(value)
+            return (value.__code__ is code and value.__defaults__ is defaults[0]
+                    and value.__kwdefaults__ is defaults[1] and _equal(defaults, copied_defaults)
+                    and _same_items(value.__dict__, attributes)
+                    and all(c is v for c, v in zip(current, cells)) and _equal(current, copied_cells))
+        if _is_cached(value):
+            # An empty cache is restored by clearing it.
+            return state.currsize == 0 or value.cache_info() == state
+        if isinstance(value, type):
+            if state is None:
+                return True
+            attributes, data = state
+            return _same_items(_class_attributes(value), attributes) and all(
+                _equal(vars(value)[k], v) for k, v in data.items())
+        return _equal(value, state)
+
+    def restore(self) -> bool:
+        """Restore the module's globals. Return False, leaving the module as it is,
+        if that would not undo every change made since the snapshot was taken."""
+        if not self.restorable:
+            return False
+        for name, state in self.states.items():
+            try:
+                if not self._unchanged(self.namespace[name], state):
+                    return False
+            except Exception:
+                return False
+        for name, state in self.states.items():
+            value = self.namespace[name]
+            if _is_cached(value) and state.currsize == 0:
+                value.cache_clear()
+        namespace = self.module.__dict__
+        namespace.clear()
+        namespace.update(self.namespace)
+        return True
+
+
+def _is_dunder(name: str) -> bool:
+    return name.startswith('__') and name.endswith('__')
+
+
+def _is_cached(value) -> bool:
+    """Whether a value is a function cached by functools.lru_cache or functools.cache."""
+    return (callable(value) and not isinstance(value, type)
+            and callable(getattr(value, 'cache_info', None)) and callable(getattr(value, 'cache_clear', None)))
+
+
+class _EmptyCell:
+    """The contents of a closure cell that has not been assigned yet."""
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+_EMPTY_CELL = _EmptyCell()
+
+
+def _cell_contents(function: types.FunctionType) -> tuple:
+    """The values in a function's closure cells."""
+    contents = []
+    for cell in function.__closure__ or ():
+        try:
+            contents.append(cell.cell_contents)
+        except ValueError:  # Not yet assigned
+            contents.append(_EMPTY_CELL)
+    return tuple(contents)
+
+
+def _class_attributes(cls: type) -> dict:
+    """The attributes of a class, except __slotnames__, which copying an
+    instance of the class caches on it."""
+    return {k: v for k, v in vars(cls).items() if k != '__slotnames__'}
+
+
+def _same_items(mapping, items: dict) -> bool:
+    """Whether a mapping has exactly the given keys, bound to the same objects."""
+    return mapping.keys() == items.keys() and all(mapping[k] is v for k, v in items.items())
+
+
+def _equal(value, other) -> bool:
+    """Whether a value equals its copy, treating a non-boolean comparison as unequal.
+
+    Containers are compared item by item, so that NaN equals NaN, and objects
+    that compare by identity (without their own __eq__) by their attributes.
+    NumPy arrays and pandas objects, whose == compares element-wise, are
+    compared with numpy.array_equal and their equals method."""
+    if value is other:
+        return True
+    if type(value) is not type(other):
+        return False
+    if isinstance(value, float) and value != value:
+        return other != other  # NaN
+    if isinstance(value, (list, tuple)):
+        return len(value) == len(other) and all(_equal(v, o) for v, o in zip(value, other))
+    if isinstance(value, dict):
+        return value.keys() == other.keys() and all(_equal(v, other[k]) for k, v in value.items())
+    numpy = sys.modules.get('numpy')
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        if value.dtype != other.dtype or value.shape != other.shape:
+            return False
+        try:
+            return bool(numpy.array_equal(value, other, equal_nan=True))
+        except TypeError:  # equal_nan needs a numeric dtype
+            return bool(numpy.array_equal(value, other))
+    if hasattr(value, '__array__') and callable(getattr(value, 'equals', None)):
+        return value.equals(other) is True  # e.g. a pandas DataFrame or Series
+    if type(value).__eq__ is object.__eq__ and hasattr(value, '__dict__'):
+        return _equal(vars(value), vars(other))
+    return (value == other) is True
@@ -0,0 +1,67 @@
+"""
+Storage for the outputs of locked doctests that a student has unlocked.
+"""
+
+import pickle
+import sqlite3
+
+from .logger import SQLLogger
+
+
+class UnlockKeys(dict):
+    """The unlocked output for each locked hash code, stored in a SQLite database.
+
+    All keys are read into memory when the store is opened, so lookups never
+    query the database. Keys added since then are written in one transaction
+    by flush(). No connection is held open in between, so the store can be
+    used after a fork.
+
+    Keys are stored in a plain unlocked_outputs (hash_code, output) table,
+    which SQLLogger's migrations create. Keys stored by earlier versions in the
+    pickled unlock_keys table of a SqliteDict are moved to it by a migration
+    too, and are read from there until the database is migrated."""
+
+    TABLE = 'unlocked_outputs'
+    LEGACY_TABLE = 'unlock_keys'
+
+    def __init__(self, db: str, readonly: bool = False):
+        super().__init__()
+        self.db_path = db
+        self.readonly = readonly
+        self.pending = {}
+        self._load()
+
+    def _load(self):
+        # Loading only reads, so it doesn't create a database that doesn't exist yet.
+        try:
+            conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True)
+        except sqlite3.OperationalError:
+            return
+        try:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if self.LEGACY_TABLE in tables:
+                for hash_code, value in conn.execute(f'SELECT key, value FROM "{self.LEGACY_TABLE}"'):
+                    super().__setitem__(hash_code, pickle.loads(value))
+            if self.TABLE in tables:
+                for hash_code, output in conn.execute(f'SELECT hash_code, output FROM {self.TABLE}'):
+                    super().__setitem__(hash_code, output)
+        finally:
+            conn.close()
+
+    def __setitem__(self, hash_code: str, output: str):
+        super().__setitem__(hash_code, output)
+        self.pending[hash_code] = output
+
+    def flush(self):
+        """Write the keys added since the last flush in a single transaction."""
+        if not self.pending or self.readonly:
+            return
+        SQLLogger(self.db_path, {}).close()  # Migrate the database, creating the table
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.executemany(f'INSERT OR REPLACE INTO {self.TABLE} (hash_code, output) VALUES (?, ?)',
+                                 self.pending.items())
+        finally:
+            conn.close()
+        self.pending.clear()
@@ -2,18 +2,30 @@
 Module for locking (and unlocking) doctests by replacing their outputs with secure hash codes.
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from pathlib import Path
 
 import ast
 import doctest
 import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import tokenize
 import pytest
 
 
 LOCK_MARKER = '# LOCK'
 LOCKED_PREFIX = 'LOCKED:'
 FUNCTION_OUTPUT = 'FUNCTION'
+LOCK_MANIFEST = '.pytest-grader-lock.json'
+LOCK_HEADER_PREFIX = '# pytest-grader lock:'
+KDFS = ('sha256', 'pbkdf2_sha256')
+DEFAULT_ITERATIONS = 100_000
+# An encoding declaration, which must be on the first or second line (PEP 263)
+CODING_PATTERN = re.compile(r'^[ \t\f]*#.*?coding[:=]')
 
 UNLOCK_PREAMBLE = """
 === Unlocking Tests ===
@@ -45,6 +57,8 @@ def substitute_function_outputs(example: doctest.Example) -> None:
     A doctest whose output is a function should give FUNCTION as the expected
     output, since a function's repr includes its memory address. Each FUNCTION
     line is rewritten to `<function ...>` with ellipsis matching enabled."""
+    if FUNCTION_OUTPUT not in example.want:
+        return
     lines = example.want.split('\n')
     changed = False
     for i, line in enumerate(lines):
@@ -56,64 +70,312 @@ def substitute_function_outputs(example: doctest.Example) -> None:
         example.options[doctest.ELLIPSIS] = True
 
 
-def lock_doctests_for_file(src: Path, dst: Path) -> int:
+@dataclass
+class KeyDerivation:
+    """How the hash code of a locked output is derived from the output.
+
+    sha256 is a single unsalted SHA-256 hash (the original scheme, which is
+    quick to brute-force for short outputs such as small numbers).
+    pbkdf2_sha256 is PBKDF2-HMAC-SHA256 with a per-assignment salt and many
+    iterations, which makes each guess correspondingly slower. Any KDF other
+    than sha256 is recorded in a header line at the top of the locked file
+    (after any shebang and encoding declaration).
+
+    Derived hash codes are cached, so a guess is only hashed once per output."""
+    name: str = 'sha256'
+    iterations: int = 1
+    salt: str | None = None  # Chosen at random when locking if None
+    cache: dict = field(default_factory=dict, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.name not in KDFS:
+            raise ValueError(f"Unknown KDF '{self.name}'; expected one of {', '.join(KDFS)}")
+
+    def derive(self, hash_input: str) -> str:
+        """The 16-character hash code of hash_input."""
+        if hash_input not in self.cache:
+            data = bytes(hash_input, 'UTF-8')
+            if self.name == 'sha256':
+                digest = hashlib.sha256(data).hexdigest()
+            else:
+                digest = hashlib.pbkdf2_hmac('sha256', data, bytes(self.salt, 'UTF-8'), self.iterations).hex()
+            self.cache[hash_input] = digest[:16]
+        return self.cache[hash_input]
+
+    def salted(self) -> 'KeyDerivation':
+        """This KDF with a random salt if it needs one and has none."""
+        if self.name == 'sha256' or self.salt is not None:
+            return self
+        return replace(self, salt=os.urandom(8).hex(), cache={})
+
+    def header(self) -> str | None:
+        """The header line that records this KDF in a locked file."""
+        if self.name == 'sha256':
+            return None
+        return f'{LOCK_HEADER_PREFIX} kdf={self.name} iterations={self.iterations} salt={self.salt}'
+
+    @classmethod
+    def from_header(cls, line: str) -> 'KeyDerivation':
+        """The KDF recorded by a header line, or sha256 if the line is not a header.
+
+        Raise ValueError if the line is a malformed header."""
+        if not line.startswith(LOCK_HEADER_PREFIX):
+            return cls()
+        try:
+            fields = dict(part.split('=', 1) for part in line[len(LOCK_HEADER_PREFIX):].split())
+            return cls(fields['kdf'], int(fields.get('iterations', 1)), fields.get('salt'))
+        except (ValueError, KeyError) as e:
+            raise ValueError(f"Malformed lock header '{line}' ({type(e).__name__}: {e}); expected "
+                             f"'{LOCK_HEADER_PREFIX} kdf=NAME iterations=N salt=SALT'") from None
+
+
+SHA256 = KeyDerivation()
+
+
+def read_key_derivation(path: Path) -> KeyDerivation:
+    """The KDF recorded in the header of a locked file.
+
+    Raise pytest.UsageError, naming the file, if its header is malformed."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            # The header follows at most a shebang and an encoding declaration.
+            first_lines = [f.readline().rstrip('\n') for _ in range(3)]
+    except OSError:
+        return SHA256
+    header = next((line for line in first_lines if line.startswith(LOCK_HEADER_PREFIX)), '')
+    try:
+        kdf = KeyDerivation.from_header(header)
+    except ValueError as e:
+        raise pytest.UsageError(f"{path}: {e}")
+    return SHA256 if kdf == SHA256 else kdf  # Share the cache of the default
+
+
+def lock_doctests_for_file(src: Path, dst: Path, kdf: KeyDerivation = SHA256) -> int:
     """
     Write the contents of src to dst with one change: the outputs of doctests
     in functions marked with a `# LOCK` comment are replaced by cryptographic
-    hash codes so that the tests cannot be run until the user unlocks them.
+    hash codes (derived with kdf) so that the tests cannot be run until the
+    user unlocks them.
 
     Return the number of outputs that were locked.
     """
-    lines = src.read_text().split('\n')
-    marker_indices = set()
+    text = src.read_text()
+    if LOCK_MARKER not in text:
+        # Nothing is locked, so there is no need to parse the file.
+        dst.write_text(text)
+        return 0
+    lines = text.split('\n')
+    marker_indices = [i for i, line in enumerate(lines) if line.strip() == LOCK_MARKER]
+
+    # Only the functions that markers attach to are read, so the cost of
+    # locking doesn't grow with the number of functions that aren't locked.
+    functions = {}
+    for i in marker_indices:
+        function = _find_locked_function(lines, i + 1)
+        if function is None:
+            # Fail loudly on markers that did not attach to any function,
+            # rather than silently writing a file with answers in the clear.
+            raise ValueError(f"{LOCK_MARKER} on line {i + 1} does not precede a function definition")
+        # A marker between a function's decorators attaches to it too.
+        functions[function.line] = function
+
+    kdf = kdf.salted()
     locked_outputs = 0
-
-    for node in ast.walk(ast.parse('\n'.join(lines), str(src))):
-        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-            markers = _find_lock_markers(node, lines)
-            if markers:
-                marker_indices.update(markers)
-                locked_outputs += _lock_docstring_outputs(node, lines)
-
-    # Fail loudly on markers that did not attach to any function, rather than
-    # silently writing a file with answers in the clear.
-    strays = [i for i, line in enumerate(lines)
-              if line.strip() == LOCK_MARKER and i not in marker_indices]
-    if strays:
-        raise ValueError(f"{LOCK_MARKER} on line {strays[0] + 1} does not precede a function definition")
-
-    dst.write_text('\n'.join(line for i, line in enumerate(lines) if i not in marker_indices))
+    for function in functions.values():
+        locked_outputs += _lock_docstring_outputs(function, lines, kdf)
+
+    marker_indices = set(marker_indices)
+    lines = [line for i, line in enumerate(lines) if i not in marker_indices]
+    if kdf.header():
+        position = _header_position(lines)
+        lines = lines[:position] + [kdf.header()] + lines[position:]
+    dst.write_text('\n'.join(lines))
     return locked_outputs
 
 
-def _find_lock_markers(node, lines: list[str]) -> list[int]:
-    """Return the indices of `# LOCK` comment lines attached to a function:
-    the line just above its definition (including any decorators), or a
-    comment line between the decorators and the `def`."""
-    first_line = min([d.lineno for d in node.decorator_list] + [node.lineno])
-    start = max(first_line - 2, 0)  # index of the line above the first decorator
-    return [i for i in range(start, node.lineno - 1) if lines[i].strip() == LOCK_MARKER]
+def _header_position(lines: list[str]) -> int:
+    """The index at which to insert a lock header: after a shebang and an
+    encoding declaration, which must stay on the first two lines."""
+    position = 0
+    for i, line in enumerate(lines[:2]):
+        if (i == 0 and line.startswith('#!')) or CODING_PATTERN.match(line):
+            position = i + 1
+    return position
 
 
-def _lock_docstring_outputs(node, lines: list[str]) -> int:
+@dataclass
+class LockResult:
+    """The result of locking (or copying) one file of a directory."""
+    path: Path  # Relative to the source and destination directories
+    action: str  # 'locked', 'copied', 'unchanged', or 'failed'
+    outputs: int = 0
+    seconds: float = 0.0
+    error: str | None = None
+
+
+def lock_directory(src: Path, dst: Path, jobs: int = 1, force: bool = False,
+                   kdf: KeyDerivation = SHA256) -> list[LockResult]:
+    """Mirror the tree at src into dst, locking the doctests of each Python
+    file (as lock_doctests_for_file does) and copying other files as they are.
+
+    Files are locked by a pool of jobs processes. A manifest in dst records
+    the hash of each source file, and a file whose source is unchanged since
+    an earlier run (with the same KDF) is skipped unless force is true. Hidden
+    files and __pycache__ directories are ignored. All files share one salt,
+    which is kept from the earlier run unless kdf specifies one."""
+    src, dst = src.resolve(), dst.resolve()
+    manifest_path = dst / LOCK_MANIFEST
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        manifest = {}
+    if kdf.salt is None:
+        for entry in manifest.values():
+            previous = KeyDerivation.from_header(entry.get('kdf') or '')
+            if previous.name == kdf.name and previous.iterations == kdf.iterations:
+                kdf = previous
+                break
+    kdf = kdf.salted()
+
+    results = []
+    new_manifest = {}
+    todo = []
+    for path in sorted(src.rglob('*')):
+        relative = path.relative_to(src)
+        if (not path.is_file() or path.is_relative_to(dst)
+                or any(part.startswith('.') or part == '__pycache__' for part in relative.parts)):
+            continue
+        sha1_hash = hashlib.sha1(path.read_bytes()).hexdigest()
+        entry = manifest.get(relative.as_posix())
+        if (not force and entry is not None and entry['sha1'] == sha1_hash
+                and entry.get('kdf') == kdf.header() and (dst / relative).exists()):
+            results.append(LockResult(relative, 'unchanged', entry['outputs']))
+            new_manifest[relative.as_posix()] = entry
+        else:
+            todo.append((relative, sha1_hash))
+
+    tasks = [(src / relative, dst / relative, kdf) for relative, _ in todo]
+    if jobs > 1 and len(tasks) > 1:
+        # Imported here, as pytest imports this module whenever it starts
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            outcomes = list(pool.map(_lock_or_copy, *zip(*tasks)))
+    else:
+        outcomes = [_lock_or_copy(*task) for task in tasks]
+    for (relative, sha1_hash), result in zip(todo, outcomes):
+        result.path = relative
+        results.append(result)
+        if result.error is None:
+            new_manifest[relative.as_posix()] = {'sha1': sha1_hash, 'outputs': result.outputs,
+                                                 'kdf': kdf.header()}
+
+    dst.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps(new_manifest, indent=1, sort_keys=True))
+    return sorted(results, key=lambda result: result.path)
+
+
+def _lock_or_copy(src: Path, dst: Path, kdf: KeyDerivation) -> LockResult:
+    """Lock a Python file, or copy any other file, to dst. Runs in a worker process."""
+    start = time.perf_counter()
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if src.suffix == '.py':
+            outputs = lock_doctests_for_file(src, dst, kdf)
+            action = 'locked'
+        else:
+            shutil.copy2(src, dst)
+            outputs = 0
+            action = 'copied'
+    except (ValueError, SyntaxError, UnicodeDecodeError, OSError) as e:
+        return LockResult(src, 'failed', seconds=time.perf_counter() - start, error=str(e))
+    return LockResult(src, action, outputs, time.perf_counter() - start)
+
+
+@dataclass
+class _LockedFunction:
+    """A function that a `# LOCK` marker attaches to."""
+    name: str
+    line: int  # Of the def, 1-indexed
+    docstring: str | None
+    docstring_line: int | None  # Where the docstring starts, 1-indexed
+
+
+_DOCTEST_PARSER = doctest.DocTestParser()
+_SKIPPED_TOKENS = (tokenize.NL, tokenize.COMMENT, tokenize.INDENT, tokenize.DEDENT)
+_OPENING_BRACKETS = ('(', '[', '{')
+_CLOSING_BRACKETS = (')', ']', '}')
+
+
+def _find_locked_function(lines: list[str], start: int) -> _LockedFunction | None:
+    """Find the function that a `# LOCK` marker on the line before lines[start]
+    attaches to: one whose decorators or def begin on that line. Return None
+    if there is none.
+
+    Only the tokens from the marker to the function's docstring are read."""
+    readline = (lines[i] + '\n' for i in range(start, len(lines))).__next__
+    tokens = (token for token in tokenize.generate_tokens(readline) if token.type not in _SKIPPED_TOKENS)
+    try:
+        token = next(tokens)
+        if token.start[0] != 1:
+            return None
+        while token.string == '@':
+            # Skip the decorator, which may span several lines
+            while token.type != tokenize.NEWLINE:
+                token = next(tokens)
+            token = next(tokens)
+        if token.string == 'async':
+            token = next(tokens)
+        if token.string != 'def':
+            return None
+        line = start + token.start[0]
+        name = next(tokens).string
+
+        # The signature ends at the first colon outside of brackets.
+        depth = 0
+        token = next(tokens)
+        while depth > 0 or token.string != ':':
+            if token.string in _OPENING_BRACKETS:
+                depth += 1
+            elif token.string in _CLOSING_BRACKETS:
+                depth -= 1
+            token = next(tokens)
+        token = next(tokens)
+        while token.type == tokenize.NEWLINE:
+            token = next(tokens)
+
+        # A docstring is a string literal (possibly implicitly concatenated)
+        # that forms the first statement of the body.
+        strings = []
+        while token.type == tokenize.STRING:
+            strings.append(token)
+            token = next(tokens)
+        if strings and (token.type in (tokenize.NEWLINE, tokenize.ENDMARKER) or token.string == ';'):
+            docstring = ast.literal_eval(' '.join(string.string for string in strings))
+            if isinstance(docstring, str):
+                return _LockedFunction(name, line, docstring, start + strings[0].start[0])
+        return _LockedFunction(name, line, None, None)
+    except (StopIteration, tokenize.TokenError, SyntaxError, ValueError):
+        return None
+
+
+def _lock_docstring_outputs(function: _LockedFunction, lines: list[str], kdf: KeyDerivation) -> int:
     """Replace the doctest outputs in a function's docstring with hash codes,
     editing lines in place. Return the number of outputs locked."""
-    docstring = ast.get_docstring(node, clean=False)
-    if docstring is None:
-        raise ValueError(f"Locked function '{node.name}' must have a docstring with at least one doctest")
-    examples = doctest.DocTestParser().get_examples(docstring)
+    if function.docstring is None:
+        raise ValueError(f"Locked function '{function.name}' must have a docstring with at least one doctest")
+    examples = _DOCTEST_PARSER.get_examples(function.docstring)
     if not examples:
-        raise ValueError(f"Locked function '{node.name}' must have at least one doctest in its docstring")
+        raise ValueError(f"Locked function '{function.name}' must have at least one doctest in its docstring")
 
     # Line i of the docstring appears on line docstring_start + i of the file (1-indexed).
-    docstring_start = node.body[0].lineno
+    docstring_start = function.docstring_line
     output_number = 0
     for example in examples:
         first_want = docstring_start + example.lineno + example.source.count('\n')
-        for file_line in range(first_want, first_want + example.want.count('\n')):
-            line = lines[file_line - 1]
-            hash_code = OutputPosition(node.name, output_number).encode(line.strip())
-            lines[file_line - 1] = replace_output(line, f'{LOCKED_PREFIX} {hash_code}')
+        for line_number in range(example.want.count('\n')):
+            line = lines[first_want + line_number - 1]
+            hash_code = OutputPosition(function.name, output_number).encode(line.strip(), kdf)
+            lines[first_want + line_number - 1] = replace_output(line, f'{LOCKED_PREFIX} {hash_code}')
             output_number += 1
     return output_number
 
@@ -124,10 +386,70 @@ class OutputPosition:
     testname: str
     output_number: int
 
-    def encode(self, output):
+    def encode(self, output, kdf: KeyDerivation = SHA256):
         """Encode an output as a cryptographic hash value."""
-        hash_input = f"{self.testname}:{self.output_number}:{output}"
-        return hashlib.sha256(bytes(hash_input, 'UTF-8')).hexdigest()[:16]
+        return kdf.derive(f"{self.testname}:{self.output_number}:{output}")
+
+
+def has_locked_outputs(dtest: doctest.DocTest) -> bool:
+    """Whether any example of a doctest has a locked output."""
+    return any(LOCKED_PREFIX in example.want for example in dtest.examples)
+
+
+def locked_positions(dtest: doctest.DocTest):
+    """Yield the output number and hash code of each locked output of a doctest."""
+    output_number = 0  # Global counter across all examples in this doctest
+    for example in dtest.examples:
+        for line in example.want.split('\n'):
+            if line.strip():
+                expected_hash = locked_hash(line)
+                if expected_hash:
+                    yield output_number, expected_hash
+                output_number += 1
+
+
+def unlock_from_answers(items: list[pytest.Item], answers: dict, keys: dict[str, str],
+                        logger=None) -> tuple[int, list[tuple[str, int]]]:
+    """Unlock the locked outputs of doctests among Pytest test items using answers,
+    which maps the name of each doctest to its outputs, either as a list in order
+    or as a dict keyed by output number. A missing or blank output is skipped.
+
+    All attempts are logged at once. Return the number of outputs unlocked and
+    the (name, output_number) of each output that is still locked."""
+    unlocked = 0
+    remaining = []
+    attempts = []
+    kdfs = {}  # The KDF of each file, read from its header
+    for item in items:
+        if not isinstance(item, pytest.DoctestItem) or not has_locked_outputs(item.dtest):
+            continue
+        if item.path not in kdfs:
+            kdfs[item.path] = read_key_derivation(item.path)
+        testname = item.dtest.name.split('.')[-1]
+        outputs = answers.get(testname)
+        for output_number, expected_hash in locked_positions(item.dtest):
+            if expected_hash in keys:
+                continue
+            if isinstance(outputs, list):
+                guess = outputs[output_number] if output_number < len(outputs) else None
+            elif isinstance(outputs, dict):
+                guess = outputs.get(output_number, outputs.get(str(output_number)))
+            else:
+                guess = None
+            guess = None if guess is None else str(guess).strip()
+            if not guess:
+                remaining.append((testname, output_number))
+                continue
+            success = OutputPosition(testname, output_number).encode(guess, kdfs[item.path]) == expected_hash
+            attempts.append((testname, output_number, guess, success))
+            if success:
+                keys[expected_hash] = guess
+                unlocked += 1
+            else:
+                remaining.append((testname, output_number))
+    if logger and attempts:
+        logger.unlock_attempts(attempts)
+    return unlocked, remaining
 
 
 def run_unlock_interactive(items: list[pytest.Item], keys: dict[str, str], logger=None):
@@ -138,13 +460,17 @@ def run_unlock_interactive(items: list[pytest.Item], keys: dict[str, str], logge
         print("No locked tests found.")
         return
     print(UNLOCK_PREAMBLE)
+    kdfs = {}  # The KDF of each file, read from its header
     for item in locked_items:
-        if not unlock_doctest(item.dtest, keys, logger):
+        if item.path not in kdfs:
+            kdfs[item.path] = read_key_derivation(item.path)
+        if not unlock_doctest(item.dtest, keys, logger, kdfs[item.path]):
             return
     print("=== 🎉 All tests unlocked! 🎉 ===")
 
 
-def unlock_doctest(dtest: doctest.DocTest, keys: dict[str, str], logger=None):
+def unlock_doctest(dtest: doctest.DocTest, keys: dict[str, str], logger=None,
+                   kdf: KeyDerivation = SHA256):
     """Unlock all locked outputs of a doctest interactively."""
     output_number = 0  # Global counter across all examples in this doctest
     testname = dtest.name.split('.')[-1]
@@ -162,7 +488,7 @@ def unlock_doctest(dtest: doctest.DocTest, keys: dict[str, str], logger=None):
                     prompt = "?"
                     if len(output_lines) > 1:
                         prompt = f"(line {k+1} of {len(output_lines)}) ?"
-                    output_str = unlock_output(example, position, expected_hash, prompt, logger)
+                    output_str = unlock_output(example, position, expected_hash, prompt, logger, kdf)
                     if output_str is None:  # User chose to exit
                         return False
                     keys[expected_hash] = output_str
@@ -173,7 +499,7 @@ def unlock_doctest(dtest: doctest.DocTest, keys: dict[str, str], logger=None):
     return True
 
 
-def unlock_output(example, output_pos, expected_hash, prompt, logger=None):
+def unlock_output(example, output_pos, expected_hash, prompt, logger=None, kdf: KeyDerivation = SHA256):
     """Interactively unlock a single output. Return the output, or None to exit."""
     while True:
         try:
@@ -184,7 +510,7 @@ def unlock_output(example, output_pos, expected_hash, prompt, logger=None):
                 return None
 
             # Check if the input matches the hash
-            input_hash = output_pos.encode(user_input)
+            input_hash = output_pos.encode(user_input, kdf)
             if input_hash == expected_hash:
                 return user_input
             else:
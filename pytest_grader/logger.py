@@ -2,33 +2,212 @@
 Logging that tracks a student's progress through an assignment.
 """
 
+import atexit
+import difflib
+import itertools
+import json
+import lzma
+import pickle
 import sqlite3
 import hashlib
 import os
+import time
+import zlib
+
+
+JOURNAL_MODES = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off')
+SYNCHRONOUS_LEVELS = ('off', 'normal', 'full', 'extra')
+HASH_CHUNK_SIZE = 1 << 20  # characters
+RACY_WINDOW_NS = 2 * 10**9  # coarsest common file system timestamp resolution
+FILE_STORAGE_MODES = ('plain', 'compressed', 'delta')
+CODECS = {'zlib': zlib, 'lzma': lzma}
+PRUNED = 'pruned'  # The codec of a file version whose content was removed by compact()
+DEFAULT_RESPONSE_LIMIT = 2000  # characters
+CONF_HASH_KEY = '_assignment_sha1'  # The conf key of the hash of the stored configuration
+
+
+def file_sha1(filename: str) -> str:
+    """The SHA-1 hash of a text file's UTF-8 content, read in chunks.
+
+    The file is read in text mode so that the hash matches the content stored
+    in the files table."""
+    sha1 = hashlib.sha1()
+    with open(filename, 'r', encoding='utf-8') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), ''):
+            sha1.update(chunk.encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def stored_conf(db: str, conf_hash: str) -> dict | None:
+    """The assignment configuration stored in a grader database by
+    SQLLogger.store_conf(), if its source has the hash conf_hash.
+
+    The database is only read, and None is returned if it doesn't exist or
+    stores another configuration."""
+    try:
+        conn = sqlite3.connect(f'file:{db}?mode=ro', uri=True)
+    except sqlite3.Error:
+        return None
+    try:
+        conf = {key: pickle.loads(value) for key, value in conn.execute('SELECT key, value FROM conf')}
+    except sqlite3.Error:  # e.g. not a grader database, or created before the conf table
+        return None
+    finally:
+        conn.close()
+    if conf.pop(CONF_HASH_KEY, None) != conf_hash:
+        return None
+    return conf
+
+
+def truncate_middle(text: str, limit: int) -> str:
+    """Shorten text to about limit characters by removing its middle, keeping
+    the start and the end (where a traceback's error usually is)."""
+    if len(text) <= limit:
+        return text
+    head = limit // 2
+    tail = limit - head
+    return f"{text[:head]}\n... [{len(text) - limit} characters truncated] ...\n{text[len(text) - tail:]}"
+
+
+def line_delta(base: str, content: str) -> list:
+    """Instructions that rebuild content from base, line by line.
+
+    Each instruction is either a [start, end] pair, which copies lines
+    start:end of base, or a string, which is inserted as is."""
+    base_lines = base.splitlines(keepends=True)
+    lines = content.splitlines(keepends=True)
+    delta = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, base_lines, lines).get_opcodes():
+        if tag == 'equal':
+            delta.append([i1, i2])
+        elif j2 > j1:
+            delta.append(''.join(lines[j1:j2]))
+    return delta
+
+
+def apply_delta(base: str, delta: list) -> str:
+    """Rebuild content from base and the instructions returned by line_delta."""
+    base_lines = base.splitlines(keepends=True)
+    return ''.join(''.join(base_lines[op[0]:op[1]]) if isinstance(op, list) else op
+                   for op in delta)
 
 
 class SQLLogger:
-    """Logs progress through an assignment to a SQLite database."""
+    """Logs progress through an assignment to a SQLite database.
+
+    By default every row is committed as soon as it is logged. Setting
+    `log_batch_size` (and optionally `log_flush_interval`, in seconds) in the
+    assignment configuration buffers rows in memory instead, writing them in a
+    single transaction when the batch is full, when the interval has passed,
+    on flush(), or when the interpreter exits.
+
+    File versions are stored as plain text unless `file_storage` is
+    `compressed` (each version compressed with `file_compression`, zlib by
+    default) or `delta` (each version stored as a compressed line diff against
+    the previous version of the same file, with a full version every
+    `keyframe_interval` versions). Use get_file() to read any version.
+
+    The response of a test case, such as its failure message, is truncated
+    to `response_limit` characters and stored once in the responses table,
+    compressed with `file_compression`, however many test cases share it.
+    Use get_response() to read it."""
 
     def __init__(self, db: str, conf: dict[str, str]):
         self.db_path = db
         self.conf = conf
         self.current_snapshot = None
+        self.batch_size = conf.get('log_batch_size') or 1
+        self.flush_interval = conf.get('log_flush_interval')
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.file_storage = conf.get('file_storage') or 'plain'
+        self.compression = conf.get('file_compression') or 'zlib'
+        self.keyframe_interval = conf.get('keyframe_interval') or 10
+        self.response_limit = conf.get('response_limit', DEFAULT_RESPONSE_LIMIT)
+        self.stored_responses = set()  # Hashes of responses stored by this logger
+        if self.file_storage not in FILE_STORAGE_MODES:
+            raise ValueError(f"Invalid file_storage '{self.file_storage}'; "
+                             f"expected one of {', '.join(FILE_STORAGE_MODES)}")
+        if self.compression not in CODECS:
+            raise ValueError(f"Invalid file_compression '{self.compression}'; "
+                             f"expected one of {', '.join(CODECS)}")
         self.conn = sqlite3.connect(self.db_path)
         self.cursor = self.conn.cursor()
+        self._configure_connection()
         self._setup_db()
+        if self.buffered:
+            atexit.register(self.flush)
+
+    @property
+    def buffered(self) -> bool:
+        """Whether rows are queued in memory rather than committed one at a time."""
+        return self.batch_size > 1
+
+    def _configure_connection(self):
+        """Apply the journal_mode and synchronous pragmas from the assignment configuration."""
+        for pragma, allowed in [('journal_mode', JOURNAL_MODES), ('synchronous', SYNCHRONOUS_LEVELS)]:
+            value = self.conf.get(pragma)
+            if value is None:
+                continue
+            if str(value).lower() not in allowed:
+                raise ValueError(f"Invalid {pragma} '{value}'; expected one of {', '.join(allowed)}")
+            self.cursor.execute(f'PRAGMA {pragma} = {str(value).lower()}').fetchall()
+
+    # Each migration upgrades the schema by one version, and runs only once per
+    # database. Databases created before schema versioning may have any earlier
+    # layout, so the first migration creates any missing tables and columns.
+    # Later schema changes need a new migration rather than a change to these.
+    MIGRATIONS = ['_create_tables', '_add_indexes', '_move_responses', '_add_cache_summaries',
+                  '_move_unlock_keys']
 
     def _setup_db(self):
-        """Set up the database tables."""
+        """Apply the migrations that the database has not had yet."""
+        if self._schema_version() >= len(self.MIGRATIONS):
+            return
+        # Lock the database, so that only one process applies each migration.
+        self.cursor.execute('BEGIN IMMEDIATE')
+        try:
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    applied DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            for version in range(self._schema_version() + 1, len(self.MIGRATIONS) + 1):
+                getattr(self, self.MIGRATIONS[version - 1])()
+                self.cursor.execute('INSERT INTO schema_migrations (version) VALUES (?)', (version,))
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def _schema_version(self) -> int:
+        """The number of migrations applied to the database."""
+        try:
+            return self.cursor.execute('SELECT MAX(version) FROM schema_migrations').fetchone()[0] or 0
+        except sqlite3.OperationalError:  # Created before schema versioning, or new
+            return 0
+
+    def _create_tables(self):
+        """Migration 1: create the tables, adding columns missing from older layouts."""
         # Files table to store file snapshots
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS files (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 filename TEXT NOT NULL,
                 content TEXT NOT NULL,
-                sha1_hash TEXT NOT NULL UNIQUE
+                sha1_hash TEXT NOT NULL UNIQUE,
+                codec TEXT,
+                base_sha1 TEXT,
+                depth INTEGER NOT NULL DEFAULT 0
             )
         ''')
+        # Databases created before compressed storage lack its columns.
+        self._add_missing_columns('files', {
+            'codec': 'TEXT',
+            'base_sha1': 'TEXT',
+            'depth': 'INTEGER NOT NULL DEFAULT 0',
+        })
 
         # Snapshots table to track when snapshots were taken
         self.cursor.execute('''
@@ -48,6 +227,21 @@ class SQLLogger:
                 FOREIGN KEY (snapshot_id) REFERENCES snapshots (id)
             )
         ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS snapshot_files_snapshot ON snapshot_files (snapshot_id)
+        ''')
+
+        # Index of the size, modification time, and inode of each included
+        # file when it was last hashed, so that unchanged files aren't re-read
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS snapshot_index (
+                filename TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                sha1_hash TEXT NOT NULL
+            )
+        ''')
 
         # Test cases table
         self.cursor.execute('''
@@ -57,10 +251,66 @@ class SQLLogger:
                 name TEXT NOT NULL,
                 passed BOOLEAN NOT NULL,
                 response TEXT,
+                duration REAL,
+                cpu_time REAL,
+                rss_delta INTEGER,
+                memory_peak INTEGER,
+                profile TEXT,
+                response_sha1 TEXT,
                 FOREIGN KEY (snapshot_id) REFERENCES snapshots (id)
             )
         ''')
 
+        # The responses of test cases, each stored once (possibly compressed)
+        # and referred to by test_cases.response_sha1
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                sha1_hash TEXT PRIMARY KEY,
+                content BLOB NOT NULL,
+                codec TEXT
+            )
+        ''')
+        self._add_missing_columns('test_cases', {
+            'duration': 'REAL',
+            'cpu_time': 'REAL',
+            'rss_delta': 'INTEGER',
+            'memory_peak': 'INTEGER',
+            'profile': 'TEXT',
+            'response_sha1': 'TEXT',
+        })
+        # A test's history is looked up by name, across snapshots
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS test_cases_name_snapshot ON test_cases (name, snapshot_id)
+        ''')
+
+        # The outcome of each test when it last ran, keyed by the hash of the
+        # code it depends on, so that it can be reused while that is unchanged
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS test_cache (
+                nodeid TEXT PRIMARY KEY,
+                dependency_hash TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                message TEXT
+            )
+        ''')
+
+        # The functions each test executed, with a hash of each function's AST
+        # when it ran, for --grader-trace
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS test_functions (
+                nodeid TEXT NOT NULL,
+                function TEXT NOT NULL,
+                ast_hash TEXT NOT NULL,
+                PRIMARY KEY (nodeid, function)
+            )
+        ''')
+
+        # The assignment configuration, laid out like a SqliteDict (pickled
+        # values), which earlier versions used to store it
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS conf (key TEXT PRIMARY KEY, value BLOB)
+        ''')
+
         # Unlock attempts table
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS unlock_attempts (
@@ -74,56 +324,429 @@ class SQLLogger:
             )
         ''')
 
-        self.conn.commit()
+    def _add_indexes(self):
+        """Migration 2: index the columns that readers look up rows by."""
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS test_cases_snapshot ON test_cases (snapshot_id)')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS unlock_attempts_name ON unlock_attempts (name)')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS unlock_attempts_snapshot ON unlock_attempts (snapshot_id)')
 
-    def _execute_and_commit(self, query, params=()):
-        """Execute a query and commit the transaction."""
-        self.cursor.execute(query, params)
-        self.conn.commit()
+    def _move_responses(self):
+        """Migration 3: move the responses that earlier versions stored in
+        test_cases.response into the responses table, and drop that column."""
+        rows = self.cursor.execute('''
+            SELECT id, response FROM test_cases WHERE response IS NOT NULL AND response_sha1 IS NULL
+        ''').fetchall()
+        responses = {}
+        updates = []
+        for test_case_id, response in rows:
+            sha1_hash, content, codec = self._encode_response(response)
+            responses[sha1_hash] = (sha1_hash, content, codec)
+            updates.append((sha1_hash, test_case_id))
+        self.cursor.executemany('INSERT OR IGNORE INTO responses (sha1_hash, content, codec) VALUES (?, ?, ?)',
+                                responses.values())
+        self.cursor.executemany('UPDATE test_cases SET response_sha1 = ? WHERE id = ?', updates)
+        if sqlite3.sqlite_version_info >= (3, 35, 0):
+            self.cursor.execute('ALTER TABLE test_cases DROP COLUMN response')
+        else:  # SQLite can't drop columns before 3.35
+            self.cursor.execute('UPDATE test_cases SET response = NULL')
+
+    def _add_cache_summaries(self):
+        """Migration 4: store the one-line summary of each cached failure, which
+        the short test summary shows when the failure is replayed."""
+        self._add_missing_columns('test_cache', {'summary': 'TEXT'})
+
+    def _move_unlock_keys(self):
+        """Migration 5: create the unlocked_outputs table of UnlockKeys, and move
+        the keys that earlier versions stored in the pickled unlock_keys table of
+        a SqliteDict into it."""
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS unlocked_outputs (
+                hash_code TEXT PRIMARY KEY,
+                output TEXT NOT NULL
+            )
+        ''')
+        if self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'unlock_keys'").fetchone():
+            rows = self.cursor.execute('SELECT key, value FROM unlock_keys').fetchall()
+            # Keys already in the new table were stored later, so they take precedence.
+            self.cursor.executemany('INSERT OR IGNORE INTO unlocked_outputs (hash_code, output) VALUES (?, ?)',
+                                    [(hash_code, pickle.loads(value)) for hash_code, value in rows])
+            self.cursor.execute('DROP TABLE unlock_keys')
+
+    def _add_missing_columns(self, table: str, columns: dict[str, str]):
+        """Add any of the given columns (name: declaration) that a table lacks."""
+        existing = {row[1] for row in self.cursor.execute(f'PRAGMA table_info({table})')}
+        for name, declaration in columns.items():
+            if name not in existing:
+                self.cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {declaration}')
+
+    def store_conf(self, conf: dict, conf_hash: str):
+        """Store an assignment configuration, identified by a hash of its source,
+        in the conf table, unless it is the configuration already stored."""
+        row = self.cursor.execute('SELECT value FROM conf WHERE key = ?', (CONF_HASH_KEY,)).fetchone()
+        if row is not None and pickle.loads(row[0]) == conf_hash:
+            return
+        with self.conn:
+            # Keys removed from the configuration are removed from the table too,
+            # so that stored_conf() reads back exactly this configuration.
+            self.cursor.execute('DELETE FROM conf')
+            self.cursor.executemany('INSERT INTO conf (key, value) VALUES (?, ?)',
+                                    [(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                                     for key, value in {**conf, CONF_HASH_KEY: conf_hash}.items()])
+
+    def _write(self, query, params=()):
+        """Execute a query and commit it, or queue it if logging is buffered."""
+        self._write_all([(query, params)])
+
+    def _write_all(self, statements: list[tuple[str, tuple]]):
+        """Execute (query, params) statements and commit them together, or queue
+        them if logging is buffered, so that they are flushed in one transaction."""
+        if not self.buffered:
+            with self.conn:
+                for query, rows in itertools.groupby(statements, key=lambda row: row[0]):
+                    self.cursor.executemany(query, [params for _, params in rows])
+            return
+        self.pending.extend(statements)
+        interval_passed = (self.flush_interval is not None
+                           and time.monotonic() - self.last_flush >= self.flush_interval)
+        if len(self.pending) >= self.batch_size or interval_passed:
+            self.flush()
+
+    def flush(self):
+        """Write all queued rows in a single transaction."""
+        if self.pending:
+            with self.conn:
+                # Consecutive rows for the same table share one executemany call.
+                for query, rows in itertools.groupby(self.pending, key=lambda row: row[0]):
+                    self.cursor.executemany(query, [params for _, params in rows])
+            self.pending.clear()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        """Flush any queued rows and close the database connection."""
+        self.flush()
+        if self.buffered:
+            atexit.unregister(self.flush)
+        self.conn.close()
+
+    def compact(self, keep_versions: int | None = None) -> dict[str, int]:
+        """Shrink the database: merge each snapshot into the previous one if their
+        files are identical and each test outcome in it occurred in the previous
+        one too, remove the content (but not the hash) of all but the
+        newest keep_versions versions of each file if keep_versions is given,
+        rebuild the indexes, and vacuum. Return the number of snapshots merged
+        and file versions pruned."""
+        if keep_versions is not None and keep_versions < 1:
+            raise ValueError("keep_versions must be at least 1")
+        self.flush()
+        files = {}
+        for snapshot_id, filename, sha1_hash in self.conn.execute(
+                'SELECT snapshot_id, filename, sha1_hash FROM snapshot_files'):
+            files.setdefault(snapshot_id, set()).add((filename, sha1_hash))
+        outcomes = {}
+        for snapshot_id, name, passed in self.conn.execute('SELECT snapshot_id, name, passed FROM test_cases'):
+            outcomes.setdefault(snapshot_id, set()).add((name, bool(passed)))
+        merged = []  # (snapshot_id, the earlier snapshot_id it merges into)
+        kept = None
+        for (snapshot_id,) in self.conn.execute('SELECT id FROM snapshots ORDER BY id').fetchall():
+            # A snapshot in which a test first ran or changed outcome is kept, so
+            # that merging doesn't move when that happened to an earlier snapshot.
+            if (kept is not None and files.get(snapshot_id, set()) == files.get(kept, set())
+                    and outcomes.get(snapshot_id, set()) <= outcomes.get(kept, set())):
+                merged.append((snapshot_id, kept))
+            else:
+                kept = snapshot_id
+
+        pruned = []
+        if keep_versions is not None:
+            versions = {}  # The versions of each file, newest first
+            bases = {}
+            for filename, sha1_hash, base_sha1, codec in self.conn.execute(
+                    'SELECT filename, sha1_hash, base_sha1, codec FROM files ORDER BY id DESC'):
+                versions.setdefault(filename, []).append((sha1_hash, codec))
+                bases[sha1_hash] = base_sha1
+            # Keep the files of the last snapshot, and the versions that deltas are based on.
+            keep = {sha1_hash for _, sha1_hash in files.get(kept, ())}
+            keep.update(sha1_hash for file_versions in versions.values()
+                        for sha1_hash, _ in file_versions[:keep_versions])
+            for sha1_hash in list(keep):
+                while bases.get(sha1_hash) is not None:
+                    sha1_hash = bases[sha1_hash]
+                    keep.add(sha1_hash)
+            pruned = [sha1_hash for file_versions in versions.values()
+                      for sha1_hash, codec in file_versions if sha1_hash not in keep and codec != PRUNED]
+
+        with self.conn:
+            self.cursor.execute('CREATE TEMP TABLE merged_snapshots (id INTEGER PRIMARY KEY, kept INTEGER)')
+            self.cursor.executemany('INSERT INTO merged_snapshots (id, kept) VALUES (?, ?)', merged)
+            for table in ('test_cases', 'unlock_attempts'):
+                self.cursor.execute(f'''
+                    UPDATE {table} SET snapshot_id = (SELECT kept FROM merged_snapshots
+                                       WHERE merged_snapshots.id = {table}.snapshot_id)
+                    WHERE snapshot_id IN (SELECT id FROM merged_snapshots)
+                ''')
+            self.cursor.execute('DELETE FROM snapshot_files WHERE snapshot_id IN (SELECT id FROM merged_snapshots)')
+            self.cursor.execute('DELETE FROM snapshots WHERE id IN (SELECT id FROM merged_snapshots)')
+            self.cursor.execute('DROP TABLE merged_snapshots')
+            self.cursor.executemany(
+                'UPDATE files SET content = ?, codec = ?, base_sha1 = NULL, depth = 0 WHERE sha1_hash = ?',
+                [(b'', PRUNED, sha1_hash) for sha1_hash in pruned])
+        self.cursor.execute('REINDEX')
+        self.cursor.execute('ANALYZE')
+        self.cursor.execute('VACUUM')
+        self.cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()  # Shrink any write-ahead log
+        return {'merged_snapshots': len(merged), 'pruned_versions': len(pruned)}
 
     def snapshot(self):
         """Store assignment code used for this test."""
-        # Create a new snapshot record
-        self._execute_and_commit('INSERT INTO snapshots DEFAULT VALUES')
+        # Create a new snapshot record. The snapshot and its files are written
+        # immediately, in one transaction, so that later rows can refer to it.
+        self.cursor.execute('INSERT INTO snapshots DEFAULT VALUES')
         snapshot_id = self.cursor.lastrowid
         self.current_snapshot = snapshot_id
 
-        # Process each included file
+        # Hash the included files, skipping any whose size, modification time,
+        # and inode match the index from an earlier snapshot.
+        index = {row[0]: row[1:] for row in self.cursor.execute(
+            'SELECT filename, size, mtime_ns, inode, sha1_hash FROM snapshot_index')}
+        snapshot_files = []
+        index_rows = []
+        now_ns = time.time_ns()
         for filename in self.conf.get('included_files', []):
-            if os.path.exists(filename):
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                continue
+            key = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            cached = index.get(filename)
+            if cached is not None and tuple(cached[:3]) == key:
+                sha1_hash = cached[3]
+            else:
+                sha1_hash = file_sha1(filename)
+                # A file modified within the timestamp granularity of the file
+                # system could change again without changing its mtime.
+                if now_ns - stat.st_mtime_ns > RACY_WINDOW_NS:
+                    index_rows.append((filename, *key, sha1_hash))
+            snapshot_files.append((filename, sha1_hash))
+
+        # Read the content of files only for versions not yet stored
+        known = self._stored_hashes({sha1_hash for _, sha1_hash in snapshot_files})
+        new_files = []
+        for i, (filename, sha1_hash) in enumerate(snapshot_files):
+            if sha1_hash not in known:
                 with open(filename, 'r', encoding='utf-8') as f:
                     content = f.read()
-
-                # Calculate SHA-1 hash
+                # Hash the content that is stored, in case the file just changed
                 sha1_hash = hashlib.sha1(content.encode('utf-8')).hexdigest()
+                snapshot_files[i] = (filename, sha1_hash)
+                new_files.append((filename, *self._encode_file(filename, content), sha1_hash))
+                known.add(sha1_hash)
+
+        self.cursor.executemany('''
+            INSERT INTO files (filename, content, codec, base_sha1, depth, sha1_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (sha1_hash) DO UPDATE SET
+                content = excluded.content, codec = excluded.codec,
+                base_sha1 = excluded.base_sha1, depth = excluded.depth
+            WHERE files.codec = ?
+        ''', [(*row, PRUNED) for row in new_files])
+        # Always record which files were part of this snapshot
+        self.cursor.executemany('''
+            INSERT INTO snapshot_files (snapshot_id, filename, sha1_hash)
+            VALUES (?, ?, ?)
+        ''', [(snapshot_id, filename, sha1_hash) for filename, sha1_hash in snapshot_files])
+        self.cursor.executemany('''
+            INSERT OR REPLACE INTO snapshot_index (filename, size, mtime_ns, inode, sha1_hash)
+            VALUES (?, ?, ?, ?, ?)
+        ''', index_rows)
+        self.conn.commit()
+
+    def _encode_file(self, filename: str, content: str) -> tuple:
+        """Return the (content, codec, base_sha1, depth) to store for a new file version."""
+        if self.file_storage == 'plain':
+            return content, None, None, 0
+        codec = CODECS[self.compression]
+        full = codec.compress(content.encode('utf-8'))
+        if self.file_storage == 'delta':
+            previous = self.conn.execute(
+                'SELECT sha1_hash, depth FROM files WHERE filename = ? AND codec IS NOT ? '
+                'ORDER BY id DESC LIMIT 1', (filename, PRUNED)).fetchone()
+            if previous is not None and previous[1] + 1 < self.keyframe_interval:
+                delta = line_delta(self.get_file(previous[0]), content)
+                compressed_delta = codec.compress(json.dumps(delta).encode('utf-8'))
+                if len(compressed_delta) < len(full):
+                    return compressed_delta, self.compression, previous[0], previous[1] + 1
+        return full, self.compression, None, 0
+
+    def get_file(self, sha1_hash: str) -> str | None:
+        """Return the content of the stored file version with a hash, or None if there
+        is none or its content was pruned."""
+        deltas = []
+        while True:
+            row = self.conn.execute('SELECT content, codec, base_sha1 FROM files WHERE sha1_hash = ?',
+                                    (sha1_hash,)).fetchone()
+            if row is None:
+                if deltas:
+                    raise ValueError(f"File version {sha1_hash} is missing from {self.db_path}")
+                return None
+            content, codec, base_sha1 = row
+            if codec == PRUNED:
+                if deltas:
+                    raise ValueError(f"File version {sha1_hash} was pruned from {self.db_path}")
+                return None
+            if codec is not None:
+                content = CODECS[codec].decompress(content).decode('utf-8')
+            if base_sha1 is None:
+                break
+            deltas.append(json.loads(content))
+            sha1_hash = base_sha1
+        for delta in reversed(deltas):
+            content = apply_delta(content, delta)
+        return content
+
+    def _stored_hashes(self, hashes: set[str]) -> set[str]:
+        """Return the subset of hashes whose file content is already stored (and
+        not pruned by compact())."""
+        hashes = sorted(hashes)
+        stored = set()
+        # Query in chunks to stay under SQLite's limit on bound parameters.
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            stored.update(row[0] for row in self.cursor.execute(
+                f'SELECT sha1_hash FROM files WHERE sha1_hash IN ({placeholders}) AND codec IS NOT ?',
+                [*chunk, PRUNED]))
+        return stored
+
+    def test_case(self, name, passed: bool, response: str | None = None, duration: float | None = None,
+                  cpu_time: float | None = None, rss_delta: int | None = None,
+                  memory_peak: int | None = None, profile: str | None = None):
+        """Store the response (such as a failure message), result, and running time
+        (in seconds) of a test case, along with its CPU time (in seconds), the
+        growth of its process's peak resident set size (in kilobytes), its peak
+        Python memory allocation (in bytes), and a JSON profile of the
+        functions it spent the most time in."""
+        response_sha1 = None if response is None else self._store_response(response)
+        self._write('''
+            INSERT INTO test_cases (snapshot_id, name, passed, response_sha1, duration,
+                                    cpu_time, rss_delta, memory_peak, profile)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (self.current_snapshot, name, passed, response_sha1, duration,
+              cpu_time, rss_delta, memory_peak, profile))
+
+    def _store_response(self, response: str) -> str | None:
+        """Store a truncated response unless it is already stored, and return its
+        hash, or None if responses are not stored."""
+        if not self.response_limit:
+            return None
+        response = truncate_middle(response, self.response_limit)
+        sha1_hash = hashlib.sha1(response.encode('utf-8')).hexdigest()
+        if sha1_hash not in self.stored_responses:
+            self._write('INSERT OR IGNORE INTO responses (sha1_hash, content, codec) VALUES (?, ?, ?)',
+                        self._encode_response(response))
+            self.stored_responses.add(sha1_hash)
+        return sha1_hash
+
+    def _encode_response(self, response: str) -> tuple[str, bytes, str | None]:
+        """The hash, content, and codec with which a response is stored."""
+        content = response.encode('utf-8')
+        sha1_hash = hashlib.sha1(content).hexdigest()
+        compressed = CODECS[self.compression].compress(content)
+        if len(compressed) < len(content):  # Short responses don't compress
+            return sha1_hash, compressed, self.compression
+        return sha1_hash, content, None
 
-                # Check if this hash already exists in the database
-                self.cursor.execute('SELECT id FROM files WHERE sha1_hash = ?', (sha1_hash,))
-                existing = self.cursor.fetchone()
-
-                if not existing:
-                    # Store the file content if hash doesn't exist
-                    self._execute_and_commit('''
-                        INSERT INTO files (filename, content, sha1_hash)
-                        VALUES (?, ?, ?)
-                    ''', (filename, content, sha1_hash))
-
-                # Always record which files were part of this snapshot
-                self._execute_and_commit('''
-                    INSERT INTO snapshot_files (snapshot_id, filename, sha1_hash)
-                    VALUES (?, ?, ?)
-                ''', (snapshot_id, filename, sha1_hash))
-
-    def test_case(self, name, passed: bool, response: str | None = None):
-        """Store the AI response and result of a test case."""
-        self._execute_and_commit('''
-            INSERT INTO test_cases (snapshot_id, name, passed, response)
-            VALUES (?, ?, ?, ?)
-        ''', (self.current_snapshot, name, passed, response))
+    def get_response(self, sha1_hash: str) -> str | None:
+        """Return the stored response with a hash, or None if there is none."""
+        self.flush()
+        row = self.conn.execute('SELECT content, codec FROM responses WHERE sha1_hash = ?',
+                                (sha1_hash,)).fetchone()
+        if row is None:
+            return None
+        content, codec = row
+        if codec is not None:
+            content = CODECS[codec].decompress(content)
+        return content.decode('utf-8')
+
+    def test_durations(self) -> dict[str, float]:
+        """The average running time of each test case that has been timed."""
+        return dict(self.conn.execute(
+            'SELECT name, AVG(duration) FROM test_cases WHERE duration IS NOT NULL GROUP BY name'))
+
+    def test_history(self) -> dict[str, tuple[bool, list[str] | None]]:
+        """For each test case logged in an earlier snapshot, whether it passed the
+        last time it ran, and the files that changed between the last snapshot in
+        which it passed and the current one (None if it has never passed)."""
+        # Runs are ordered by id, since a compacted database may have several
+        # runs of a test in one snapshot.
+        rows = self.conn.execute('''
+            SELECT runs.name, last_run.passed, last_pass.snapshot_id
+            FROM (SELECT name, MAX(id) AS last_run, MAX(CASE WHEN passed THEN id END) AS last_pass
+                  FROM test_cases WHERE snapshot_id IS NOT NULL GROUP BY name) runs
+            JOIN test_cases last_run ON last_run.id = runs.last_run
+            LEFT JOIN test_cases last_pass ON last_pass.id = runs.last_pass
+        ''').fetchall()
+        current = self._snapshot_files(self.current_snapshot)
+        changed = {}  # Many tests last passed in the same snapshot
+        history = {}
+        for name, passed, last_pass in rows:
+            if last_pass is not None and last_pass not in changed:
+                files = self._snapshot_files(last_pass)
+                changed[last_pass] = sorted(filename for filename in files.keys() | current.keys()
+                                            if files.get(filename) != current.get(filename))
+            history[name] = (bool(passed), changed.get(last_pass))
+        return history
+
+    def file_hashes(self) -> dict[str, str]:
+        """The hash of each file included in the current snapshot."""
+        return self._snapshot_files(self.current_snapshot)
+
+    def _snapshot_files(self, snapshot_id: int | None) -> dict[str, str]:
+        """The hash of each file included in a snapshot."""
+        return dict(self.conn.execute(
+            'SELECT filename, sha1_hash FROM snapshot_files WHERE snapshot_id = ?', (snapshot_id,)))
+
+    def cache_result(self, nodeid: str, dependency_hash: str, outcome: str, message: str | None = None,
+                     summary: str | None = None):
+        """Store the outcome (and failure message, with its one-line summary) of a
+        test for reuse by --grader-cache."""
+        self._write('''
+            INSERT OR REPLACE INTO test_cache (nodeid, dependency_hash, outcome, message, summary)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (nodeid, dependency_hash, outcome, message, summary))
+
+    def cached_results(self) -> dict[str, tuple[str, str, str | None, str | None]]:
+        """The (dependency_hash, outcome, message, summary) last stored for each test."""
+        return {row[0]: row[1:] for row in self.conn.execute(
+            'SELECT nodeid, dependency_hash, outcome, message, summary FROM test_cache')}
+
+    def traced_functions(self, nodeid: str, functions: dict[str, str] | None):
+        """Replace the functions (name: AST hash) that a test executed, or forget
+        them if functions is None."""
+        self._write_all([('DELETE FROM test_functions WHERE nodeid = ?', (nodeid,))] + [
+            ('INSERT INTO test_functions (nodeid, function, ast_hash) VALUES (?, ?, ?)',
+             (nodeid, function, ast_hash)) for function, ast_hash in (functions or {}).items()])
+
+    def test_functions(self) -> dict[str, dict[str, str]]:
+        """The functions (name: AST hash) that each test executed when it last ran."""
+        functions = {}
+        for nodeid, function, ast_hash in self.conn.execute(
+                'SELECT nodeid, function, ast_hash FROM test_functions'):
+            functions.setdefault(nodeid, {})[function] = ast_hash
+        return functions
 
     def unlock_attempt(self, name, output_number, guess, success: bool, response: str | None = None):
         """Store the AI response and result of an attempt to unlock a test case."""
-        self._execute_and_commit('''
+        self._write('''
             INSERT INTO unlock_attempts (snapshot_id, name, guess, success, response)
             VALUES (?, ?, ?, ?, ?)
-        ''', (self.current_snapshot, f"{name}[{output_number}]", guess, success, response))
\ No newline at end of file
+        ''', (self.current_snapshot, f"{name}[{output_number}]", guess, success, response))
+
+    def unlock_attempts(self, attempts: list[tuple[str, int, str, bool]]):
+        """Store many (name, output_number, guess, success) unlock attempts in one transaction."""
+        self.flush()  # Keep rows in the order they were logged
+        with self.conn:
+            self.cursor.executemany('''
+                INSERT INTO unlock_attempts (snapshot_id, name, guess, success)
+                VALUES (?, ?, ?, ?)
+            ''', [(self.current_snapshot, f"{name}[{output_number}]", guess, success)
+                  for name, output_number, guess, success in attempts])
\ No newline at end of file
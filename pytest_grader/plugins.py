@@ -1,31 +1,145 @@
+import cProfile
+import csv
+import functools
+import hashlib
 import importlib
+import inspect
+import io
+import json
+import os
+import pstats
+import signal
 import sys
+import threading
+import time
+import tracemalloc
+import warnings
 
 import pytest
-import yaml
 
-from .lock_tests import (LOCKED_PREFIX, locked_hash, replace_output,
-                         run_unlock_interactive, substitute_function_outputs)
-from .logger import SQLLogger
-from sqlitedict import SqliteDict
+from .lock_tests import (LOCKED_PREFIX, has_locked_outputs, locked_hash, replace_output,
+                         run_unlock_interactive, substitute_function_outputs, unlock_from_answers)
+from .isolation import ModuleSnapshot
+from .keys import UnlockKeys
+from .logger import SQLLogger, file_sha1, stored_conf
+from .sandbox import memory_limit_supported, run_in_fork
+from .tracing import MODULE_CODE, Tracer, index_functions
 
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
 
-def get_points(item: pytest.Item) -> int:
-    """The point value of a test item (0 unless assigned with @points)."""
+
+def get_test_attribute(item: pytest.Item, name: str, default=None):
+    """An attribute assigned to a test item by a decorator such as @points."""
     if isinstance(item, pytest.Function):
-        return getattr(item.function, 'points', 0)
+        return getattr(item.function, name, default)
     elif isinstance(item, pytest.DoctestItem):
-        # For doctests, points are assigned to the enclosing function
+        # For doctests, attributes are assigned to the enclosing function
         func_name = item.dtest.name.split('.')[-1]
         func = item.dtest.globs.get(func_name)
-        return getattr(func, 'points', 0)
-    return 0
+        return getattr(func, name, default)
+    return default
+
+
+def get_points(item: pytest.Item) -> int:
+    """The point value of a test item (0 unless assigned with @points)."""
+    return get_test_attribute(item, 'points', 0)
+
+
+def is_xdist_worker(config) -> bool:
+    """Whether this process is a pytest-xdist worker."""
+    return hasattr(config, 'workerinput')
+
+
+def is_xdist_controller(config) -> bool:
+    """Whether this process distributes tests to pytest-xdist workers."""
+    return getattr(config.option, 'dist', 'no') != 'no' and not is_xdist_worker(config)
+
+
+SCORE_FORMATS = ('table', 'jsonl', 'json', 'csv')
+SCORE_ORDERS = ('collection', 'points-per-second', 'failed-first')
+DEFAULT_DURATION = 1.0  # seconds, assumed for tests that have never been timed
+MIN_DURATION = 0.001  # seconds, so that very fast tests don't divide by zero
+OUT_OF_TIME = "Time budget exhausted"
+SCORE_FIELDS = ['type', 'nodeid', 'outcome', 'points', 'earned', 'duration']
+PROFILE_FUNCTIONS = 10  # The number of functions recorded by --grader-profile
+
+
+def score_record(report: pytest.TestReport, points: int) -> dict:
+    """A machine-readable record of a scored test."""
+    return {'type': 'test', 'nodeid': report.nodeid, 'outcome': report.outcome, 'points': points,
+            'earned': points if report.outcome == 'passed' else 0,
+            'duration': round(report.duration, 6)}
+
+
+class LazyLogger:
+    """Opens the grader database, and takes a snapshot of the code, when a
+    plugin first calls it, so that a run that logs nothing (e.g. -k selecting
+    no tests) doesn't write to the database. Later calls return the same logger."""
+
+    def __init__(self, db: str, conf: dict, conf_hash: str):
+        self.db = db
+        self.conf = conf
+        self.conf_hash = conf_hash
+        self.logger = None
+
+    def __call__(self) -> SQLLogger:
+        if self.logger is None:
+            logger = SQLLogger(self.db, self.conf)
+            # Store the configuration if it changed, for stored_conf() to read back
+            logger.store_conf(self.conf, self.conf_hash)
+            logger.snapshot()
+            self.logger = logger
+        return self.logger
 
 
 class ScorerPlugin:
-    def __init__(self):
+    def __init__(self, logger: LazyLogger | None = None, included_files: list[str] = ()):
+        self.logger = logger
+        self.included_files = {os.path.abspath(filename) for filename in included_files}
         self.points = {}
+        self.collection_index = {}
         self.test_results = []
+        self.score_format = 'table'
+        self.output = None
+        self.csv_writer = None
+        self.score_order = 'collection'
+        self.durations = {}
+        self.history = {}
+        self.time_budget = None
+        self.start_time = time.monotonic()
+
+    def pytest_configure(self, config):
+        self.score_format = config.getoption("--score-format")
+        self.score_order = config.getoption("--score-order")
+        self.time_budget = config.getoption("--time-budget")
+        if self.score_order == 'points-per-second':
+            if is_xdist_worker(config):
+                # Every worker must collect tests in the same order.
+                self.durations = config.workerinput.get('grader_durations', {})
+            elif self.logger is not None:
+                self.durations = self.logger().test_durations()
+        elif self.score_order == 'failed-first':
+            if is_xdist_worker(config):
+                self.history = config.workerinput.get('grader_history', {})
+            elif self.logger is not None:
+                self.history = self.logger().test_history()
+        output_path = config.getoption("--score-output")
+        # Under pytest-xdist, only the controller writes the score output.
+        if output_path and not is_xdist_worker(config):
+            self.output = open(output_path, 'w', newline='', encoding='utf-8')
+            if self.score_format == 'csv':
+                self.csv_writer = csv.DictWriter(self.output, SCORE_FIELDS)
+                self.csv_writer.writeheader()
+                self.output.flush()
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_configure_node(self, node):
+        # Send test history from the controller's database to pytest-xdist workers
+        node.workerinput['grader_durations'] = self.durations
+        node.workerinput['grader_history'] = self.history
 
     def pytest_collection_modifyitems(self, session, config, items):
         # Store points for all items during collection, before any can be skipped
@@ -34,28 +148,148 @@ class ScorerPlugin:
             if points > 0:
                 self.points[item.nodeid] = points
 
+        if self.score_order == 'points-per-second':
+            # Run the tests that earn the most points per second of past
+            # running time first, so that a time budget is spent well.
+            known = list(self.durations.values())
+            default = sum(known) / len(known) if known else DEFAULT_DURATION
+            def points_per_second(item):
+                duration = self.durations.get(item.nodeid.split("::")[-1], default)
+                return self.points.get(item.nodeid, 0) / max(duration, MIN_DURATION)
+            items.sort(key=points_per_second, reverse=True)
+        elif self.score_order == 'failed-first':
+            # The sort is stable, so each group keeps its collection order.
+            items.sort(key=self.history_rank)
+
+    def history_rank(self, item: pytest.Item) -> int:
+        """0 for a test that failed when it last ran or has never passed, 1 for
+        one whose source files changed since it last passed, and 2 otherwise."""
+        passed, changed = self.history.get(item.nodeid.split("::")[-1], (False, None))
+        if not passed or changed is None:
+            return 0
+        changed = {os.path.abspath(filename) for filename in changed}
+        # A test in an included file (e.g. a doctest) depends on that file;
+        # any other test may depend on any included file.
+        path = str(item.path)
+        sources = {path} if path in self.included_files else self.included_files
+        return 1 if changed & sources else 2
+
+    def pytest_sessionstart(self, session):
+        self.start_time = time.monotonic()
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_setup(self, item):
+        if self.time_budget is not None and time.monotonic() - self.start_time > self.time_budget:
+            pytest.skip(f"{OUT_OF_TIME} ({self.time_budget} seconds)")
+
+    def pytest_collection_finish(self, session):
+        self.collection_index = {item.nodeid: i for i, item in enumerate(session.items)}
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        # Reports carry their points and position so that a pytest-xdist
+        # controller, which collects nothing itself, can score them in order.
+        report = yield
+        report.grader_points = self.points.get(item.nodeid, 0)
+        report.grader_index = self.collection_index.get(item.nodeid, 0)
+        return report
+
     def pytest_runtest_logreport(self, report):
         if report.when == "call" or (report.when == "setup" and report.outcome == "skipped"):
+            if getattr(report, 'grader_points', 0) > 0:
+                self.points[report.nodeid] = report.grader_points
             self.test_results.append(report)
+            # Line-oriented formats are written as each result arrives, so that
+            # results can be consumed before the run finishes.
+            if self.output and self.score_format in ('jsonl', 'csv'):
+                self.write_record(score_record(report, self.points.get(report.nodeid, 0)))
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        if self.output:
+            if self.score_format in ('jsonl', 'csv'):
+                self.write_record(self.total_record())  # Test records were already written
+            else:
+                self.write_report(self.output)
+            self.output.close()
+            self.output = None
 
     def pytest_terminal_summary(self, terminalreporter, exitstatus, config):
-        if config.getoption("--score"):
-            self.write_score_report(terminalreporter.write_line)
+        if config.getoption("--score-output"):
+            return  # Written to the output file instead
+        if self.score_format == 'table':
+            if config.getoption("--score"):
+                self.write_score_report(terminalreporter.write_line)
+        else:
+            report = io.StringIO()
+            self.write_report(report)
+            for line in report.getvalue().splitlines():
+                terminalreporter.write_line(line)
+
+    def write_record(self, record: dict):
+        """Write one record to the score output file as a test finishes."""
+        if self.csv_writer:
+            self.csv_writer.writerow(record)
+        else:
+            self.output.write(json.dumps(record) + '\n')
+        self.output.flush()
+
+    def write_report(self, out):
+        """Write the complete score report to a text file in the chosen format."""
+        if self.score_format == 'table':
+            self.write_score_report(lambda line: out.write(line + '\n'))
+        elif self.score_format == 'json':
+            json.dump(self.score_document(), out, indent=2)
+            out.write('\n')
+        else:
+            document = self.score_document()
+            records = document['tests'] + [document['total']]
+            if self.score_format == 'jsonl':
+                out.writelines(json.dumps(record) + '\n' for record in records)
+            else:
+                writer = csv.DictWriter(out, SCORE_FIELDS)
+                writer.writeheader()
+                writer.writerows(records)
+
+    def ordered_reports(self) -> list[pytest.TestReport]:
+        """Reports of the tests that ran, in collection order."""
+        # Under pytest-xdist, reports arrive in the order that tests finish.
+        return sorted(self.test_results, key=lambda report: getattr(report, 'grader_index', 0))
+
+    def scored_reports(self) -> list[pytest.TestReport]:
+        """Reports of the tests that have points, in collection order."""
+        return [report for report in self.ordered_reports() if report.nodeid in self.points]
+
+    def score_records(self) -> list[dict]:
+        """A machine-readable record of every test that ran, including those worth 0 points."""
+        return [score_record(report, self.points.get(report.nodeid, 0)) for report in self.ordered_reports()]
+
+    def total_record(self) -> dict:
+        """A machine-readable record of the total score of the tests that ran."""
+        records = self.score_records()
+        return {'type': 'total', 'nodeid': '', 'outcome': '',
+                'points': sum(record['points'] for record in records),
+                'earned': sum(record['earned'] for record in records),
+                'duration': round(sum(record['duration'] for record in records), 6)}
+
+    def score_document(self) -> dict:
+        """All tests that ran and the total score, as a JSON-compatible dict."""
+        return {'tests': self.score_records(), 'total': self.total_record()}
 
     def write_score_report(self, write_line):
         total_earned = 0
         total_points = 0
 
         rows = []
-        for report in self.test_results:
-            if report.nodeid in self.points:
-                points = self.points[report.nodeid]
-                earned = points if report.outcome == 'passed' else 0
-                total_points += points
-                total_earned += earned
-                test_name = report.nodeid.split("::")[-1]
-                emoji = {'passed': '✅', 'skipped': '⏭️'}.get(report.outcome, '❌')
-                rows.append((emoji, test_name, str(earned), str(points)))
+        for report in self.scored_reports():
+            points = self.points[report.nodeid]
+            earned = points if report.outcome == 'passed' else 0
+            total_points += points
+            total_earned += earned
+            test_name = report.nodeid.split("::")[-1]
+            if getattr(report, 'grader_cached', False):
+                test_name += " (cached)"
+            emoji = {'passed': '✅', 'skipped': '⏭️'}.get(report.outcome, '❌')
+            rows.append((emoji, test_name, str(earned), str(points)))
 
         # Pad each column to its widest entry so that all the / marks line up.
         name_width = max((len(row[1]) for row in rows), default=0)
@@ -80,16 +314,30 @@ class ScorerPlugin:
         write_line('─' * rule_width)
         write_line(f"  {decoration}Total Score: {total_earned}/{total_points}"
                    f" ({percentage}%){decoration}")
+        out_of_time = sum(1 for report in self.test_results
+                          if report.skipped and OUT_OF_TIME in str(report.longrepr))
+        if out_of_time:
+            write_line(f"  {OUT_OF_TIME}: {out_of_time} tests were not run")
 
 
 class UnlockPlugin:
-    def __init__(self, keys: dict[str, str], logger: SQLLogger | None = None):
+    def __init__(self, keys, logger: LazyLogger | None = None):
         self.unlock_mode = False
-        self.keys = keys
+        self.answers_file = None
+        self.remaining = None  # The outputs still locked after unlocking from answers_file
+        self._keys = keys  # The unlocked outputs, or a function that loads them
         self.logger = logger
 
+    @property
+    def keys(self) -> dict[str, str]:
+        """The unlocked output for each hash code, loaded when first needed."""
+        if callable(self._keys):
+            self._keys = self._keys()
+        return self._keys
+
     def pytest_configure(self, config):
         self.unlock_mode = config.getoption("--unlock")
+        self.answers_file = config.getoption("--unlock-from")
 
     # trylast so that this runs after the hooks that deselect items for -k, -m,
     # and --deselect; otherwise items still holds every collected test.
@@ -101,15 +349,55 @@ class UnlockPlugin:
             if capmanager:
                 capmanager.suspend_global_capture(in_=True)
             try:
-                run_unlock_interactive(items, self.keys, self.logger)
+                run_unlock_interactive(items, self.keys, self.logger() if self.logger else None)
             finally:
+                self.flush_keys()
                 if capmanager:
                     capmanager.resume_global_capture()
+        elif self.answers_file:
+            self._unlock_from_answers(config, items)
+        elif any(isinstance(item, pytest.DoctestItem) and has_locked_outputs(item.dtest)
+                 for item in items):
+            # Load the keys before any test runs, rather than in each forked test process.
+            self.keys
+
+    def _unlock_from_answers(self, config, items):
+        """Unlock locked outputs with the answers in answers_file and report the rest."""
+        import yaml
+        try:
+            with open(self.answers_file, 'r', encoding='utf-8') as f:
+                # BaseLoader reads every output as written, rather than e.g. yes as True.
+                answers = yaml.load(f, Loader=yaml.BaseLoader) or {}
+        except (OSError, yaml.YAMLError) as e:
+            raise pytest.UsageError(f"Could not read answers from {self.answers_file}: {e}")
+        if not isinstance(answers, dict):
+            raise pytest.UsageError(f"{self.answers_file} should map test names to their outputs")
+        unlocked, self.remaining = unlock_from_answers(items, answers, self.keys,
+                                                       self.logger() if self.logger else None)
+        self.flush_keys()
+
+        reporter = config.pluginmanager.get_plugin('terminalreporter')
+        if reporter is None:
+            return
+        reporter.write_line(f"Unlocked {unlocked} outputs from {self.answers_file}")
+        if self.remaining:
+            still_locked = ', '.join(f"{name}[{n}]" for name, n in self.remaining)
+            reporter.write_line(f"Still locked: {still_locked}", yellow=True)
+
+    def pytest_unconfigure(self, config):
+        self.flush_keys()
+
+    def flush_keys(self):
+        """Write keys unlocked during this run to the grader database."""
+        # Keys that were never loaded have nothing to write.
+        if not callable(self._keys) and hasattr(self._keys, 'flush'):
+            self._keys.flush()
 
     def pytest_runtest_setup(self, item):
         if isinstance(item, pytest.DoctestItem):
             all_unlocked = True
             for example in item.dtest.examples:
+                # Only examples with locked outputs are split into lines.
                 if LOCKED_PREFIX in example.want:
                     all_unlocked = self._unlock_doctest_output(example) and all_unlocked
                 substitute_function_outputs(example)
@@ -141,27 +429,56 @@ class UnlockPlugin:
 
 
 class LoggerPlugin:
-    def __init__(self, logger: SQLLogger):
+    def __init__(self, logger: LazyLogger):
         self.logger = logger
+        self.previous_sigterm = None
 
     def pytest_configure(self, config):
-        # Take a snapshot of the code early, before any unlocking happens
-        self.logger.snapshot()
-
+        # Buffered rows are flushed at exit by the logger itself, but SIGTERM
+        # (e.g. from a timeout in an autograder) skips atexit handlers.
+        if threading.current_thread() is threading.main_thread():
+            self.previous_sigterm = signal.signal(signal.SIGTERM, self._exit_on_sigterm)
+
+    def _exit_on_sigterm(self, signum, frame):
+        # The handler may run while the logger is writing, so rather than flush
+        # here, it ends the session as pytest.exit() does, through
+        # pytest_sessionfinish and pytest_unconfigure, which flush. A second
+        # SIGTERM ends the process at once.
+        signal.signal(signum, self.previous_sigterm or signal.SIG_DFL)
+        pytest.exit(f"Terminated by signal {signum}", returncode=128 + signum)
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        if self.logger.logger is not None:
+            self.logger.logger.flush()
+
+    def pytest_unconfigure(self, config):
+        if self.previous_sigterm is not None:
+            signal.signal(signal.SIGTERM, self.previous_sigterm)
+        if self.logger.logger is not None:
+            self.logger.logger.close()
+
+    # tryfirst so that failures are logged before --first-failed-only removes their messages
+    @pytest.hookimpl(tryfirst=True)
     def pytest_runtest_logreport(self, report):
         # Log test cases when they complete (call phase)
         if report.when == "call":
             test_name = report.nodeid.split("::")[-1]
             passed = report.outcome == "passed"
-            response = None  # Could be enhanced to capture output/errors
-            self.logger.test_case(test_name, passed, response)
+            # The failure message, e.g. a doctest's expected and actual output
+            response = report.longreprtext if report.failed else None
+            # A cached result was not timed, so it doesn't count towards durations.
+            duration = None if getattr(report, 'grader_cached', False) else report.duration
+            self.logger().test_case(test_name, passed, response, duration,
+                                  **getattr(report, 'grader_resources', {}))
 
 
 class IsolationPlugin:
     """Isolate tests from each other's side effects."""
 
-    def __init__(self, reload_modules: list[str]):
+    def __init__(self, reload_modules: list[str], restore_modules: list[str] = ()):
         self.reload_modules = reload_modules
+        self.restore_modules = restore_modules
+        self.snapshots = {}
 
     def pytest_runtest_setup(self, item):
         # Reload the modules listed under reload_modules in grader.yaml so that
@@ -171,6 +488,21 @@ class IsolationPlugin:
             if module is not None:
                 importlib.reload(module)
 
+        # Modules listed under restore_modules are instead restored to their
+        # globals as they were before the first test, which avoids re-running
+        # expensive module-level code. They are reloaded only if a test changed
+        # an object in a way that restoring the globals would not undo.
+        for name in self.restore_modules:
+            module = sys.modules.get(name)
+            if module is None:
+                continue
+            snapshot = self.snapshots.get(name)
+            if snapshot is not None and snapshot.module is module and snapshot.restore():
+                continue
+            if snapshot is not None:
+                module = importlib.reload(module)
+            self.snapshots[name] = ModuleSnapshot(module)
+
         # Remove globals injected by pytest's assertion rewriting (@py_builtins,
         # @pytest_ar) so doctests that introspect their namespace don't see them.
         if isinstance(item, pytest.DoctestItem):
@@ -178,6 +510,279 @@ class IsolationPlugin:
                 del item.dtest.globs[name]
 
 
+class ForkPlugin:
+    """Run each test in a forked child process, so that no test can affect
+    another, and enforce time and memory limits."""
+
+    def __init__(self, timeout: float | None = None, memory_limit: int | None = None):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.memory_limit_warned = False
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        # Limits set with @timeout or @memory_limit override those in grader.yaml.
+        timeout = get_test_attribute(item, 'timeout', self.timeout)
+        memory_limit = get_test_attribute(item, 'memory_limit', self.memory_limit)
+        if memory_limit is not None and not self.memory_limit_warned and not memory_limit_supported():
+            self.memory_limit_warned = True
+            warnings.warn(pytest.PytestWarning(
+                "Memory limits are not enforced, since the size of a test's address space "
+                "is unknown on this platform"))
+        item.ihook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+        for report in run_in_fork(item, timeout, memory_limit):
+            item.ihook.pytest_runtest_logreport(report=report)
+        item.ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
+        return True
+
+
+class ResourcePlugin:
+    """Measure the CPU time and growth in peak memory use of each test, and with
+    profile, its peak Python memory allocation and the functions it spent the
+    most time in."""
+
+    def __init__(self, profile: bool = False):
+        self.profile = profile
+        self.resources = {}
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_runtest_call(self, item):
+        profiler = None
+        started_tracemalloc = False
+        if self.profile:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracemalloc = True
+            tracemalloc.reset_peak()
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # Another profiler (such as --grader-trace) is active
+                profiler = None
+        max_rss = _max_rss()
+        cpu_start = time.process_time()
+        try:
+            return (yield)
+        finally:
+            resources = {'cpu_time': time.process_time() - cpu_start}
+            if max_rss is not None:
+                resources['rss_delta'] = _max_rss() - max_rss
+            if profiler is not None:
+                profiler.disable()
+                resources['profile'] = _profile_summary(profiler)
+            if self.profile:
+                resources['memory_peak'] = tracemalloc.get_traced_memory()[1]
+                if started_tracemalloc:
+                    tracemalloc.stop()
+            self.resources[item.nodeid] = resources
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        # Under pytest-xdist or in a forked process, measurements travel with
+        # the report to the process that logs them.
+        report = yield
+        if call.when == "call":
+            resources = self.resources.pop(item.nodeid, None)
+            if resources is not None:
+                report.grader_resources = resources
+        return report
+
+
+def _max_rss() -> int | None:
+    """The peak resident set size of this process so far, in kilobytes."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss // 1024 if sys.platform == 'darwin' else max_rss  # bytes on macOS
+
+
+def _profile_summary(profiler: cProfile.Profile) -> str:
+    """A JSON list of the functions with the most cumulative time in a profile."""
+    stats = pstats.Stats(profiler).stats
+    top = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_FUNCTIONS]
+    return json.dumps([{'function': pstats.func_std_string(function), 'calls': calls,
+                        'cumulative_time': round(cumulative, 6)}
+                       for function, (_, calls, _, cumulative, _) in top])
+
+
+class CachePlugin:
+    """Reuse the outcome of a test whose code is unchanged since it last ran.
+
+    A test depends on every included file, the conftest.py files that apply to
+    it, and its own test file, or for a doctest of a function, the source of
+    that function instead of its file. With tracing, a test instead depends on
+    its conftest.py files, its own test file (or the source of its function),
+    and the functions of included files that it executed when it last ran,
+    along with the code outside of functions in those files. Other modules
+    that tests import are not covered unless they are included files."""
+
+    def __init__(self, logger: LazyLogger | None = None, trace: bool = False,
+                 included_files: list[str] = ()):
+        self.logger = logger
+        self.trace = trace
+        self.included_files = included_files
+        self.file_hashes = {}
+        self.path_hashes = {}  # The _path_hashes() of each test file, computed once per run
+        self.results = {}
+        self.keys = {}
+        self.function_hashes = {}
+        self.function_lines = {}
+        self.unchanged = set()  # Tests whose executed functions are unchanged
+        self.executed = {}
+
+    def pytest_configure(self, config):
+        if self.trace:
+            for filename in self.included_files:
+                if os.path.exists(filename):
+                    hashes, lines = index_functions(filename)
+                    self.function_hashes.update(hashes)
+                    self.function_lines[os.path.abspath(filename)] = lines
+        if is_xdist_worker(config):
+            self.file_hashes = config.workerinput.get('grader_file_hashes', {})
+            self.results = config.workerinput.get('grader_cache', {})
+            self.unchanged = set(config.workerinput.get('grader_unchanged', []))
+        elif self.logger is not None:
+            self.file_hashes = {os.path.abspath(filename): sha1_hash
+                                for filename, sha1_hash in self.logger().file_hashes().items()}
+            self.results = self.logger().cached_results()
+            if self.trace:
+                self.unchanged = {nodeid for nodeid, functions in self.logger().test_functions().items()
+                                  if all(self.function_hashes.get(name) == ast_hash
+                                         for name, ast_hash in functions.items())}
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_configure_node(self, node):
+        node.workerinput['grader_file_hashes'] = self.file_hashes
+        node.workerinput['grader_cache'] = self.results
+        node.workerinput['grader_unchanged'] = sorted(self.unchanged)
+
+    def dependency_hash(self, item: pytest.Item) -> str:
+        """A hash of the code that a test depends on, apart from traced functions."""
+        path = str(item.path)
+        if path not in self.path_hashes:
+            self.path_hashes[path] = self._path_hashes(item)
+        shared_hash, own_hash = self.path_hashes[path]
+        if isinstance(item, pytest.DoctestItem):
+            func = item.dtest.globs.get(item.dtest.name.split('.')[-1])
+            try:
+                source = inspect.getsource(func)
+            except (TypeError, OSError):
+                pass  # e.g. a module docstring, whose file is hashed instead
+            else:
+                own_hash = 'source:' + hashlib.sha1(source.encode('utf-8')).hexdigest()
+        return hashlib.sha1(f'{shared_hash}:{own_hash}'.encode('utf-8')).hexdigest()
+
+    def _path_hashes(self, item: pytest.Item) -> tuple[str, str]:
+        """A hash of the files that every test in item's file depends on, and
+        the hash of that file itself, which are the same for all its tests."""
+        path = str(item.path)
+        # The conftest.py files that apply to a test are those in its directory
+        # and the directories above it.
+        dependencies = {plugin.__file__: self.file_hashes.get(plugin.__file__) or file_sha1(plugin.__file__)
+                        for plugin in item.config.pluginmanager.get_plugins()
+                        if inspect.ismodule(plugin) and os.path.basename(plugin.__file__ or '') == 'conftest.py'
+                        and path.startswith(os.path.dirname(plugin.__file__) + os.sep)}
+        if not self.trace:
+            # Without tracing, a test may call code anywhere in the included files.
+            dependencies.update(self.file_hashes)
+        shared_hash = hashlib.sha1(json.dumps(sorted(dependencies.items())).encode('utf-8')).hexdigest()
+        return shared_hash, self.file_hashes.get(path) or file_sha1(path)
+
+    # tryfirst, and registered after ForkPlugin, so that a cached test is not forked
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        key = self.keys[item.nodeid] = self.dependency_hash(item)
+        cached = self.results.get(item.nodeid)
+        if cached is None or cached[0] != key or (self.trace and item.nodeid not in self.unchanged):
+            return None
+        # Replaying a result bypasses pytest's runner, so the fixtures kept for
+        # this test are torn down through its private SetupState, which pytest
+        # 8 and 9 have (see the pin in pyproject.toml). If it is missing, the
+        # test runs as usual instead.
+        teardown_exact = getattr(getattr(item.session, '_setupstate', None), 'teardown_exact', None)
+        if teardown_exact is None:
+            return None
+        _, outcome, message, summary = cached
+        item.ihook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+        for when, func in [('setup', lambda: None),
+                           ('call', lambda: None if outcome == 'passed' else pytest.fail(message, pytrace=False)),
+                           ('teardown', lambda: None)]:
+            report = item.ihook.pytest_runtest_makereport(item=item, call=pytest.CallInfo.from_call(func, when))
+            report.grader_cached = True
+            crash = getattr(report.longrepr, 'reprcrash', None)
+            if crash is not None:
+                # The short test summary shows the original failure, not the replayed one.
+                if summary is None:
+                    report.longrepr.reprcrash = None
+                else:
+                    crash.message = summary
+            item.ihook.pytest_runtest_logreport(report=report)
+        item.ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
+        # Tear down fixtures kept for this test, as its own teardown would have.
+        teardown_exact(nextitem)
+        return True
+
+    # Fixtures may call student code too, so setup is traced along with the test.
+    @pytest.hookimpl(wrapper=True)
+    def pytest_runtest_setup(self, item):
+        return (yield from self._traced(item))
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_runtest_call(self, item):
+        return (yield from self._traced(item))
+
+    def _traced(self, item: pytest.Item):
+        """Add the functions that run during a hook wrapper to those executed by item."""
+        if not self.trace:
+            return (yield)
+        tracer = Tracer(self.function_lines)
+        tracer.start()
+        try:
+            return (yield)
+        finally:
+            functions = tracer.stop()
+            executed = self.executed.get(item.nodeid, set())
+            self.executed[item.nodeid] = None if functions is None or executed is None else executed | functions
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        # Under pytest-xdist or in a forked process, the key and the executed
+        # functions travel with the report to the process that stores them.
+        report = yield
+        report.grader_cache_key = self.keys.get(item.nodeid)
+        if self.trace and call.when == "call":
+            functions = self.executed.pop(item.nodeid, None)
+            report.grader_functions = None if functions is None else sorted(functions)
+        elif call.when == "teardown":
+            self.executed.pop(item.nodeid, None)  # e.g. after a failed setup
+        return report
+
+    # tryfirst so that the failure message is stored before --first-failed-only removes it
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_logreport(self, report):
+        if (self.logger is not None and report.when == "call" and report.outcome in ('passed', 'failed')
+                and not getattr(report, 'grader_cached', False)
+                and getattr(report, 'grader_cache_key', None) is not None):
+            message = summary = None
+            if report.failed:
+                message = report.longreprtext
+                summary = getattr(getattr(report.longrepr, 'reprcrash', None), 'message', None)
+            self.logger().cache_result(report.nodeid, report.grader_cache_key, report.outcome, message, summary)
+            if self.trace:
+                functions = getattr(report, 'grader_functions', None)
+                if functions is not None:
+                    # Every test depends on the code outside of functions.
+                    functions = {name: ast_hash for name, ast_hash in self.function_hashes.items()
+                                 if name in functions or name.endswith(f":{MODULE_CODE}")}
+                self.logger().traced_functions(report.nodeid, functions)
+
+    def pytest_report_teststatus(self, report, config):
+        if getattr(report, 'grader_cached', False) and report.when == "call":
+            letter = '.' if report.passed else 'F'
+            return report.outcome, letter, f"{report.outcome.upper()} (cached)"
+        return None
+
+
 class FirstFailedOnlyPlugin:
     def __init__(self):
         self.first_failed_only = False
@@ -186,9 +791,10 @@ class FirstFailedOnlyPlugin:
     def pytest_configure(self, config):
         self.first_failed_only = config.getoption("--first-failed-only")
 
-    @pytest.hookimpl(wrapper=True)
-    def pytest_runtest_makereport(self, item, call):
-        report = yield
+    # Reports are edited as they are logged rather than when they are made, so
+    # that under pytest-xdist the first failure across all workers is shown.
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_logreport(self, report):
         if self.first_failed_only and report.when == "call" and report.failed:
             if self.failure_shown:
                 # Suppress the traceback and captured output of later failures
@@ -196,7 +802,6 @@ class FirstFailedOnlyPlugin:
                 report.sections = []
             else:
                 self.failure_shown = True
-        return report
 
     def pytest_terminal_summary(self, terminalreporter, exitstatus, config):
         # Add custom summary when first-failed-only is used
@@ -216,10 +821,46 @@ def pytest_addoption(parser):
         "--score", "-S", action="store_true", default=False,
         help="Show score report after running tests"
     )
+    parser.addoption(
+        "--score-format", action="store", default="table", choices=SCORE_FORMATS,
+        help="Format of the score report: table (default), jsonl, json, or csv"
+    )
+    parser.addoption(
+        "--score-output", action="store", default=None, metavar="PATH",
+        help="Write the score report to a file; jsonl and csv records are written as tests finish"
+    )
+    parser.addoption(
+        "--score-order", action="store", default="collection", choices=SCORE_ORDERS,
+        help="Order in which to run tests: collection (default); points-per-second to run "
+             "the tests that earn the most points per second of past running time first; or "
+             "failed-first to run tests that failed last time first and tests whose files are "
+             "unchanged since they passed last"
+    )
+    parser.addoption(
+        "--time-budget", action="store", type=float, default=None, metavar="SECONDS",
+        help="Skip the remaining tests once this many seconds have passed, and report the partial score"
+    )
+    parser.addoption(
+        "--grader-cache", action="store_true", default=False,
+        help="Reuse the outcome of each test whose code is unchanged since it last ran"
+    )
+    parser.addoption(
+        "--grader-trace", action="store_true", default=False,
+        help="Like --grader-cache, but trace the functions each test runs and reuse its "
+             "outcome while those functions are unchanged"
+    )
+    parser.addoption(
+        "--grader-profile", action="store_true", default=False,
+        help="Also record the peak Python memory allocation and a profile of each test"
+    )
     parser.addoption(
         "--unlock", "-U", action="store_true", default=False,
         help="Unlock locked doctests interactively"
     )
+    parser.addoption(
+        "--unlock-from", action="store", default=None, metavar="ANSWERS",
+        help="Unlock locked doctests with the outputs in a YAML file of answers"
+    )
     parser.addoption(
         "--grader-db", action="store", default="grader.sqlite",
         help="Grader database file (default: grader.sqlite)"
@@ -239,33 +880,72 @@ def pytest_configure(config):
     if 's' not in (config.option.reportchars or ''):
         config.option.reportchars = (config.option.reportchars or '') + 's'
 
-    if config.getoption("--collect-only"):
+    if config.option.help or (config.getoption("--collect-only") and not config.getoption("--unlock-from")):
         return  # Nothing runs, so don't create or update the grader database
 
+    for option in ("--unlock", "--unlock-from"):
+        if is_xdist_controller(config) and config.getoption(option):
+            raise pytest.UsageError(
+                f"{option} cannot be used with pytest-xdist. Unlock tests in a run without -n first.")
+
     # Read assignment configuration
     assignment_file = config.getoption("--assignment")
     try:
-        with open(assignment_file, 'r') as f:
-            assignment_conf = yaml.safe_load(f) or {}
+        with open(assignment_file, 'rb') as f:
+            assignment_source = f.read()
     except FileNotFoundError:
         raise pytest.UsageError(
             f"pytest-grader could not find the assignment configuration file '{assignment_file}'. "
             "Run pytest from the assignment directory or pass --assignment.")
     grader_db = config.getoption("--grader-db")
-
-    # Store configuration in grader_db
-    conf = SqliteDict(grader_db, tablename="conf", autocommit=True)
-    for k, v in assignment_conf.items():
-        conf[k] = v
-
-    # Create shared services
-    logger = SQLLogger(grader_db, conf)
-    unlock_keys = SqliteDict(grader_db, tablename="unlock_keys", autocommit=True)
-
-    # Register plugins
-    config.pluginmanager.register(ScorerPlugin(), "pytest-grader-scorer")
-    config.pluginmanager.register(UnlockPlugin(unlock_keys, logger), "pytest-grader-unlock")
-    config.pluginmanager.register(LoggerPlugin(logger), "pytest-grader-logger")
-    config.pluginmanager.register(IsolationPlugin(assignment_conf.get('reload_modules', [])),
-                                  "pytest-grader-isolation")
+    assignment_hash = hashlib.sha1(assignment_source).hexdigest()
+    # Importing PyYAML takes longer than the rest of startup, so it is only
+    # imported when the configuration changed since it was stored in grader_db.
+    assignment_conf = stored_conf(grader_db, assignment_hash)
+    if assignment_conf is None:
+        import yaml
+        assignment_conf = yaml.safe_load(assignment_source) or {}
+
+    isolation = assignment_conf.get('isolation')
+    if isolation not in (None, 'fork'):
+        raise pytest.UsageError(f"Unknown isolation '{isolation}' in {assignment_file}; expected fork")
+    if isolation == 'fork' and not hasattr(os, 'fork'):
+        raise pytest.UsageError("isolation: fork is not supported on this platform")
+
+    if is_xdist_worker(config):
+        # A pytest-xdist worker only runs tests. The controller snapshots the
+        # code and logs results, so that it is the only writer to grader_db.
+        logger = None
+        unlock_keys = functools.partial(UnlockKeys, grader_db, readonly=True)
+    else:
+        # Create shared services. grader_db is opened when first logged to.
+        logger = LazyLogger(grader_db, assignment_conf, assignment_hash)
+        # Unlock keys are only loaded if a test has locked outputs.
+        unlock_keys = functools.partial(UnlockKeys, grader_db)
+
+    # Register plugins. Among tryfirst hooks, those of later plugins run first,
+    # so --first-failed-only is registered before the plugins that log failure
+    # messages, which must see them before it removes them.
     config.pluginmanager.register(FirstFailedOnlyPlugin(), "pytest-grader-first-failed-only")
+    if logger is not None:
+        config.pluginmanager.register(LoggerPlugin(logger), "pytest-grader-logger")
+    unlock_plugin = UnlockPlugin(unlock_keys, logger)
+    config.pluginmanager.register(ScorerPlugin(logger, assignment_conf.get('included_files', [])),
+                                  "pytest-grader-scorer")
+    config.pluginmanager.register(unlock_plugin, "pytest-grader-unlock")
+    if isolation == 'fork':
+        # Each test runs in a fresh child process, so modules need no reloading.
+        config.pluginmanager.register(IsolationPlugin([]), "pytest-grader-isolation")
+        config.pluginmanager.register(
+            ForkPlugin(assignment_conf.get('test_timeout'), assignment_conf.get('test_memory_limit')),
+            "pytest-grader-fork")
+    else:
+        config.pluginmanager.register(IsolationPlugin(assignment_conf.get('reload_modules', []),
+                                                      assignment_conf.get('restore_modules', [])),
+                                      "pytest-grader-isolation")
+    config.pluginmanager.register(ResourcePlugin(config.getoption("--grader-profile")),
+                                  "pytest-grader-resources")
+    if config.getoption("--grader-cache") or config.getoption("--grader-trace"):
+        config.pluginmanager.register(
+            CachePlugin(logger, config.getoption("--grader-trace"), assignment_conf.get('included_files', [])),
+            "pytest-grader-cache")
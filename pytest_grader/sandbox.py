@@ -0,0 +1,133 @@
+"""
+Module for running each test in a forked child process, with time and memory limits.
+"""
+
+import os
+import pickle
+import selectors
+import signal
+import time
+
+import pytest
+from _pytest.runner import runtestprotocol
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, where os.fork is not either
+    resource = None
+
+
+def run_in_fork(item: pytest.Item, timeout: float | None = None,
+                memory_limit: int | None = None) -> list[pytest.TestReport]:
+    """Run a test item in a forked child process and return its reports.
+
+    The child inherits the parent's imported modules, so only the test itself
+    runs in the child, and no change it makes outlives it. The child is killed
+    if it runs for more than timeout seconds, and its address space may grow
+    by at most memory_limit megabytes beyond what it inherits, where its size
+    is known (see memory_limit_supported)."""
+    read_fd, write_fd = os.pipe()
+    start = time.time()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        _run_child(item, write_fd, memory_limit)
+
+    os.close(write_fd)
+    data, timed_out = _read_until(read_fd, None if timeout is None else start + timeout)
+    if timed_out:
+        os.kill(pid, signal.SIGKILL)
+    _, status = os.waitpid(pid, 0)
+
+    if timed_out:
+        return _failure_reports(item, f"Test exceeded the time limit of {timeout} seconds", start)
+    if not data:
+        if os.WIFSIGNALED(status):
+            reason = f"killed by signal {os.WTERMSIG(status)}"
+        else:
+            reason = f"exited with status {os.WEXITSTATUS(status)}"
+        return _failure_reports(item, f"Test process {reason} before reporting a result", start)
+    config = item.config
+    return [config.hook.pytest_report_from_serializable(config=config, data=report)
+            for report in pickle.loads(data)]
+
+
+def _run_child(item: pytest.Item, write_fd: int, memory_limit: int | None):
+    """Run a test item in the child process, send its reports to the parent, and exit."""
+    status = 1
+    try:
+        # The parent's handlers (e.g. to flush buffered rows to its database on
+        # SIGTERM) must not run here, where its connection is not safe to use.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        # The limit is on growth, since the address space inherited from the
+        # parent (the interpreter, pytest, and imports such as numpy) may already
+        # be hundreds of megabytes. If its size is unknown, no limit is set.
+        address_space = _address_space()
+        if memory_limit is not None and resource is not None and address_space is not None:
+            _, hard = resource.getrlimit(resource.RLIMIT_AS)
+            limit = address_space + memory_limit * 1024 * 1024
+            if hard != resource.RLIM_INFINITY:
+                limit = min(limit, hard)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        # Reports are logged by the parent, not here.
+        reports = runtestprotocol(item, log=False, nextitem=None)
+        config = item.config
+        # Pickling (unlike JSON) preserves the tuples in serialized reports.
+        data = pickle.dumps([config.hook.pytest_report_to_serializable(config=config, report=report)
+                             for report in reports])
+        with os.fdopen(write_fd, 'wb') as f:
+            f.write(data)
+        status = 0
+    finally:
+        # Skip atexit handlers and the cleanup of objects shared with the parent
+        os._exit(status)
+
+
+def memory_limit_supported() -> bool:
+    """Whether run_in_fork can limit the memory of a test on this platform."""
+    return resource is not None and _address_space() is not None
+
+
+def _address_space() -> int | None:
+    """The size of this process's address space in bytes, or None if unknown."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):  # e.g. macOS, which has no /proc
+        return None
+
+
+def _read_until(fd: int, deadline: float | None) -> tuple[bytes, bool]:
+    """Read from fd until it is closed or the deadline passes.
+
+    Return what was read and whether the deadline passed."""
+    chunks = []
+    with selectors.DefaultSelector() as selector:
+        selector.register(fd, selectors.EVENT_READ)
+        try:
+            while True:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return b''.join(chunks), True
+                if selector.select(remaining):
+                    chunk = os.read(fd, 1 << 16)
+                    if not chunk:
+                        return b''.join(chunks), False
+                    chunks.append(chunk)
+        finally:
+            os.close(fd)
+
+
+def _failure_reports(item: pytest.Item, message: str, start: float) -> list[pytest.TestReport]:
+    """Reports for a test whose process did not report a result."""
+    reports = []
+    for when, outcome in [('setup', lambda: None),
+                          ('call', lambda: pytest.fail(message, pytrace=False)),
+                          ('teardown', lambda: None)]:
+        call = pytest.CallInfo.from_call(outcome, when)
+        report = item.ihook.pytest_runtest_makereport(item=item, call=call)
+        if when == 'call':
+            report.duration = time.time() - start
+        reports.append(report)
+    return reports
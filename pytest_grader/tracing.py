@@ -0,0 +1,113 @@
+"""
+Module for recording which functions of an assignment each test executes.
+"""
+
+import ast
+import hashlib
+import os
+import sys
+
+MODULE_CODE = '<module>'  # The name of a file's code outside of its functions
+
+
+def index_functions(filename: str) -> tuple[dict[str, str], dict[int, str]]:
+    """Hash the AST of each function in a Python file.
+
+    Return a hash for each function, named "filename:qualname", along with
+    "filename:<module>" for the code outside of functions (such as imports,
+    globals, decorators, and default arguments), and the name of the function
+    that starts at each line. A file that cannot be parsed is hashed as a whole."""
+    with open(filename, 'r', encoding='utf-8') as f:
+        source = f.read()
+    try:
+        tree = ast.parse(source, filename)
+    except (SyntaxError, ValueError):
+        return {f"{filename}:{MODULE_CODE}": _sha1(source)}, {}
+
+    functions = []
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                functions.append((f"{prefix}{child.name}", child))
+                visit(child, f"{prefix}{child.name}.")
+            elif isinstance(child, ast.ClassDef):
+                visit(child, f"{prefix}{child.name}.")
+            else:
+                visit(child, prefix)
+    visit(tree, '')
+
+    hashes = {}
+    lines = {}
+    for qualname, node in functions:
+        name = f"{filename}:{qualname}"
+        # Line numbers are not part of the dump, so moving a function doesn't change its hash.
+        hashes[name] = _sha1(ast.dump(node))
+        # A function's code object starts at its first decorator.
+        lines[min([node.lineno] + [d.lineno for d in node.decorator_list])] = name
+    for _, node in functions:
+        node.body = []
+    hashes[f"{filename}:{MODULE_CODE}"] = _sha1(ast.dump(tree))
+    return hashes, lines
+
+
+def _sha1(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class Tracer:
+    """Record the functions that start running between start() and stop().
+
+    Uses sys.monitoring on Python 3.12 and later, where each function is
+    reported only once, and sys.settrace otherwise."""
+
+    def __init__(self, lines: dict[str, dict[int, str]]):
+        self.lines = lines  # The function names in each file, by absolute path and line
+        self.codes = set()
+        self.tool_id = None
+        self.tracing = False
+
+    def start(self):
+        self.codes = set()
+        monitoring = getattr(sys, 'monitoring', None)
+        if monitoring is not None and monitoring.get_tool(monitoring.PROFILER_ID) is None:
+            self.tool_id = monitoring.PROFILER_ID
+            monitoring.use_tool_id(self.tool_id, 'pytest-grader')
+            monitoring.register_callback(self.tool_id, monitoring.events.PY_START, self._on_start)
+            monitoring.set_events(self.tool_id, monitoring.events.PY_START)
+            # Re-enable the code locations disabled while tracing an earlier test
+            monitoring.restart_events()
+            self.tracing = True
+        elif sys.gettrace() is None:
+            # Don't replace the trace function of a debugger or coverage tool.
+            sys.settrace(self._trace)
+            self.tracing = True
+
+    def stop(self) -> set[str] | None:
+        """Stop recording, and return the names of the functions that ran, or
+        None if they could not be recorded."""
+        if not self.tracing:
+            return None
+        if self.tool_id is not None:
+            monitoring = sys.monitoring
+            monitoring.set_events(self.tool_id, 0)
+            monitoring.register_callback(self.tool_id, monitoring.events.PY_START, None)
+            monitoring.free_tool_id(self.tool_id)
+            self.tool_id = None
+        else:
+            sys.settrace(None)
+        self.tracing = False
+        names = set()
+        for code in self.codes:
+            name = self.lines.get(os.path.abspath(code.co_filename), {}).get(code.co_firstlineno)
+            if name is not None:
+                names.add(name)
+        return names
+
+    def _on_start(self, code, offset):
+        self.codes.add(code)
+        return sys.monitoring.DISABLE  # Each function only needs to be seen once
+
+    def _trace(self, frame, event, arg):
+        if event == 'call':
+            self.codes.add(frame.f_code)
+        return None  # No need to trace the lines of each function
@@ -0,0 +1,122 @@
+import json
+import sqlite3
+import subprocess
+import sys
+
+from pytest_grader.analyze import build_warehouse, find_databases, report
+from pytest_grader.logger import SQLLogger
+
+
+def make_database(path, runs, unlock_attempts=()):
+    """A grader database with a snapshot a minute for each run, a dict of
+    test names and whether they passed, and unlock attempts after the first."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    logger = SQLLogger(str(path), {})
+    for minute, results in enumerate(runs):
+        logger.snapshot()
+        logger.conn.execute("UPDATE snapshots SET timestamp = ? WHERE id = ?",
+                            (f"2026-01-01 10:{minute:02d}:00", logger.current_snapshot))
+        logger.conn.commit()
+        for name, passed in results.items():
+            logger.test_case(name, passed)
+        if minute == 0:
+            for name, number, guess, success in unlock_attempts:
+                logger.unlock_attempt(name, number, guess, success)
+    logger.close()
+
+
+def test_build_warehouse(tmp_path):
+    """Test that grader databases are copied into a warehouse with aggregates across them."""
+    make_database(tmp_path / "subs" / "alice" / "grader.sqlite",
+                  [{"test_a": False, "test_b": True}, {"test_a": False}, {"test_a": True}],
+                  [("q1", 0, "3", False), ("q1", 0, "4", True)])
+    make_database(tmp_path / "subs" / "bob" / "grader.sqlite",
+                  [{"test_a": True, "test_b": False}],
+                  [("q1", 0, "4", True)])
+    warehouse = tmp_path / "warehouse.sqlite"
+    databases = find_databases([tmp_path / "subs"])
+    assert build_warehouse(warehouse, databases) == {"added": 2, "updated": 0, "unchanged": 0}
+
+    columns, rows = report(warehouse, "first-pass")
+    assert columns == ["test", "submissions", "passed", "mean_runs_to_pass", "mean_minutes_to_pass"]
+    # alice passed test_a on her third run, two minutes after the first; bob on his first
+    assert rows == [("test_a", 2, 2, 2.0, 1.0), ("test_b", 2, 1, 1.0, 0.0)]
+    assert report(warehouse, "unlocks")[1] == [("q1[0]", 2, 2, 3, 1.5)]
+    assert report(warehouse, "snapshots")[1] == [
+        ("alice", 3, "2026-01-01 10:00:00", "2026-01-01 10:02:00"),
+        ("bob", 1, "2026-01-01 10:00:00", "2026-01-01 10:00:00")]
+
+    # Unchanged databases are skipped, and changed ones replace their earlier rows
+    assert build_warehouse(warehouse, databases) == {"added": 0, "updated": 0, "unchanged": 2}
+    make_database(tmp_path / "subs" / "bob" / "grader.sqlite", [{"test_b": True}])
+    assert build_warehouse(warehouse, databases) == {"added": 0, "updated": 1, "unchanged": 1}
+    assert report(warehouse, "first-pass")[1] == [("test_a", 2, 2, 2.0, 1.0), ("test_b", 2, 2, 1.5, 0.0)]
+    conn = sqlite3.connect(warehouse)
+    assert conn.execute("SELECT COUNT(*) FROM snapshots").fetchone() == (5,)
+    conn.close()
+
+
+def test_responses_copied_once(tmp_path):
+    """Test that the responses of failed tests are copied once, however many submissions share them."""
+    for name in ("alice", "bob"):
+        (tmp_path / name).mkdir()
+        logger = SQLLogger(str(tmp_path / name / "grader.sqlite"), {})
+        logger.snapshot()
+        logger.test_case("test_a", False, "Expected 1")
+        logger.close()
+    warehouse = tmp_path / "warehouse.sqlite"
+    build_warehouse(warehouse, find_databases([tmp_path]))
+    conn = sqlite3.connect(warehouse)
+    rows = conn.execute("SELECT t.response_sha1, r.content FROM test_cases t "
+                        "JOIN responses r ON r.sha1_hash = t.response_sha1").fetchall()
+    assert conn.execute("SELECT COUNT(*) FROM responses").fetchone() == (1,)
+    conn.close()
+    assert len(rows) == 2 and rows[0] == rows[1]
+
+
+def test_compacted_database(tmp_path):
+    """Test that runs merged into one snapshot by compaction are still counted in order."""
+    database = tmp_path / "subs" / "alice" / "grader.sqlite"
+    make_database(database, [{"test_a": False}, {"test_a": True}, {"test_a": True}])
+    logger = SQLLogger(str(database), {})
+    assert logger.compact() == {'merged_snapshots': 1, 'pruned_versions': 0}
+    logger.close()
+    warehouse = tmp_path / "warehouse.sqlite"
+    build_warehouse(warehouse, find_databases([tmp_path / "subs"]))
+    assert report(warehouse, "first-pass")[1] == [("test_a", 1, 1, 2.0, 1.0)]
+
+
+def test_submissions_with_same_directory_name(tmp_path):
+    """Test that databases in directories of the same name are distinct submissions."""
+    make_database(tmp_path / "subs" / "s1" / "hw1" / "grader.sqlite", [{"test_a": True}])
+    make_database(tmp_path / "subs" / "s2" / "hw1" / "grader.sqlite", [{"test_a": False}])
+    databases = find_databases([tmp_path / "subs"])
+    assert list(databases) == ["s1/hw1", "s2/hw1"]
+    warehouse = tmp_path / "warehouse.sqlite"
+    assert build_warehouse(warehouse, databases) == {"added": 2, "updated": 0, "unchanged": 0}
+    assert [row[:2] for row in report(warehouse, "snapshots")[1]] == [("s1/hw1", 1), ("s2/hw1", 1)]
+    assert report(warehouse, "first-pass")[1] == [("test_a", 2, 1, 1.0, 0.0)]
+
+    # A database found again under another directory argument keeps its name
+    assert find_databases([tmp_path / "subs", tmp_path / "subs" / "s1"]) == {
+        "s1/hw1": tmp_path / "subs" / "s1" / "hw1" / "grader.sqlite",
+        "s2/hw1": tmp_path / "subs" / "s2" / "hw1" / "grader.sqlite"}
+
+
+def test_analyze_command(tmp_path):
+    """Test that pytest-grader analyze builds a warehouse and prints reports."""
+    make_database(tmp_path / "subs" / "alice" / "grader.sqlite", [{"test_a": True}])
+    warehouse = tmp_path / "warehouse.sqlite"
+    result = subprocess.run([sys.executable, "-m", "pytest_grader", "analyze", str(warehouse),
+                             str(tmp_path / "subs"), "--report", "snapshots", "--format", "jsonl"],
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert "Added 1 databases" in result.stderr
+    assert json.loads(result.stdout) == {"report": "snapshots", "submission": "alice", "snapshots": 1,
+                                         "first_snapshot": "2026-01-01 10:00:00",
+                                         "last_snapshot": "2026-01-01 10:00:00"}
+
+    result = subprocess.run([sys.executable, "-m", "pytest_grader", "analyze", str(warehouse),
+                             "-r", "first-pass"], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split("\n")[2].split() == ["test_a", "1", "1", "1.0", "0.0"]
@@ -0,0 +1,26 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+RUN_BENCHMARKS = Path(__file__).parent.parent / "benchmarks" / "run.py"
+
+
+def test_benchmarks_compare_with_baseline(tmp_path):
+    """Test that the benchmark suite saves a baseline and fails on regressions from it."""
+    baseline = tmp_path / "baseline.json"
+    command = [sys.executable, str(RUN_BENCHMARKS), "--repeat", "1", "--scale", "0.01"]
+    result = subprocess.run(command + ["--save", str(baseline)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+    saved = json.loads(baseline.read_text())
+    assert saved["scale"] == 0.01
+    assert {"import_plugin", "run_one_test", "snapshot_new", "log_test_cases",
+            "lock_file", "unlock_setup"} <= saved["results"].keys()
+
+    # Every benchmark is far slower than a baseline in which each took a nanosecond
+    saved["results"] = {name: 1e-9 for name in saved["results"]}
+    baseline.write_text(json.dumps(saved))
+    result = subprocess.run(command + ["lock_file", "--compare", str(baseline)],
+                            capture_output=True, text=True)
+    assert result.returncode == 1, result.stdout + result.stderr
+    assert "lock_file" in result.stdout and "REGRESSION" in result.stdout
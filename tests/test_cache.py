@@ -0,0 +1,128 @@
+import subprocess
+import sys
+
+STUDENT = '''
+def f():
+    """
+    >>> f()
+    1
+    """
+    return 1
+
+def g():
+    """
+    >>> g()
+    3
+    """
+    return 2
+'''
+
+TESTS = '''
+import student
+from pytest_grader import points
+
+@points(2)
+def test_f():
+    with open("runs.txt", "a") as f:
+        f.write("run\\n")
+    assert student.f() == 1
+'''
+
+
+def run_pytest(tmp_path):
+    result = subprocess.run([sys.executable, "-m", "pytest", "--doctest-modules", "-v", "--score",
+                             "-p", "pytest_grader.plugins", "--grader-cache", "student.py", "test_s.py"],
+                            capture_output=True, text=True, cwd=tmp_path)
+    return result.stdout
+
+
+def test_grader_cache(tmp_path):
+    """Test that --grader-cache reuses outcomes until the code a test depends on changes."""
+    (tmp_path / "student.py").write_text(STUDENT)
+    (tmp_path / "test_s.py").write_text(TESTS)
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - student.py\n')
+
+    output = run_pytest(tmp_path)
+    assert "(cached)" not in output
+    assert "1 failed, 2 passed" in output
+
+    output = run_pytest(tmp_path)
+    assert "student.py::student.f PASSED (cached)" in output
+    assert "student.py::student.g FAILED (cached)" in output
+    assert "test_s.py::test_f PASSED (cached)" in output
+    assert "✅ test_f (cached)  2/2" in output
+    # The failure is still shown
+    assert "Expected:\n    3\nGot:\n    2" in output
+    assert (tmp_path / "runs.txt").read_text() == "run\n"
+
+    # Doctests depend on the functions they call, which may be anywhere in the file.
+    (tmp_path / "student.py").write_text(STUDENT.replace("return 2", "return 3"))
+    output = run_pytest(tmp_path)
+    assert "(cached)" not in output
+    assert "student.py::student.g PASSED " in output
+    assert (tmp_path / "runs.txt").read_text() == "run\nrun\n"
+
+
+def test_grader_cache_helper_changed(tmp_path):
+    """Test that a doctest reruns when a function that it calls changes."""
+    (tmp_path / "student.py").write_text(
+        'def helper(x):\n    return x + 1\n\n'
+        'def f(x):\n    """\n    >>> f(1)\n    2\n    """\n    return helper(x)\n')
+    (tmp_path / "test_s.py").write_text(TESTS)
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - student.py\n')
+    assert "student.py::student.f PASSED " in run_pytest(tmp_path)
+
+    (tmp_path / "student.py").write_text((tmp_path / "student.py").read_text().replace("x + 1", "x + 2"))
+    assert "student.py::student.f FAILED " in run_pytest(tmp_path)
+
+
+def test_grader_cache_conftest_changed(tmp_path):
+    """Test that tests rerun when a conftest.py that applies to them changes."""
+    (tmp_path / "student.py").write_text(STUDENT)
+    (tmp_path / "test_s.py").write_text(TESTS.replace("student.f()", "student.f() + offset - 1"))
+    (tmp_path / "conftest.py").write_text('import builtins\nbuiltins.offset = 1\n')
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - student.py\n')
+    run_pytest(tmp_path)
+    assert "test_s.py::test_f PASSED (cached)" in run_pytest(tmp_path)
+
+    (tmp_path / "conftest.py").write_text('import builtins\nbuiltins.offset = 2\n')
+    assert "test_s.py::test_f FAILED " in run_pytest(tmp_path)
+
+
+def test_grader_cache_summary(tmp_path):
+    """Test that the short test summary of a cached failure shows the original message."""
+    (tmp_path / "student.py").write_text(STUDENT)
+    (tmp_path / "test_s.py").write_text("def test_h():\n    assert 1 == 2\n")
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - student.py\n')
+    run_pytest(tmp_path)
+    output = run_pytest(tmp_path)
+    assert "FAILED (cached) test_s.py::test_h - assert 1 == 2" in output
+    assert "FAILED (cached) student.py::student.g\n" in output
+
+
+def test_grader_trace(tmp_path):
+    """Test that --grader-trace reruns only the tests that executed a changed function."""
+    (tmp_path / "hog.py").write_text(
+        "def roll():\n    return 1\n\ndef score():\n    return 2\n\n"
+        "class Game:\n    def play(self):\n        return roll()\n")
+    (tmp_path / "test_hog.py").write_text(
+        "import hog\n\n"
+        "def test_roll():\n    assert hog.roll() == 1\n\n"
+        "def test_score():\n    assert hog.score() == 2\n\n"
+        "def test_play():\n    assert hog.Game().play() == 1\n")
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - hog.py\n')
+
+    def run():
+        result = subprocess.run([sys.executable, "-m", "pytest", "-v", "-p", "pytest_grader.plugins",
+                                 "--grader-trace", "test_hog.py"],
+                                capture_output=True, text=True, cwd=tmp_path)
+        return {line.split()[0].split("::")[1] for line in result.stdout.splitlines()
+                if line.startswith("test_hog.py::") and "(cached)" in line}
+
+    assert run() == set()
+    assert run() == {"test_roll", "test_score", "test_play"}
+    (tmp_path / "hog.py").write_text((tmp_path / "hog.py").read_text().replace("return 1", "return 0 + 1"))
+    assert run() == {"test_score"}
+    # Code outside of functions may affect any test.
+    (tmp_path / "hog.py").write_text("GOAL = 100\n" + (tmp_path / "hog.py").read_text())
+    assert run() == set()
@@ -1,6 +1,8 @@
 import subprocess
 import sys
 
+from pytest_grader.logger import SQLLogger
+
 
 def test_first_failed_only_with_multiple_failures(tmp_path):
     """Test that --first-failed-only shows only the first failure's output."""
@@ -49,3 +51,11 @@ def test_third_fail():
     # Should NOT have detailed output for subsequent failures
     assert "assert False, \"Second failure message\"" not in failure_sections
     assert "assert False, \"Third failure message\"" not in failure_sections
+
+    # Every failure message is still logged to the grader database
+    logger = SQLLogger(str(tmp_path / "grader.sqlite"), {})
+    rows = logger.conn.execute("SELECT name, response_sha1 FROM test_cases WHERE NOT passed").fetchall()
+    responses = {name: logger.get_response(sha1) for name, sha1 in rows}
+    logger.close()
+    assert "Second failure message" in responses["test_second_fail"]
+    assert "Third failure message" in responses["test_third_fail"]
@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason="requires os.fork")
+
+
+def test_grade_all(tmp_path):
+    """Test that grade-all grades each submission and reports timeouts."""
+    tests = tmp_path / "tests"
+    tests.mkdir()
+    (tests / "test_hog.py").write_text('''
+from pytest_grader import points
+import hog
+
+@points(2)
+def test_square():
+    assert hog.square(3) == 9
+
+@points(3)
+def test_double():
+    assert hog.double(3) == 6
+''')
+    (tests / "grader.yaml").write_text('included_files:\n  - hog.py\n')
+    submissions = {
+        "alice": "def square(x): return x * x\ndef double(x): return 2 * x\n",
+        "bob": "def square(x): return x * x\ndef double(x): return x\n",
+        "carol": "while True: pass\n",
+    }
+    for name, source in submissions.items():
+        (tmp_path / "submissions" / name).mkdir(parents=True)
+        (tmp_path / "submissions" / name / "hog.py").write_text(source)
+
+    result = subprocess.run([sys.executable, "-m", "pytest_grader", "grade-all", "submissions",
+                             "--tests", "tests", "--timeout", "3", "--jobs", "3", "-o", "results.jsonl"],
+                            capture_output=True, text=True, cwd=tmp_path)
+    assert result.returncode == 0, result.stderr
+    assert "Graded 3 submissions" in result.stderr
+    records = [json.loads(line) for line in (tmp_path / "results.jsonl").read_text().splitlines()]
+
+    totals = {r["submission"]: r for r in records if r["type"] == "total"}
+    assert (totals["alice"]["result"], totals["alice"]["earned"], totals["alice"]["points"]) == ("graded", 5, 5)
+    assert (totals["bob"]["result"], totals["bob"]["earned"], totals["bob"]["points"]) == ("graded", 2, 5)
+    assert totals["carol"]["result"] == "timeout"
+
+    bob_tests = {r["nodeid"]: r["outcome"] for r in records if r["submission"] == "bob" and r["type"] == "test"}
+    assert bob_tests == {"tests/test_hog.py::test_square": "passed", "tests/test_hog.py::test_double": "failed"}
+    # Grading does not write to the submission directories
+    assert sorted(os.listdir(tmp_path / "submissions" / "alice")) == ["hog.py"]
+
+
+def test_grade_all_timeout_kills_descendants(tmp_path):
+    """Test that a timed out submission is killed along with the processes it started."""
+    tests = tmp_path / "tests"
+    tests.mkdir()
+    (tests / "test_hog.py").write_text('''
+import os
+import hog
+
+def test_forever():
+    with open(os.environ["PID_FILE"], "w") as f:
+        f.write(str(os.getpid()))
+    hog.forever()
+''')
+    # Each test runs in a grandchild of grade-all, forked by the submission's child.
+    (tests / "grader.yaml").write_text('included_files:\n  - hog.py\nisolation: fork\n')
+    (tmp_path / "submissions" / "dave").mkdir(parents=True)
+    (tmp_path / "submissions" / "dave" / "hog.py").write_text("def forever():\n    while True: pass\n")
+
+    pid_file = tmp_path / "test.pid"
+    result = subprocess.run([sys.executable, "-m", "pytest_grader", "grade-all", "submissions",
+                             "--tests", "tests", "--timeout", "3", "-o", "results.jsonl"],
+                            capture_output=True, text=True, cwd=tmp_path,
+                            env={**os.environ, "PID_FILE": str(pid_file)})
+    assert result.returncode == 0, result.stderr
+    records = [json.loads(line) for line in (tmp_path / "results.jsonl").read_text().splitlines()]
+    assert records[-1]["result"] == "timeout"
+
+    pid = int(pid_file.read_text())
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            state = f.read().rsplit(")", 1)[1].split()[0]
+    except FileNotFoundError:
+        state = None  # Killed and reaped
+    assert state in (None, "Z"), f"test process {pid} is still running"
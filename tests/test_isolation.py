@@ -0,0 +1,201 @@
+import importlib.util
+import subprocess
+import sys
+import types
+
+import pytest
+
+from pytest_grader.isolation import ModuleSnapshot
+
+
+def make_module(source):
+    module = types.ModuleType("student")
+    exec(source, module.__dict__)
+    return module
+
+
+SOURCE = '''
+LIMIT = 10
+scores = [1, 2, 3]
+
+def square(x):
+    return x * x
+
+class Dice:
+    sides = [1, 2, 3, 4, 5, 6]
+
+    def roll(self):
+        return self.sides[0]
+'''
+
+
+def test_restore_rebound_globals():
+    """Test that restoring undoes rebinding, adding, and deleting globals."""
+    module = make_module(SOURCE)
+    original_square = module.square
+    snapshot = ModuleSnapshot(module)
+
+    module.square = lambda x: 0
+    module.LIMIT = 20
+    module.extra = 'added'
+    del module.scores
+    assert snapshot.restore()
+    assert module.square is original_square
+    assert module.LIMIT == 10
+    assert module.scores == [1, 2, 3]
+    assert not hasattr(module, 'extra')
+
+
+def test_restore_refused_after_mutation():
+    """Test that changes to mutable objects are detected instead of silently kept."""
+    module = make_module(SOURCE)
+    snapshot = ModuleSnapshot(module)
+    module.scores.append(4)
+    assert not snapshot.restore()
+
+    module = make_module(SOURCE)
+    snapshot = ModuleSnapshot(module)
+    module.Dice.sides.pop()
+    assert not snapshot.restore()
+
+    module = make_module(SOURCE)
+    snapshot = ModuleSnapshot(module)
+    module.Dice.roll = lambda self: 6
+    assert not snapshot.restore()
+
+    module = make_module(SOURCE)
+    snapshot = ModuleSnapshot(module)
+    module.square.__defaults__ = (1,)
+    assert not snapshot.restore()
+
+
+def test_restore_instances_and_nan():
+    """Test that instances without __eq__ and NaN are compared by value, not reloaded."""
+    source = 'class C:\n    pass\nc = C()\nc.value = [1]\nvalues = [float("nan"), C()]\n'
+    module = make_module(source)
+    snapshot = ModuleSnapshot(module)
+    module.c = None
+    assert snapshot.restore()
+    assert module.c.value == [1]
+
+    module.c.value.append(2)
+    assert not snapshot.restore()
+    module = make_module(source)
+    snapshot = ModuleSnapshot(module)
+    module.values[1].added = True
+    assert not snapshot.restore()
+
+
+def test_uncopyable_module_is_not_restorable():
+    """Test that a module with globals that cannot be copied is never restored."""
+    module = make_module('import threading\nlock = threading.Lock()\n')
+    assert not ModuleSnapshot(module).restore()
+
+
+def test_restore_modules_plugin(tmp_path):
+    """Test that restore_modules runs module-level code once, unless a test mutates it."""
+    (tmp_path / "data.py").write_text('''
+def record_import():
+    with open("imports.txt", "a") as f:
+        f.write("imported\\n")
+
+record_import()
+table = {"a": 1}
+
+def lookup(key):
+    return table[key]
+''')
+    (tmp_path / "test_data.py").write_text('''
+import data
+
+def test_monkeypatch():
+    data.lookup = lambda key: 0
+
+def test_lookup():
+    assert data.lookup("a") == 1
+
+def test_mutate():
+    data.table["a"] = 2
+
+def test_lookup_after_mutation():
+    assert data.table["a"] == 1
+''')
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - data.py\nrestore_modules:\n  - data\n')
+    result = subprocess.run([sys.executable, "-m", "pytest", "-q", "-p", "pytest_grader.plugins",
+                             "test_data.py"], capture_output=True, text=True, cwd=tmp_path)
+    assert "4 passed" in result.stdout, result.stdout
+    # Imported once at collection, then reloaded only after test_mutate.
+    assert (tmp_path / "imports.txt").read_text().count("imported") == 2
+
+
+def test_restore_closures_and_caches():
+    """Test that changes to closure cells are detected, and that empty caches are cleared."""
+    source = '''
+import functools
+
+def make_counter():
+    count = 0
+    def counter():
+        nonlocal count
+        count += 1
+        return count
+    return counter
+
+counter = make_counter()
+
+@functools.lru_cache
+def square(x):
+    return x * x
+'''
+    module = make_module(source)
+    snapshot = ModuleSnapshot(module)
+    assert module.square(3) == 9
+    assert snapshot.restore()
+    assert module.square.cache_info().currsize == 0
+
+    module.counter()
+    assert not snapshot.restore()
+
+    module = make_module(source + 'square(2)\n')
+    snapshot = ModuleSnapshot(module)
+    module.square(3)
+    assert not snapshot.restore()
+
+
+def test_restore_modules_with_arrays(tmp_path):
+    """Test that a module holding unchanged NumPy arrays and pandas objects is restored, not reloaded."""
+    if importlib.util.find_spec("numpy") is None or importlib.util.find_spec("pandas") is None:
+        pytest.skip("requires numpy and pandas")
+    (tmp_path / "data.py").write_text('''
+import numpy
+import pandas
+
+def record_import():
+    with open("imports.txt", "a") as f:
+        f.write("imported\\n")
+
+record_import()
+values = numpy.array([1.0, float("nan")])
+frame = pandas.DataFrame({"a": [1, 2]})
+''')
+    (tmp_path / "test_data.py").write_text('''
+import data
+
+def test_values():
+    assert data.values[0] == 1.0
+
+def test_frame():
+    assert data.frame["a"].sum() == 3
+
+def test_mutate():
+    data.frame.loc[0, "a"] = 5
+
+def test_frame_after_mutation():
+    assert data.frame["a"].sum() == 3
+''')
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - data.py\nrestore_modules:\n  - data\n')
+    result = subprocess.run([sys.executable, "-m", "pytest", "-q", "-p", "pytest_grader.plugins",
+                             "test_data.py"], capture_output=True, text=True, cwd=tmp_path)
+    assert "4 passed" in result.stdout, result.stdout
+    # Imported once at collection, then reloaded only after test_mutate.
+    assert (tmp_path / "imports.txt").read_text().count("imported") == 2
@@ -0,0 +1,51 @@
+import sqlite3
+
+from sqlitedict import SqliteDict
+
+from pytest_grader.keys import UnlockKeys
+
+
+def test_keys_are_written_on_flush(tmp_path):
+    """Test that new keys are held in memory until flushed to a plain table."""
+    db = str(tmp_path / "grader.sqlite")
+    keys = UnlockKeys(db)
+    keys["abc"] = "42"
+    assert "abc" in keys
+    assert UnlockKeys(db) == {}
+
+    keys.flush()
+    assert UnlockKeys(db) == {"abc": "42"}
+    rows = sqlite3.connect(db).execute("SELECT hash_code, output FROM unlocked_outputs").fetchall()
+    assert rows == [("abc", "42")]
+
+
+def test_readonly_keys(tmp_path):
+    """Test that a read-only store neither creates nor writes the database."""
+    db = tmp_path / "grader.sqlite"
+    keys = UnlockKeys(str(db), readonly=True)
+    assert keys == {}
+    keys["abc"] = "42"
+    keys.flush()
+    assert not db.exists()
+
+
+def test_legacy_keys(tmp_path):
+    """Test that keys stored in a SqliteDict by earlier versions are migrated once."""
+    db = str(tmp_path / "grader.sqlite")
+    with SqliteDict(db, tablename="unlock_keys", autocommit=True) as legacy:
+        legacy["abc"] = "42"
+        legacy["def"] = "FUNCTION"
+
+    assert UnlockKeys(db, readonly=True) == {"abc": "42", "def": "FUNCTION"}
+    keys = UnlockKeys(db)
+    assert keys == {"abc": "42", "def": "FUNCTION"}
+    # Keys are moved to the new table by the grader database's migrations
+    keys["ghi"] = "7"
+    keys.flush()
+    conn = sqlite3.connect(db)
+    rows = conn.execute("SELECT hash_code, output FROM unlocked_outputs").fetchall()
+    assert sorted(rows) == [("abc", "42"), ("def", "FUNCTION"), ("ghi", "7")]
+    # The legacy table is dropped once migrated
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'unlock_keys'").fetchone() is None
+    conn.close()
+    assert UnlockKeys(db) == {"abc": "42", "def": "FUNCTION", "ghi": "7"}
@@ -1,10 +1,11 @@
 import doctest
+import sqlite3
 import subprocess
 import sys
 import pytest
 from pathlib import Path
-from pytest_grader.lock_tests import (OutputPosition, lock_doctests_for_file, locked_hash,
-                                      substitute_function_outputs)
+from pytest_grader.lock_tests import (KeyDerivation, OutputPosition, lock_doctests_for_file,
+                                      locked_hash, read_key_derivation, substitute_function_outputs)
 from pytest_grader.plugins import UnlockPlugin
 
 EXAMPLES_DIR = Path(__file__).parent.parent / "examples"
@@ -108,6 +109,60 @@ def marker_below_decorator():
     assert "# LOCK" not in locked_content, "LOCK comments should be removed"
 
 
+def test_lock_function_forms(tmp_path):
+    """Test that `# LOCK` finds the docstring of methods, async functions, functions
+    with multi-line decorators and signatures, and docstrings on the line of the def."""
+    src_file = tmp_path / "src.py"
+    dst_file = tmp_path / "locked.py"
+    src_file.write_text('''import functools
+
+class Counter:
+    # LOCK
+    @functools.lru_cache(
+        maxsize=None,
+    )
+    def count(self, values: dict[str, int] = {"a": 1},
+              key: str = ":") -> int:
+        """
+        >>> Counter().count()
+        1
+        """
+        return 1
+
+# LOCK
+async def fetch():
+    \'\'\'
+    >>> 1 + 2
+    3
+    \'\'\'
+
+# LOCK
+def one_line(): """
+    >>> 4 + 4
+    8
+    """
+''')
+    assert lock_doctests_for_file(src_file, dst_file) == 3
+    locked_content = dst_file.read_text()
+    assert "# LOCK" not in locked_content
+    assert "\n        1\n" not in locked_content and "\n    3\n" not in locked_content
+
+
+def test_lock_marker_in_string_raises(tmp_path):
+    """Test that a `# LOCK` line inside a string is not mistaken for a marker on the next function."""
+    src_file = tmp_path / "src.py"
+    src_file.write_text('''TEXT = """
+# LOCK
+"""
+def f():
+    """
+    >>> f()
+    """
+''')
+    with pytest.raises(ValueError, match="line 2 does not precede a function definition"):
+        lock_doctests_for_file(src_file, tmp_path / "locked.py")
+
+
 def test_lock_preserves_blank_lines(tmp_path):
     """Test that locking removes only `# LOCK` lines and does not reformat the file."""
     source = '''def helper(x):
@@ -203,6 +258,158 @@ def adder_doctest():
     assert "1 passed" in result.stdout, result.stdout
 
 
+def test_pbkdf2_lock_unlock_roundtrip(tmp_path):
+    """Test that outputs locked with a salted, iterated KDF record it in a header and unlock."""
+    src_file = tmp_path / "src.py"
+    src_file.write_text('''# LOCK
+def square_doctest():
+    """
+    >>> 3 * 3
+    9
+    """
+''')
+    kdf = KeyDerivation("pbkdf2_sha256", 1000, "abcd")
+    locked_file = tmp_path / "locked.py"
+    assert lock_doctests_for_file(src_file, locked_file, kdf) == 1
+    lines = locked_file.read_text().split("\n")
+    assert lines[0] == "# pytest-grader lock: kdf=pbkdf2_sha256 iterations=1000 salt=abcd"
+    assert read_key_derivation(locked_file) == kdf
+    expected_hash = OutputPosition("square_doctest", 0).encode("9", kdf)
+    assert expected_hash != OutputPosition("square_doctest", 0).encode("9")
+    assert f"    LOCKED: {expected_hash}" in lines
+
+    # Without a salt, a random one is chosen
+    lock_doctests_for_file(src_file, locked_file, KeyDerivation("pbkdf2_sha256", 1000))
+    assert read_key_derivation(locked_file).salt not in (None, "abcd")
+
+    # Unlocking uses the KDF from the header
+    lock_doctests_for_file(src_file, locked_file, kdf)
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - locked.py\n')
+    result = subprocess.run([sys.executable, "-m", "pytest", "--doctest-modules", "-q", "-p",
+                             "pytest_grader.plugins", "locked.py", "--unlock"],
+                            input="8\n9\n", capture_output=True, text=True, cwd=tmp_path)
+    assert "Not quite" in result.stdout, result.stdout
+    assert "1 passed" in result.stdout, result.stdout
+
+
+def test_lock_header_placement_and_errors(tmp_path):
+    """Test that the lock header follows a shebang and encoding declaration, and
+    that a malformed header is reported with the name of its file."""
+    src_file = tmp_path / "src.py"
+    src_file.write_text('''#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# LOCK
+def square_doctest():
+    """
+    >>> 3 * 3
+    9
+    """
+''')
+    kdf = KeyDerivation("pbkdf2_sha256", 1000, "abcd")
+    locked_file = tmp_path / "locked.py"
+    lock_doctests_for_file(src_file, locked_file, kdf)
+    lines = locked_file.read_text().split("\n")
+    assert lines[:3] == ["#!/usr/bin/env python3", "# -*- coding: utf-8 -*-", kdf.header()]
+    assert read_key_derivation(locked_file) == kdf
+
+    locked_file.write_text(locked_file.read_text().replace("kdf=pbkdf2_sha256 ", ""))
+    with pytest.raises(pytest.UsageError, match="locked.py: Malformed lock header"):
+        read_key_derivation(locked_file)
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - locked.py\n')
+    (tmp_path / "answers.yaml").write_text('square_doctest: [9]\n')
+    result = subprocess.run([sys.executable, "-m", "pytest", "--doctest-modules", "-q", "-p",
+                             "pytest_grader.plugins", "locked.py", "--unlock-from", "answers.yaml"],
+                            capture_output=True, text=True, cwd=tmp_path)
+    assert "locked.py: Malformed lock header" in result.stderr, result.stdout + result.stderr
+    assert "Traceback" not in result.stdout + result.stderr
+
+
+def test_unlock_from_answers(tmp_path):
+    """Test that outputs are unlocked from a file of answers, reporting those still locked."""
+    src_file = tmp_path / "src.py"
+    src_file.write_text('''# LOCK
+def square_doctest():
+    """
+    >>> 3 * 3
+    9
+    >>> 4 * 4
+    16
+    """
+
+# LOCK
+def cube_doctest():
+    """
+    >>> 2 ** 3
+    8
+    """
+''')
+    lock_doctests_for_file(src_file, tmp_path / "locked.py")
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - locked.py\n')
+    (tmp_path / "answers.yaml").write_text('square_doctest: [9, 15]\ncube_doctest:\n  0: "8"\n')
+
+    result = subprocess.run([sys.executable, "-m", "pytest_grader", "unlock", "answers.yaml",
+                             "--doctest-modules", "locked.py"],
+                            capture_output=True, text=True, cwd=tmp_path)
+    assert result.returncode == 1, result.stdout + result.stderr
+    assert "Unlocked 2 outputs from answers.yaml" in result.stdout, result.stdout
+    assert "Still locked: square_doctest[1]" in result.stdout, result.stdout
+    assert "PytestAssertRewriteWarning" not in result.stdout + result.stderr
+
+    conn = sqlite3.connect(tmp_path / "grader.sqlite")
+    attempts = conn.execute("SELECT name, guess, success FROM unlock_attempts").fetchall()
+    conn.close()
+    assert sorted(attempts) == [("cube_doctest[0]", "8", 1), ("square_doctest[0]", "9", 1),
+                                ("square_doctest[1]", "15", 0)]
+
+    # Correcting the answer unlocks the rest, and only the new guess is checked
+    (tmp_path / "answers.yaml").write_text('square_doctest: {1: 16}\n')
+    pytest_cmd = [sys.executable, "-m", "pytest", "--doctest-modules", "-q",
+                  "-p", "pytest_grader.plugins", "locked.py"]
+    result = subprocess.run(pytest_cmd + ["--unlock-from", "answers.yaml"],
+                            capture_output=True, text=True, cwd=tmp_path)
+    assert "Unlocked 1 outputs from answers.yaml" in result.stdout, result.stdout
+    assert "Still locked" not in result.stdout, result.stdout
+    assert "2 passed" in result.stdout, result.stdout
+
+
+
+def test_unlock_from_answers_as_written(tmp_path):
+    """Test that answers are read as written, not converted to YAML's types."""
+    src_file = tmp_path / "src.py"
+    src_file.write_text('''# LOCK
+def words_doctest():
+    """
+    >>> print('yes')
+    yes
+    >>> print('1:30')
+    1:30
+    >>> 'a'
+    'a'
+    >>> print('null')
+    null
+    """
+''')
+    lock_doctests_for_file(src_file, tmp_path / "locked.py")
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - locked.py\n')
+    (tmp_path / "answers.yaml").write_text('words_doctest: [yes, 1:30, "\'a\'", null]\n')
+
+    result = subprocess.run([sys.executable, "-m", "pytest_grader", "unlock", "answers.yaml",
+                             "--doctest-modules", "locked.py"],
+                            capture_output=True, text=True, cwd=tmp_path)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "Unlocked 4 outputs from answers.yaml" in result.stdout, result.stdout
+
+
+def test_key_derivation_cache():
+    """Test that each guess at an output is only hashed once."""
+    kdf = KeyDerivation("pbkdf2_sha256", 1000, "abcd")
+    position = OutputPosition("f", 0)
+    first = position.encode("42", kdf)
+    assert kdf.cache == {"f:0:42": first}
+    kdf.cache["f:0:42"] = "cached"
+    assert position.encode("42", kdf) == "cached"
+
+
 def test_unlock_plugin_substitution():
     """Test that UnlockPlugin correctly substitutes locked outputs with unlocked values."""
     func_name = "test_func"
@@ -351,4 +558,41 @@ def unlocked_function():
 
     # The locked function's output is replaced; the unlocked function's is preserved
     assert not any(line.strip() == '42' for line in lines), "Original output '42' should be replaced with LOCKED:"
-    assert any(line.strip() == '123' for line in lines), "Original output '123' should be preserved in unlocked function"
\ No newline at end of file
+    assert any(line.strip() == '123' for line in lines), "Original output '123' should be preserved in unlocked function"
+
+
+def test_lock_directory(tmp_path):
+    """Test that locking a directory mirrors it and skips files unchanged since the last run."""
+    src_dir = tmp_path / "course"
+    dst_dir = tmp_path / "release"
+    (src_dir / "hw01").mkdir(parents=True)
+    (src_dir / "hw01" / "hw01.py").write_text((EXAMPLES_DIR / "lock.py").read_text())
+    (src_dir / "hw01" / "data.txt").write_text("1 2 3\n")
+    (src_dir / "hw02").mkdir()
+    (src_dir / "hw02" / "hw02.py").write_text("def f():\n    return 1\n")
+    (src_dir / "hw02" / "__pycache__").mkdir()
+    (src_dir / "hw02" / "__pycache__" / "hw02.cpython-311.pyc").write_bytes(b"")
+
+    def lock(*args):
+        result = subprocess.run([sys.executable, "-m", "pytest_grader", "lock", str(src_dir), str(dst_dir),
+                                 "--jobs", "2", *args], capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        return result.stdout
+
+    output = lock()
+    assert "Locked hw01/hw01.py (6 outputs locked" in output
+    assert "Copied hw01/data.txt" in output
+    assert "Locked 2 files (6 outputs) and copied 1" in output
+    assert (dst_dir / "hw01" / "hw01.py").read_text() == (EXAMPLES_DIR / "locked_expected.py").read_text()
+    assert (dst_dir / "hw01" / "data.txt").read_text() == "1 2 3\n"
+    assert not (dst_dir / "hw02" / "__pycache__").exists()
+
+    (src_dir / "hw02" / "hw02.py").write_text("def f():\n    return 2\n")
+    output = lock()
+    assert "hw01" not in output
+    assert "Locked hw02/hw02.py (0 outputs locked" in output
+    assert "Locked 1 files (0 outputs) and copied 0" in output
+    assert "2 unchanged" in output
+    assert (dst_dir / "hw02" / "hw02.py").read_text() == "def f():\n    return 2\n"
+
+    assert "Locked 2 files (6 outputs) and copied 1" in lock("--force")
@@ -1,7 +1,12 @@
 import pytest
 import tempfile
 import os
-from pytest_grader.logger import SQLLogger
+import pickle
+import sqlite3
+import subprocess
+import sys
+from pytest_grader.logger import SQLLogger, stored_conf
+from sqlitedict import SqliteDict
 
 
 @pytest.fixture
@@ -59,10 +64,31 @@ def test_test_case(logger):
     
     logger.test_case("test_example", True, "AI response here")
     
-    # Check that test case was stored
-    logger.cursor.execute("SELECT name, passed, response FROM test_cases")
-    result = logger.cursor.fetchone()
-    assert result == ("test_example", True, "AI response here")
+    # Check that test case was stored, with its response in the responses table
+    logger.cursor.execute("SELECT name, passed, response_sha1 FROM test_cases")
+    name, passed, response_sha1 = logger.cursor.fetchone()
+    assert (name, passed) == ("test_example", True)
+    assert logger.get_response(response_sha1) == "AI response here"
+
+
+def test_responses_deduplicated(temp_db):
+    """Test that responses are truncated, compressed, and stored once however often they repeat."""
+    logger = SQLLogger(temp_db, {'response_limit': 1000, 'log_batch_size': 10})
+    logger.snapshot()
+    failure = "Expected:\n    4\nGot:\n    5\n" * 200
+    for _ in range(50):
+        logger.test_case("test_example", False, failure)
+    logger.test_case("test_other", True)
+    logger.flush()
+
+    rows = logger.conn.execute("SELECT DISTINCT response_sha1 FROM test_cases WHERE NOT passed").fetchall()
+    assert len(rows) == 1
+    content, codec = logger.conn.execute("SELECT content, codec FROM responses").fetchone()
+    assert codec == "zlib" and len(content) < 500
+    response = logger.get_response(rows[0][0])
+    assert len(response) < 1100 and "characters truncated" in response
+    assert response.startswith("Expected:") and response.endswith("Got:\n    5\n")
+    logger.close()
 
 
 def test_unlock_attempt(logger):
@@ -74,4 +100,273 @@ def test_unlock_attempt(logger):
     # Check that unlock attempt was stored
     logger.cursor.execute("SELECT name, guess, success, response FROM unlock_attempts")
     result = logger.cursor.fetchone()
-    assert result == ("test_unlock[0]", "my guess", False, "AI response")
\ No newline at end of file
+    assert result == ("test_unlock[0]", "my guess", False, "AI response")
+
+
+def count_rows(db_path, table):
+    """Count the rows of a table as seen by a separate connection."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_buffered_test_cases(temp_db, temp_file):
+    """Test that buffered test cases are written together when flushed."""
+    logger = SQLLogger(temp_db, {'included_files': [temp_file], 'log_batch_size': 10})
+    logger.snapshot()
+
+    for i in range(3):
+        logger.test_case(f"test_{i}", True)
+    assert count_rows(temp_db, "test_cases") == 0, "Rows should be queued until flushed"
+
+    logger.flush()
+    assert count_rows(temp_db, "test_cases") == 3
+    logger.close()
+
+
+def test_buffered_batch_size(temp_db, temp_file):
+    """Test that a full batch is flushed without an explicit flush."""
+    logger = SQLLogger(temp_db, {'included_files': [temp_file], 'log_batch_size': 2})
+    logger.snapshot()
+
+    logger.test_case("test_a", True)
+    logger.unlock_attempt("test_b", 0, "guess", False)
+    assert count_rows(temp_db, "test_cases") == 1
+    assert count_rows(temp_db, "unlock_attempts") == 1
+    logger.close()
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="SIGTERM can't be handled on Windows")
+def test_buffered_rows_flushed_on_sigterm(tmp_path):
+    """Test that SIGTERM ends the run through pytest's exit path, which flushes buffered rows."""
+    (tmp_path / "test_s.py").write_text(
+        'import os\nimport signal\n\n'
+        'def test_1():\n    pass\n\n'
+        'def test_terminated():\n    os.kill(os.getpid(), signal.SIGTERM)\n\n'
+        'def test_not_run():\n    pass\n')
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - test_s.py\nlog_batch_size: 100\n')
+    result = subprocess.run([sys.executable, "-m", "pytest", "-p", "pytest_grader.plugins", "test_s.py"],
+                            capture_output=True, text=True, cwd=tmp_path, timeout=60)
+    assert result.returncode == 143, result.stdout + result.stderr
+    assert "Terminated by signal 15" in result.stdout, result.stdout
+    conn = sqlite3.connect(tmp_path / "grader.sqlite")
+    assert conn.execute("SELECT name FROM test_cases").fetchall() == [("test_1",)]
+    conn.close()
+
+
+def test_connection_pragmas(tmp_path):
+    """Test that journal_mode and synchronous are configurable."""
+    logger = SQLLogger(str(tmp_path / "grader.sqlite"), {'journal_mode': 'WAL', 'synchronous': 'normal'})
+    assert logger.cursor.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert logger.cursor.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    logger.close()
+
+    with pytest.raises(ValueError, match="Invalid synchronous"):
+        SQLLogger(str(tmp_path / "other.sqlite"), {'synchronous': 'sometimes'})
+
+
+def test_snapshot_skips_unchanged_files(logger, temp_file, monkeypatch):
+    """Test that files whose size, mtime, and inode are unchanged are not re-hashed."""
+    from pytest_grader import logger as logger_module
+    hashed = []
+    original_file_sha1 = logger_module.file_sha1
+    monkeypatch.setattr(logger_module, 'file_sha1',
+                        lambda filename: hashed.append(filename) or original_file_sha1(filename))
+
+    # Files modified very recently are always re-hashed, so backdate the file.
+    os.utime(temp_file, ns=(0, 10**18))
+    logger.snapshot()
+    logger.snapshot()
+    assert hashed == [temp_file]
+
+    with open(temp_file, 'a') as f:
+        f.write("# changed\n")
+    os.utime(temp_file, ns=(0, 15 * 10**17))
+    logger.snapshot()
+    assert hashed == [temp_file, temp_file]
+
+    logger.cursor.execute("SELECT COUNT(*) FROM files")
+    assert logger.cursor.fetchone()[0] == 2
+    logger.cursor.execute("SELECT snapshot_id, sha1_hash FROM snapshot_files ORDER BY id")
+    rows = logger.cursor.fetchall()
+    assert [row[0] for row in rows] == [1, 2, 3]
+    assert rows[0][1] == rows[1][1] != rows[2][1]
+
+
+@pytest.mark.parametrize("storage", ["plain", "compressed", "delta"])
+def test_file_storage(tmp_path, storage):
+    """Test that every stored file version can be read back with get_file."""
+    source = tmp_path / "hog.py"
+    logger = SQLLogger(str(tmp_path / "grader.sqlite"), {
+        'included_files': [str(source)], 'file_storage': storage, 'keyframe_interval': 3})
+
+    lines = [f"def f{i}():\n    return {i}\n" for i in range(200)]
+    versions = []
+    for version in range(5):
+        lines[version * 10] = f"def f{version * 10}():\n    return 'changed in {version}'\n"
+        versions.append(''.join(lines))
+        source.write_text(versions[-1])
+        logger.snapshot()
+
+    logger.cursor.execute("SELECT sha1_hash, depth FROM files ORDER BY id")
+    rows = logger.cursor.fetchall()
+    assert len(rows) == 5
+    for (sha1_hash, _), content in zip(rows, versions):
+        assert logger.get_file(sha1_hash) == content
+    if storage == "delta":
+        assert [depth for _, depth in rows] == [0, 1, 2, 0, 1]
+    else:
+        assert [depth for _, depth in rows] == [0] * 5
+    assert logger.get_file("0" * 40) is None
+    logger.close()
+
+
+def test_add_storage_columns_to_old_database(tmp_path):
+    """Test that a database created before compressed storage gains its columns."""
+    db_path = str(tmp_path / "grader.sqlite")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE files (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT NOT NULL, "
+                 "content TEXT NOT NULL, sha1_hash TEXT NOT NULL UNIQUE)")
+    conn.execute("INSERT INTO files (filename, content, sha1_hash) VALUES ('a.py', 'x = 1', 'abc')")
+    conn.commit()
+    conn.close()
+
+    logger = SQLLogger(db_path, {'file_storage': 'delta'})
+    assert logger.get_file('abc') == 'x = 1'
+    logger.close()
+
+
+def test_store_conf_only_when_changed(tmp_path):
+    """Test that the configuration is stored in SqliteDict's layout, and only rewritten when it changes."""
+    db_path = str(tmp_path / "grader.sqlite")
+    logger = SQLLogger(db_path, {})
+    logger.store_conf({'included_files': ['a.py']}, 'hash1')
+    logger.conn.execute("UPDATE conf SET value = ? WHERE key = 'included_files'", (pickle.dumps(['b.py']),))
+    logger.conn.commit()
+
+    logger.store_conf({'included_files': ['a.py']}, 'hash1')
+    logger.close()
+    with SqliteDict(db_path, tablename="conf") as conf:
+        assert conf['included_files'] == ['b.py']
+
+    logger = SQLLogger(db_path, {})
+    logger.store_conf({'included_files': ['c.py']}, 'hash2')
+    logger.close()
+    with SqliteDict(db_path, tablename="conf") as conf:
+        assert conf['included_files'] == ['c.py']
+
+
+def test_stored_conf(tmp_path):
+    """Test that the stored configuration is read back only for the hash of its source."""
+    db_path = str(tmp_path / "grader.sqlite")
+    assert stored_conf(db_path, 'hash1') is None  # No database yet
+    assert not (tmp_path / "grader.sqlite").exists()
+    logger = SQLLogger(db_path, {})
+    logger.store_conf({'included_files': ['a.py'], 'isolation': 'fork'}, 'hash1')
+    assert stored_conf(db_path, 'hash1') == {'included_files': ['a.py'], 'isolation': 'fork'}
+    # Keys removed from the configuration are not read back.
+    logger.store_conf({'included_files': ['a.py']}, 'hash2')
+    logger.close()
+    assert stored_conf(db_path, 'hash1') is None
+    assert stored_conf(db_path, 'hash2') == {'included_files': ['a.py']}
+
+
+def test_compact(tmp_path):
+    """Test that compacting merges identical consecutive snapshots and prunes old file versions."""
+    db_path = str(tmp_path / "grader.sqlite")
+    source = tmp_path / "hw.py"
+    conf = {'included_files': [str(source)], 'file_storage': 'compressed'}
+    logger = SQLLogger(db_path, conf)
+    for version in [1, 1, 1, 2, 3, 3, 1]:
+        source.write_text(f"x = {version}\n" * 100 + "y = 0\n" * version)
+        logger.snapshot()
+        logger.test_case("test_x", version == 3)
+    hashes = [row[0] for row in logger.conn.execute("SELECT sha1_hash FROM files ORDER BY id")]
+    assert len(hashes) == 3
+
+    assert logger.compact(keep_versions=1) == {'merged_snapshots': 3, 'pruned_versions': 1}
+    snapshots = [row[0] for row in logger.conn.execute("SELECT id FROM snapshots ORDER BY id")]
+    assert snapshots == [1, 4, 5, 7]
+    # Test cases of merged snapshots now belong to the snapshot they were merged into
+    assert logger.conn.execute("SELECT snapshot_id, COUNT(*) FROM test_cases GROUP BY snapshot_id").fetchall() \
+        == [(1, 3), (4, 1), (5, 2), (7, 1)]
+    assert logger.conn.execute("SELECT COUNT(*) FROM snapshot_files").fetchone() == (4,)
+    # Version 1 is in the last snapshot and version 3 is the newest, so only version 2 is pruned
+    assert logger.get_file(hashes[0]).endswith("y = 0\n")
+    assert logger.get_file(hashes[1]) is None
+    assert logger.get_file(hashes[2]).count("y = 0") == 3
+
+    # Reverting to a pruned version stores its content again
+    source.write_text("x = 2\n" * 100 + "y = 0\n" * 2)
+    logger.snapshot()
+    assert logger.file_hashes()[str(source)] == hashes[1]
+    assert logger.get_file(hashes[1]) == source.read_text()
+    logger.close()
+
+    # Versions that a kept version is a delta against are kept too
+    db_path = str(tmp_path / "delta.sqlite")
+    logger = SQLLogger(db_path, {'included_files': [str(source)], 'file_storage': 'delta'})
+    for version in [1, 2, 3]:
+        source.write_text("".join(f"line_{i} = {i * i}\n" for i in range(500)) + f"x = {version}\n")
+        logger.snapshot()
+    assert logger.conn.execute("SELECT MAX(depth) FROM files").fetchone() == (2,)
+    assert logger.compact(keep_versions=1) == {'merged_snapshots': 0, 'pruned_versions': 0}
+    assert logger.get_file(logger.file_hashes()[str(source)]).endswith("x = 3\n")
+    logger.close()
+
+
+def test_compact_keeps_run_order(tmp_path):
+    """Test that compacting doesn't merge a snapshot in which a test's outcome changed."""
+    db_path = str(tmp_path / "grader.sqlite")
+    source = tmp_path / "hw.py"
+    source.write_text("x = 1\n")
+    logger = SQLLogger(db_path, {'included_files': [str(source)]})
+    for passed in [False, True, False, False]:
+        logger.snapshot()
+        logger.test_case("test_x", passed)
+    assert logger.compact() == {'merged_snapshots': 1, 'pruned_versions': 0}
+    logger.snapshot()
+    assert logger.test_history() == {"test_x": (False, [])}
+    logger.close()
+
+
+def test_schema_migrations(tmp_path, monkeypatch):
+    """Test that migrations create the tables and indexes once, and are skipped once applied."""
+    db_path = str(tmp_path / "grader.sqlite")
+    SQLLogger(db_path, {}).close()
+    conn = sqlite3.connect(db_path)
+    assert [row[0] for row in conn.execute("SELECT version FROM schema_migrations")] == [1, 2, 3, 4, 5]
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"snapshot_files_snapshot", "test_cases_name_snapshot", "test_cases_snapshot",
+            "unlock_attempts_name"} <= indexes
+    conn.close()
+
+    def fail():
+        raise AssertionError("migration applied twice")
+    monkeypatch.setattr(SQLLogger, "_create_tables", lambda self: fail())
+    SQLLogger(db_path, {}).close()
+
+
+def test_migrate_unversioned_database(tmp_path):
+    """Test that a database created before schema versioning is migrated, keeping its rows."""
+    db_path = str(tmp_path / "grader.sqlite")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE test_cases (id INTEGER PRIMARY KEY AUTOINCREMENT, snapshot_id INTEGER, "
+                 "name TEXT NOT NULL, passed BOOLEAN NOT NULL, response TEXT)")
+    conn.execute("INSERT INTO test_cases (snapshot_id, name, passed) VALUES (1, 'test_a', 1)")
+    conn.execute("INSERT INTO test_cases (snapshot_id, name, passed, response) VALUES (1, 'test_b', 0, 'Expected 1')")
+    conn.commit()
+    conn.close()
+
+    logger = SQLLogger(db_path, {})
+    assert logger.conn.execute("SELECT name, passed, duration FROM test_cases").fetchall() == [
+        ("test_a", 1, None), ("test_b", 0, None)]
+    assert logger._schema_version() == len(SQLLogger.MIGRATIONS)
+    # Responses are moved to the responses table, and the response column is dropped
+    (response_sha1,) = logger.conn.execute("SELECT response_sha1 FROM test_cases WHERE name = 'test_b'").fetchone()
+    assert logger.get_response(response_sha1) == "Expected 1"
+    columns = {row[1] for row in logger.conn.execute("PRAGMA table_info(test_cases)")}
+    assert "response" not in columns and "response_sha1" in columns
+    logger.close()
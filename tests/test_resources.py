@@ -0,0 +1,59 @@
+import json
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+TESTS = '''
+import time
+
+def allocate():
+    return b"x" * 50_000_000
+
+def test_memory():
+    assert len(allocate()) == 50_000_000
+
+def test_cpu():
+    start = time.process_time()
+    while time.process_time() - start < 0.05:
+        pass
+'''
+
+
+def run_pytest(tmp_path, *args):
+    result = subprocess.run([sys.executable, "-m", "pytest", "-q", "-p", "pytest_grader.plugins",
+                             "test_r.py", *args], capture_output=True, text=True, cwd=tmp_path)
+    assert "2 passed" in result.stdout, result.stdout + result.stderr
+    conn = sqlite3.connect(tmp_path / "grader.sqlite")
+    rows = conn.execute("SELECT name, cpu_time, rss_delta, memory_peak, profile FROM test_cases "
+                        "WHERE snapshot_id = (SELECT MAX(id) FROM snapshots)").fetchall()
+    conn.close()
+    return {name: row for name, *row in rows}
+
+
+@pytest.mark.parametrize("isolation", ["", "isolation: fork\n"])
+def test_resources_logged(tmp_path, isolation):
+    """Test that the CPU time and memory growth of each test are logged, in or out of a fork."""
+    (tmp_path / "test_r.py").write_text(TESTS)
+    (tmp_path / "grader.yaml").write_text(isolation)
+
+    rows = run_pytest(tmp_path)
+    cpu_time, rss_delta, memory_peak, profile = rows["test_cpu"]
+    assert cpu_time >= 0.05
+    assert memory_peak is None and profile is None
+    if sys.platform != 'win32':
+        assert rows["test_memory"][1] > 40_000  # kilobytes
+
+
+def test_grader_profile(tmp_path):
+    """Test that --grader-profile logs the peak Python allocation and a profile of each test."""
+    (tmp_path / "test_r.py").write_text(TESTS)
+    (tmp_path / "grader.yaml").write_text("")
+
+    rows = run_pytest(tmp_path, "--grader-profile")
+    _, _, memory_peak, profile = rows["test_memory"]
+    assert memory_peak >= 50_000_000
+    functions = json.loads(profile)
+    assert any(entry["function"].endswith("(allocate)") for entry in functions), functions
+    assert all(entry["calls"] >= 1 for entry in functions)
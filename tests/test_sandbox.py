@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason="requires os.fork")
+
+
+def test_fork_isolation(tmp_path):
+    """Test that isolation: fork isolates tests and enforces time and memory limits."""
+    (tmp_path / "counter.py").write_text('count = 0\n')
+    (tmp_path / "test_forked.py").write_text('''
+import os
+import sqlite3
+import time
+import counter
+from pytest_grader import memory_limit, points, timeout
+
+@points(1)
+def test_increment():
+    counter.count += 1
+    assert counter.count == 1
+
+@points(1)
+def test_increment_again():
+    counter.count += 1
+    assert counter.count == 1
+
+@points(1)
+@timeout(0.5)
+def test_too_slow():
+    time.sleep(10)
+
+@points(1)
+@memory_limit(200)
+def test_too_big():
+    big = bytearray(500 * 1024 * 1024)
+
+@points(1)
+def test_crash():
+    os._exit(3)
+''')
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - counter.py\nisolation: fork\n')
+    result = subprocess.run([sys.executable, "-m", "pytest", "-p", "pytest_grader.plugins",
+                             "test_forked.py", "--score"],
+                            capture_output=True, text=True, cwd=tmp_path, timeout=60)
+    output = result.stdout
+    assert "3 failed, 2 passed" in output, output
+    assert "exceeded the time limit of 0.5 seconds" in output
+    assert "MemoryError" in output
+    assert "exited with status 3" in output
+    assert "Total Score: 2/5" in output
+
+
+def test_fork_memory_limit_is_on_growth(tmp_path):
+    """Test that memory the pytest process already mapped doesn't count toward a test's limit."""
+    # Reserved, but not touched, so that it adds to the address space and not to memory use
+    (tmp_path / "big.py").write_text('import mmap\nRESERVED = mmap.mmap(-1, 400 * 1024 * 1024)\n')
+    (tmp_path / "test_forked.py").write_text('''
+import big
+from pytest_grader import memory_limit
+
+@memory_limit(200)
+def test_small():
+    small = bytearray(10 * 1024 * 1024)
+
+@memory_limit(200)
+def test_too_big():
+    big = bytearray(500 * 1024 * 1024)
+''')
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - big.py\nisolation: fork\n')
+    result = subprocess.run([sys.executable, "-m", "pytest", "-p", "pytest_grader.plugins", "test_forked.py"],
+                            capture_output=True, text=True, cwd=tmp_path, timeout=60)
+    assert "1 failed, 1 passed" in result.stdout, result.stdout
+    assert "MemoryError" in result.stdout
+
+
+def test_fork_memory_limit_unknown_address_space(tmp_path):
+    """Test that no memory limit is set, with a warning, where the address space's size is unknown."""
+    (tmp_path / "conftest.py").write_text(
+        'import pytest_grader.sandbox\npytest_grader.sandbox._address_space = lambda: None\n')
+    (tmp_path / "test_forked.py").write_text('''
+from pytest_grader import memory_limit
+
+@memory_limit(200)
+def test_small():
+    small = bytearray(10 * 1024 * 1024)
+
+@memory_limit(200)
+def test_also_small():
+    small = bytearray(10 * 1024 * 1024)
+''')
+    (tmp_path / "grader.yaml").write_text('included_files: []\nisolation: fork\n')
+    result = subprocess.run([sys.executable, "-m", "pytest", "-p", "pytest_grader.plugins", "test_forked.py"],
+                            capture_output=True, text=True, cwd=tmp_path, timeout=60)
+    assert "2 passed, 1 warning" in result.stdout, result.stdout
+    assert "Memory limits are not enforced" in result.stdout
+
+
+def test_fork_sigterm_logged_once(tmp_path):
+    """Test that a forked test killed by SIGTERM doesn't flush the parent's buffered rows itself."""
+    (tmp_path / "counter.py").write_text('count = 0\n')
+    (tmp_path / "test_forked.py").write_text('''
+import os
+import sqlite3
+import signal
+
+def test_1():
+    pass
+
+def test_2():
+    assert False
+
+def test_terminated():
+    os.kill(os.getpid(), signal.SIGTERM)
+''')
+    (tmp_path / "grader.yaml").write_text(
+        'included_files:\n  - counter.py\nisolation: fork\nlog_batch_size: 100\n')
+    result = subprocess.run([sys.executable, "-m", "pytest", "-p", "pytest_grader.plugins", "test_forked.py"],
+                            capture_output=True, text=True, cwd=tmp_path, timeout=60)
+    assert "killed by signal 15" in result.stdout, result.stdout
+    conn = sqlite3.connect(tmp_path / "grader.sqlite")
+    names = sorted(row[0] for row in conn.execute("SELECT name FROM test_cases"))
+    conn.close()
+    assert names == ["test_1", "test_2", "test_terminated"]
@@ -0,0 +1,75 @@
+import re
+import subprocess
+import sys
+
+TESTS = '''
+import time
+from pytest_grader import points
+
+@points(1)
+def test_slow_cheap():
+    time.sleep(0.3)
+
+@points(10)
+def test_fast_valuable():
+    pass
+
+@points(5)
+def test_slow_valuable():
+    time.sleep(0.3)
+'''
+
+
+def run_pytest(tmp_path, *args):
+    return subprocess.run([sys.executable, "-m", "pytest", "test_timed.py", "-v",
+                           "-p", "pytest_grader.plugins", *args],
+                          capture_output=True, text=True, cwd=tmp_path)
+
+
+def test_points_per_second_order(tmp_path):
+    """Test that --score-order=points-per-second runs the best-value tests first."""
+    (tmp_path / "test_timed.py").write_text(TESTS)
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - test_timed.py\n')
+
+    # The first run records durations in the grader database.
+    run_pytest(tmp_path)
+    result = run_pytest(tmp_path, "--score-order=points-per-second")
+    order = [line.split("::")[1].split()[0] for line in result.stdout.splitlines()
+             if line.startswith("test_timed.py::")]
+    assert order == ["test_fast_valuable", "test_slow_valuable", "test_slow_cheap"], result.stdout
+
+
+def test_time_budget(tmp_path):
+    """Test that tests started after the --time-budget runs out are skipped and not earned."""
+    (tmp_path / "test_timed.py").write_text(TESTS)
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - test_timed.py\n')
+
+    # With no recorded durations, the most valuable tests run first.
+    result = run_pytest(tmp_path, "--score", "--time-budget", "0.1",
+                        "--score-order=points-per-second")
+    assert "2 passed, 1 skipped" in result.stdout, result.stdout
+    assert "Total Score: 15/16" in result.stdout
+    assert "Time budget exhausted: 1 tests were not run" in result.stdout
+
+
+def test_failed_first_order(tmp_path):
+    """Test that --score-order=failed-first runs failing tests first and tests
+    whose files are unchanged since they passed last."""
+    (tmp_path / "a.py").write_text('def f():\n    """\n    >>> 1\n    1\n    """\n')
+    (tmp_path / "b.py").write_text('def g():\n    """\n    >>> 2\n    2\n    """\n')
+    (tmp_path / "c.py").write_text('def h():\n    """\n    >>> 3\n    4\n    """\n')
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - a.py\n  - b.py\n  - c.py\n')
+
+    def run():
+        result = subprocess.run([sys.executable, "-m", "pytest", "--doctest-modules", "-v",
+                                 "-p", "pytest_grader.plugins", "--score-order=failed-first",
+                                 "a.py", "b.py", "c.py"],
+                                capture_output=True, text=True, cwd=tmp_path)
+        return [line.split()[0] for line in result.stdout.splitlines()
+                if re.match(r"\S+\.py::\S+ (PASSED|FAILED)", line)]
+
+    # With no history, every test is run in collection order.
+    assert run() == ["a.py::a.f", "b.py::b.g", "c.py::c.h"]
+
+    (tmp_path / "b.py").write_text('def g():\n    """\n    >>> 2\n    2\n    """\n    return 2\n')
+    assert run() == ["c.py::c.h", "b.py::b.g", "a.py::a.f"]
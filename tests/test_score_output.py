@@ -0,0 +1,65 @@
+import csv
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+EXAMPLES_DIR = Path(__file__).parent.parent / "examples"
+
+
+def run_partial_credit(tmp_path, *args):
+    (tmp_path / "partial_credit.py").write_text((EXAMPLES_DIR / "partial_credit.py").read_text())
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - partial_credit.py\n')
+    return subprocess.run([sys.executable, "-m", "pytest", "partial_credit.py",
+                           "-p", "pytest_grader.plugins", *args],
+                          capture_output=True, text=True, cwd=tmp_path)
+
+
+def test_score_output_jsonl(tmp_path):
+    """Test that --score-format jsonl writes a record per test and a total."""
+    run_partial_credit(tmp_path, "--score-format", "jsonl", "--score-output", "score.jsonl")
+    records = [json.loads(line) for line in (tmp_path / "score.jsonl").read_text().splitlines()]
+    assert [(r["type"], r["nodeid"], r["outcome"], r["earned"], r["points"]) for r in records] == [
+        ("test", "partial_credit.py::test_square_int", "passed", 3, 3),
+        ("test", "partial_credit.py::test_square_float", "failed", 0, 2),
+        ("test", "partial_credit.py::test_twice_function", "passed", 4, 4),
+        ("total", "", "", 7, 9),
+    ]
+    assert all(record["duration"] >= 0 for record in records)
+
+
+def test_score_output_zero_point_tests(tmp_path):
+    """Test that tests without points are recorded with 0 points, without changing the total."""
+    (tmp_path / "test_mixed.py").write_text(
+        'from pytest_grader import points\n\n'
+        '@points(2)\ndef test_scored():\n    pass\n\n'
+        'def test_unscored():\n    assert False\n')
+    (tmp_path / "grader.yaml").write_text('included_files: []\n')
+    subprocess.run([sys.executable, "-m", "pytest", "test_mixed.py", "-p", "pytest_grader.plugins",
+                    "--score-format", "jsonl", "--score-output", "score.jsonl"],
+                   capture_output=True, text=True, cwd=tmp_path)
+    records = [json.loads(line) for line in (tmp_path / "score.jsonl").read_text().splitlines()]
+    assert [(r["type"], r["nodeid"], r["outcome"], r["earned"], r["points"]) for r in records] == [
+        ("test", "test_mixed.py::test_scored", "passed", 2, 2),
+        ("test", "test_mixed.py::test_unscored", "failed", 0, 0),
+        ("total", "", "", 2, 2),
+    ]
+
+
+def test_score_output_csv(tmp_path):
+    """Test that --score-format csv writes a header, a row per test, and a total."""
+    run_partial_credit(tmp_path, "--score-format", "csv", "--score-output", "score.csv")
+    with open(tmp_path / "score.csv", newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [row["outcome"] for row in rows] == ["passed", "failed", "passed", ""]
+    assert (rows[-1]["type"], rows[-1]["earned"], rows[-1]["points"]) == ("total", "7", "9")
+
+
+def test_score_format_json_in_terminal(tmp_path):
+    """Test that --score-format json without --score-output prints the report."""
+    result = run_partial_credit(tmp_path, "--score-format", "json")
+    output = result.stdout
+    document = json.loads(output[output.index("{"):output.rindex("}") + 1])
+    assert len(document["tests"]) == 3
+    assert (document["total"]["earned"], document["total"]["points"]) == (7, 9)
+    assert "Total Score" not in output
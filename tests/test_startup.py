@@ -0,0 +1,42 @@
+import subprocess
+import sys
+
+
+def test_import_defers_heavy_modules():
+    """Test that importing the plugin does not import modules only some runs need."""
+    result = subprocess.run([sys.executable, "-c",
+                             "import sys, pytest_grader; "
+                             "print(sorted({'yaml', 'sqlitedict', 'concurrent.futures.process'} & set(sys.modules)))"],
+                            capture_output=True, text=True)
+    assert result.stdout.strip() == "[]", result.stdout + result.stderr
+
+
+def test_help_does_not_configure(tmp_path):
+    """Test that pytest --help neither needs grader.yaml nor creates the grader database."""
+    result = subprocess.run([sys.executable, "-m", "pytest", "-p", "pytest_grader.plugins", "--help"],
+                            capture_output=True, text=True, cwd=tmp_path)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "--unlock-from" in result.stdout
+    assert not (tmp_path / "grader.sqlite").exists()
+
+
+def test_startup_defers_database_and_yaml(tmp_path):
+    """Test that a run that logs nothing leaves the grader database alone, and
+    that PyYAML is only imported when grader.yaml changed since it was stored."""
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - test_one.py\n')
+    (tmp_path / "test_one.py").write_text('def test_one():\n    pass\n')
+    (tmp_path / "conftest.py").write_text(
+        'import sys\n\n'
+        'def pytest_unconfigure(config):\n'
+        '    with open("modules.txt", "a") as f:\n'
+        '        f.write(f"{\'yaml\' in sys.modules}\\n")\n')
+    pytest = [sys.executable, "-m", "pytest", "-p", "pytest_grader.plugins", "-p", "no:cacheprovider"]
+
+    subprocess.run(pytest + ["-k", "nothing"], capture_output=True, cwd=tmp_path)
+    assert not (tmp_path / "grader.sqlite").exists()
+    for _ in range(2):
+        result = subprocess.run(pytest, capture_output=True, text=True, cwd=tmp_path)
+        assert result.returncode == 0, result.stdout + result.stderr
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - conftest.py\n')
+    subprocess.run(pytest, capture_output=True, cwd=tmp_path)
+    assert (tmp_path / "modules.txt").read_text().split() == ["True", "True", "False", "True"]
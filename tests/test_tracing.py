@@ -0,0 +1,60 @@
+from pytest_grader.tracing import Tracer, index_functions
+
+SOURCE = '''import functools
+
+def square(x):
+    return x * x
+
+@functools.lru_cache
+def cube(x):
+    return x * square(x)
+
+class Shape:
+    sides = 4
+
+    def area(self):
+        def helper():
+            return square(self.sides)
+        return helper()
+'''
+
+
+def test_index_functions(tmp_path):
+    """Test that functions are hashed by AST and named by qualified name."""
+    path = tmp_path / "shapes.py"
+    path.write_text(SOURCE)
+    hashes, lines = index_functions(str(path))
+    names = {name.split(":")[1] for name in hashes}
+    assert names == {"square", "cube", "Shape.area", "Shape.area.helper", "<module>"}
+    assert lines[3] == f"{path}:square"
+    assert lines[6] == f"{path}:cube"  # The code object starts at the decorator
+
+    # Comments and blank lines don't change the hash of a function, but its body does.
+    path.write_text(SOURCE.replace("def square(x):\n", "\n# Square x\ndef square(x):\n"))
+    moved, _ = index_functions(str(path))
+    assert moved == hashes
+    path.write_text(SOURCE.replace("x * x", "x ** 2"))
+    changed, _ = index_functions(str(path))
+    assert {name for name in hashes if hashes[name] != changed[name]} == {f"{path}:square"}
+
+    # Code outside of functions, such as a class attribute, is part of <module>
+    path.write_text(SOURCE.replace("sides = 4", "sides = 5"))
+    changed, _ = index_functions(str(path))
+    assert {name for name in hashes if hashes[name] != changed[name]} == {f"{path}:<module>"}
+
+
+def test_tracer(tmp_path):
+    """Test that the tracer records which indexed functions ran."""
+    path = tmp_path / "shapes.py"
+    path.write_text(SOURCE)
+    namespace = {}
+    exec(compile(SOURCE, str(path), "exec"), namespace)
+    _, lines = index_functions(str(path))
+
+    tracer = Tracer({str(path): lines})
+    tracer.start()
+    namespace["Shape"]().area()
+    executed = tracer.stop()
+    if executed is None:
+        return  # Another trace function (e.g. from coverage) is active
+    assert {name.split(":")[1] for name in executed} == {"Shape.area", "Shape.area.helper", "square"}
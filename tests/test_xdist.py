@@ -0,0 +1,69 @@
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("xdist")
+
+TESTS = '''
+import time
+from pytest_grader import points
+
+@points(1)
+def test_slow_pass():
+    time.sleep(0.5)
+
+@points(2)
+def test_fail():
+    assert False
+
+@points(3)
+def test_pass():
+    pass
+
+@points(4)
+def test_another_pass():
+    pass
+'''
+
+
+def run_pytest(tmp_path, *args):
+    return subprocess.run([sys.executable, "-m", "pytest", "test_scored.py", "--score",
+                           "-p", "pytest_grader.plugins", *args],
+                          capture_output=True, text=True, cwd=tmp_path)
+
+
+def score_report(output):
+    """The lines of the score report in pytest's output."""
+    lines = output.splitlines()
+    start = next(i for i, line in enumerate(lines) if line.startswith('═'))
+    end = next(i for i, line in enumerate(lines) if 'Total Score' in line)
+    return lines[start:end + 1]
+
+
+def test_parallel_score_matches_serial(tmp_path):
+    """Test that a run under pytest-xdist reports the same score as a serial run."""
+    (tmp_path / "test_scored.py").write_text(TESTS)
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - test_scored.py\n')
+
+    serial = run_pytest(tmp_path)
+    parallel = run_pytest(tmp_path, "-n", "2")
+    assert "Total Score: 8/10" in serial.stdout, serial.stdout
+    assert score_report(parallel.stdout) == score_report(serial.stdout), parallel.stdout
+
+    # The controller logs every test from both runs, in the snapshot it took.
+    conn = sqlite3.connect(tmp_path / "grader.sqlite")
+    rows = conn.execute("SELECT snapshot_id, COUNT(*) FROM test_cases GROUP BY snapshot_id").fetchall()
+    assert rows == [(1, 4), (2, 4)]
+    conn.close()
+
+
+def test_parallel_unlock_refused(tmp_path):
+    """Test that unlocking is refused under pytest-xdist, since workers cannot prompt."""
+    (tmp_path / "test_scored.py").write_text(TESTS)
+    (tmp_path / "grader.yaml").write_text('included_files:\n  - test_scored.py\n')
+
+    result = run_pytest(tmp_path, "-n", "2", "--unlock")
+    assert result.returncode != 0
+    assert "--unlock cannot be used with pytest-xdist" in result.stderr